@@ -0,0 +1,113 @@
+"""Compare the scandir scanner against the original rglob-based scan.
+
+Builds a synthetic workspace (by default 500k files, a fifth of them under
+ignored directories such as node_modules and .git) and times both
+implementations on it.
+
+    python benchmarks/bench_file_scan.py --files 500000 --workers 1 8 32
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+from feature_implementer_core.config import Config
+from feature_implementer_core.file_utils import (
+    FileTree,
+    compute_dir_totals,
+    scan_directory_index,
+)
+
+
+def build_workspace(root: Path, total_files: int, files_per_dir: int) -> None:
+    """Create a synthetic source tree with a share of files in ignored directories."""
+    ignored_files = total_files // 5
+    source_files = total_files - ignored_files
+
+    def populate(base: Path, count: int) -> None:
+        dir_count = max(1, count // files_per_dir)
+        for d in range(dir_count):
+            # Three levels deep: pkgNN/modNN/subNNNN
+            directory = base / f"pkg{d % 50:02d}" / f"mod{d % 7:02d}" / f"sub{d:05d}"
+            directory.mkdir(parents=True, exist_ok=True)
+            for f in range(min(files_per_dir, count - d * files_per_dir)):
+                (directory / f"file_{f:03d}.py").touch()
+
+    populate(root / "src", source_files)
+    populate(root / "node_modules", ignored_files // 2)
+    populate(root / ".git" / "objects", ignored_files - ignored_files // 2)
+
+
+def rglob_scan(start_path: Path) -> Dict[str, Any]:
+    """The original get_file_tree scan loop, kept here as the baseline."""
+    dir_tree: Dict[str, Any] = {}
+    for item in sorted(start_path.rglob("*")):
+        if item.name in Config.IGNORE_PATTERNS:
+            continue
+        if any(part in Config.IGNORE_PATTERNS for part in item.parts):
+            continue
+        if item.is_file():
+            relative_path = item.relative_to(start_path)
+            current_level = dir_tree
+            parts = list(relative_path.parts)
+            for i, part in enumerate(parts):
+                if i == len(parts) - 1:
+                    current_level[part] = (start_path / relative_path).as_posix()
+                else:
+                    current_level = current_level.setdefault(part, {})
+    return dir_tree
+
+
+def scandir_scan(start_path: Path, workers: int) -> Dict[str, Any]:
+    """Index with the scandir scanner, then build the same nested tree."""
+    dir_index = scan_directory_index(start_path, max_workers=workers)
+    root = start_path.as_posix()
+    tree = FileTree({root: root}, {}, dir_index, compute_dir_totals(dir_index))
+    return tree.to_dict(root)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500_000)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--skip-rglob", action="store_true", help="Only time the scandir scanner"
+    )
+    parser.add_argument(
+        "--dir", type=Path, default=None, help="Reuse an existing workspace"
+    )
+    args = parser.parse_args()
+
+    root = args.dir or Path(tempfile.mkdtemp(prefix="fi-bench-"))
+    try:
+        if args.dir is None:
+            start = time.perf_counter()
+            build_workspace(root, args.files, args.files_per_dir)
+            print(
+                f"Built {args.files} files in {time.perf_counter() - start:.1f}s at {root}"
+            )
+
+        reference = None
+        if not args.skip_rglob:
+            start = time.perf_counter()
+            reference = rglob_scan(root)
+            print(f"rglob (original):       {time.perf_counter() - start:7.2f}s")
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            tree = scandir_scan(root, workers)
+            elapsed = time.perf_counter() - start
+            print(f"scandir, {workers:>2} workers:    {elapsed:7.2f}s")
+            if reference is not None and tree != reference:
+                print("  WARNING: tree differs from the rglob result")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
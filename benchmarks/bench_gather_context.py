@@ -0,0 +1,84 @@
+"""Compare serial and concurrent context gathering.
+
+Writes a set of source files and times gather_context reading them with one
+worker (the original serial loop) and with a thread pool. A slow filesystem
+such as NFS is simulated by adding a fixed latency to every file read;
+point --dir at files on a real network mount to measure it directly.
+
+    python benchmarks/bench_gather_context.py --files 200 --latency-ms 0 5 --workers 1 8 32
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from feature_implementer_core import prompt_generator
+
+
+def build_files(root: Path, count: int, size: int) -> List[Path]:
+    """Create count source files of roughly size bytes."""
+    line = "def handler(request):  # synthetic context line\n"
+    body = line * max(1, size // len(line))
+    paths = []
+    for i in range(count):
+        path = root / f"pkg{i % 10}" / f"module_{i:04d}.py"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(body)
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=8192, help="Bytes per file")
+    parser.add_argument("--latency-ms", type=float, nargs="+", default=[0.0, 5.0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--dir", type=Path, default=None, help="Gather existing files under this dir"
+    )
+    args = parser.parse_args()
+
+    root = args.dir or Path(tempfile.mkdtemp(prefix="fi-bench-"))
+    read_file_content = prompt_generator.read_file_content
+    try:
+        if args.dir is None:
+            paths = build_files(root, args.files, args.size)
+        else:
+            paths = sorted(p for p in root.rglob("*.py") if p.is_file())[: args.files]
+        print(f"{len(paths)} files under {root}")
+
+        print(f"{'latency':>9} {'workers':>8} {'time':>10} {'speedup':>8}")
+        for latency_ms in args.latency_ms:
+
+            def slow_read(file_path, latency=latency_ms / 1000):
+                time.sleep(latency)
+                return read_file_content(file_path)
+
+            prompt_generator.read_file_content = slow_read
+            baseline = None
+            expected = None
+            for workers in args.workers:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    context = prompt_generator.gather_context(paths, workers)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                baseline = baseline or elapsed
+                expected = expected or context
+                note = "" if context == expected else "  WARNING: output differs"
+                print(
+                    f"{latency_ms:7.1f}ms {workers:8} {elapsed * 1000:8.1f}ms "
+                    f"{baseline / elapsed:7.1f}x{note}"
+                )
+    finally:
+        prompt_generator.read_file_content = read_file_content
+        if args.dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Time path searches on the trigram index against the original linear scan.
+
+Builds synthetic directory listings in memory (no files are written), so
+large workspaces are cheap to simulate:
+
+    python benchmarks/bench_path_search.py --files 500000
+"""
+
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+from feature_implementer_core.path_search import PathSearchIndex
+
+BASE = "/workspace"
+WORDS = [
+    "api", "auth", "cache", "client", "config", "core", "db", "events", "file",
+    "handler", "http", "index", "io", "jobs", "menu", "model", "parser", "prompt",
+    "render", "router", "schema", "search", "server", "store", "template", "utils",
+    "view", "widget", "worker", "tree",
+]  # fmt: skip
+EXTENSIONS = [".py", ".ts", ".tsx", ".js", ".md", ".json", ".css"]
+QUERIES = [
+    "file_utils",
+    "menu/index",
+    "router",
+    "src/pkg07",
+    "schema.json",
+    "flutl",
+    "zz_no_match",
+]
+
+
+def build_directories(total_files: int, files_per_dir: int) -> Dict[str, List[str]]:
+    """Create directory listings shaped like a source tree."""
+    rng = random.Random(7)
+    directories: Dict[str, List[str]] = {}
+    for d in range(max(1, total_files // files_per_dir)):
+        dir_path = f"{BASE}/src/pkg{d % 40:02d}/{rng.choice(WORDS)}_{d % 13}/mod{d:05d}"
+        directories[dir_path] = sorted(
+            {
+                f"{rng.choice(WORDS)}_{rng.choice(WORDS)}{rng.choice(EXTENSIONS)}"
+                for _ in range(files_per_dir)
+            }
+        )
+    return directories
+
+
+def linear_search(
+    directories: Dict[str, List[str]], query: str, limit: int
+) -> Tuple[List[str], int]:
+    """The original search_file_paths loop, kept here as the baseline."""
+    query = query.strip().lower()
+    parts = [part for part in query.split("/") if part.strip()]
+    results = []
+    total = 0
+    for dir_path, names in sorted(directories.items()):
+        for name in names:
+            relative = f"{dir_path}/{name}"[len(BASE) + 1 :]
+            lowered = relative.lower()
+            matched = query in lowered
+            if not matched and len(parts) > 1:
+                position = -1
+                matched = True
+                for part in parts:
+                    position = lowered.find(part, position + 1)
+                    if position == -1:
+                        matched = False
+                        break
+            if matched:
+                total += 1
+                if len(results) < limit:
+                    results.append(relative)
+    return results, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500_000)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    directories = build_directories(args.files, args.files_per_dir)
+    file_count = sum(len(names) for names in directories.values())
+    print(f"{file_count} files in {len(directories)} directories")
+
+    index = PathSearchIndex()
+    start = time.perf_counter()
+    index.rebuild(directories.items(), BASE)
+    print(f"index build: {time.perf_counter() - start:.2f}s")
+
+    print(f"{'query':<14} {'linear':>9} {'index':>9} {'matches':>8}")
+    for query in QUERIES:
+        start = time.perf_counter()
+        _, linear_total = linear_search(directories, query, args.limit)
+        linear = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            _, total = index.search(query, args.limit)
+        indexed = (time.perf_counter() - start) / args.repeat
+        note = "" if total >= linear_total else "  WARNING: fewer matches than linear"
+        print(
+            f"{query:<14} {linear * 1000:7.1f}ms {indexed * 1000:7.1f}ms {total:8}{note}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare peak memory of building a prompt in memory and streaming it.
+
+Writes context files into a temporary directory, then measures with
+tracemalloc saving a prompt built by generate_prompt against saving the
+chunks of generate_prompt_chunks as they come. The file content and prompt
+caches are disabled so that only the prompt itself is measured.
+
+    python benchmarks/bench_prompt_stream.py --files 20 --size-mb 2.5
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+from feature_implementer_core import database
+from feature_implementer_core.config import load_default_template_content
+from feature_implementer_core.file_utils import file_content_cache, save_prompt_to_file
+from feature_implementer_core.prompt_generator import (
+    generate_prompt,
+    generate_prompt_chunks,
+    prompt_cache,
+)
+
+
+def measure(run: Callable[[], None]) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    print(f"  {elapsed:6.2f}s, peak {peak / 1024 / 1024:7.1f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size-mb", type=float, default=2.5)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="fi-bench-"))
+    try:
+        db_path = root / "bench.db"
+        database.initialize_database(db_path)
+        _, template_id = database.add_template(
+            db_path, "bench", load_default_template_content(), is_default=True
+        )
+        line = "value = compute(value)  # synthetic context line\n"
+        body = line * int(args.size_mb * 1024 * 1024 / len(line))
+        paths = []
+        for i in range(args.files):
+            path = root / f"module_{i:03d}.py"
+            path.write_text(body)
+            paths.append(path)
+        print(f"{args.files} files of {args.size_mb} MB")
+        file_content_cache.max_bytes = 0
+        prompt_cache.max_bytes = 0
+
+        print("generate_prompt, then save:")
+        measure(
+            lambda: save_prompt_to_file(
+                generate_prompt(db_path, template_id, context_files=paths),
+                root / "prompt.md",
+            )
+        )
+        print("generate_prompt_chunks, saved as generated:")
+        measure(
+            lambda: save_prompt_to_file(
+                generate_prompt_chunks(db_path, template_id, context_files=paths),
+                root / "prompt.md",
+            )
+        )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measure prompt rendering time as the number of template placeholders grows.
+
+Builds templates with N placeholders, each in its own optional section with
+every other one left empty, plus a large code context. Renders them with a
+compiled template plan and with the per-placeholder approach generate_prompt
+used to take: one regex pass per empty section and one str.replace per
+placeholder over the whole prompt, context included.
+
+    python benchmarks/bench_template_render.py --placeholders 3 30 300 --context-mb 2
+"""
+
+import argparse
+import re
+import time
+from typing import Dict
+
+from feature_implementer_core.template_engine import compile_template
+
+
+def build_template(count: int) -> str:
+    sections = [
+        f"{{?field_{i}}}\n## FIELD {i}\n\n{{field_{i}}}\n\n{{/field_{i}}}\n"
+        for i in range(count)
+    ]
+    return (
+        "# Prompt\n\n## RELEVANT CODE CONTEXT\n\n```\n{relevant_code_context}\n```\n\n"
+        + "".join(sections)
+        + "## TASK\n\nImplement it.\n"
+    )
+
+
+def build_values(count: int, context: str) -> Dict[str, str]:
+    values = {f"field_{i}": f"value {i}" for i in range(0, count, 2)}
+    values["relevant_code_context"] = context
+    return values
+
+
+def render_naive(template: str, values: Dict[str, str]) -> str:
+    names = set(re.findall(r"\{\?([A-Za-z_][A-Za-z0-9_]*)\}", template))
+    for name in names:
+        if values.get(name, "").strip():
+            template = re.sub(rf"^\{{[?/]{name}\}}\n", "", template, flags=re.M)
+        else:
+            template = re.sub(
+                rf"^\{{\?{name}\}}\n.*?^\{{/{name}\}}\n",
+                "",
+                template,
+                flags=re.M | re.S,
+            )
+    template = re.sub(r"\n{3,}", "\n\n", template)
+    for name, value in values.items():
+        template = template.replace("{" + name + "}", value)
+    return template
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--placeholders", type=int, nargs="+", default=[3, 30, 300, 3000]
+    )
+    parser.add_argument("--context-mb", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    line = "def handler(request):  # {not_a_placeholder} in code\n"
+    context = line * int(args.context_mb * 1024 * 1024 / len(line))
+    print(f"Context: {len(context) / 1024 / 1024:.1f} MB")
+    print(
+        f"{'placeholders':>12} {'compile ms':>11} {'compiled ms':>12} {'naive ms':>10}"
+    )
+    for count in args.placeholders:
+        template = build_template(count)
+        values = build_values(count, context)
+
+        start = time.perf_counter()
+        compiled = compile_template(template)
+        compile_ms = (time.perf_counter() - start) * 1000
+        compiled.render(values)  # Resolve the plan for this set of values
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            rendered = compiled.render(values)
+        compiled_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            expected = render_naive(template, values)
+        naive_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        if rendered != expected:
+            raise SystemExit(f"Renderings differ with {count} placeholders")
+        print(f"{count:12} {compile_ms:11.2f} {compiled_ms:12.2f} {naive_ms:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
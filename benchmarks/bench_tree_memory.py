@@ -0,0 +1,108 @@
+"""Compare the memory held by the file tree representations.
+
+Builds a synthetic workspace (see bench_file_scan.py), scans it once and
+measures with tracemalloc:
+
+- the nested dict tree previously cached by get_file_tree, with the
+  absolute path of every file as its leaves
+- the per-directory index as it was stored before (a (size, mtime) tuple
+  per file, names not interned)
+- the current index (interned names, flat stat arrays) plus the rolled-up
+  directory totals, which is all the FileTree view needs
+
+    python benchmarks/bench_tree_memory.py --files 200000
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Tuple
+
+from bench_file_scan import build_workspace
+from feature_implementer_core.file_utils import (
+    FileTree,
+    compute_dir_totals,
+    scan_directory_index,
+)
+
+
+def measure(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """Return the result of build and the bytes it still holds."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def copy_str(text: str) -> str:
+    """Return an equal but separate string object, as a fresh listing would."""
+    return text.encode().decode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument(
+        "--dir", type=Path, default=None, help="Reuse an existing workspace"
+    )
+    args = parser.parse_args()
+
+    root = args.dir or Path(tempfile.mkdtemp(prefix="fi-bench-"))
+    try:
+        if args.dir is None:
+            start = time.perf_counter()
+            build_workspace(root, args.files, args.files_per_dir)
+            print(
+                f"Built {args.files} files in {time.perf_counter() - start:.1f}s at {root}"
+            )
+
+        root_path = root.as_posix()
+
+        def scan() -> Tuple[Any, Any]:
+            dir_index = scan_directory_index(root, max_workers=1)
+            return dir_index, compute_dir_totals(dir_index)
+
+        (dir_index, dir_totals), current_bytes = measure(scan)
+        file_count = sum(len(snapshot.files) for snapshot in dir_index.values())
+        tree = FileTree({root_path: root_path}, {}, dir_index, dir_totals)
+
+        _, nested_bytes = measure(lambda: tree.to_dict(root_path))
+        _, old_index_bytes = measure(
+            lambda: {
+                copy_str(dir_path): (
+                    snapshot.mtime_ns,
+                    tuple(copy_str(name) for name in snapshot.files),
+                    tuple(copy_str(name) for name in snapshot.subdirs),
+                    tuple(
+                        (size, mtime_ns) for _, size, mtime_ns in snapshot.iter_files()
+                    ),
+                )
+                for dir_path, snapshot in dir_index.items()
+            }
+        )
+
+        def report(label: str, size: int) -> None:
+            print(
+                f"{label:<38} {size / 1024 / 1024:8.1f} MB "
+                f"{size / max(file_count, 1):7.0f} B/file"
+            )
+
+        print(f"{file_count} files in {len(dir_index)} directories")
+        report("nested dict tree (before)", nested_bytes)
+        report("index, tuples per file (before)", old_index_bytes)
+        report("before, total", nested_bytes + old_index_bytes)
+        report("index + totals (FileTree view, now)", current_bytes)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
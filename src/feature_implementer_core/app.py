@@ -24,8 +24,29 @@ from .config import (
     load_default_template_content,
 )
 from . import database
-from .file_utils import get_file_tree, read_file_content
-from .prompt_generator import generate_prompt
+from .file_utils import (
+    file_content_cache,
+    file_tree_cache,
+    get_file_metadata,
+    get_files_metadata,
+    get_file_symbols,
+    get_file_tree,
+    get_top_level_listings,
+    list_directory_children,
+    read_file_content,
+    search_file_paths,
+    warm_path_search_index,
+)
+from .file_watcher import ensure_file_watcher, initialize_file_tree
+from .batch import parse_manifest, run_batch
+from .compaction import Compaction
+from .git_diff import DiffContext, GitDiffError
+from .import_graph import ImportExpansion
+from .prompt_generator import TokenBudget, generate_prompt_chunks, prompt_cache
+from .symbol_index import symbol_index
+from .template_cache import template_cache
+from .template_engine import TemplateSyntaxError, compile_template, compiled_templates
+from .tokenizer import count_tokens, token_count_cache, warm_tokenizer
 
 
 def load_prompt_templates_from_dir():
@@ -62,7 +83,7 @@ def load_prompt_templates_from_dir():
 
     try:
         # Get existing template names to avoid duplicates
-        existing_templates = database.get_templates(db_path)
+        existing_templates = template_cache.get_templates(db_path)
         existing_names = {template["name"] for template in existing_templates}
 
         # Also check file-based templates that were previously loaded
@@ -226,26 +247,63 @@ def create_app():
         )
 
     # --- App startup tasks (moved from Config) ---
-    # Pre-populate the file tree cache on startup
+    # Pre-populate the file tree cache on startup. A file index persisted by a
+    # previous run is served right away; only the first start pays for a full
+    # scan. No thread is started here: with --prod this runs in the gunicorn
+    # master, which forks the workers afterwards. Directories changed since
+    # the index was saved are revalidated by the watcher (see below).
     try:
-        logger.info("Performing initial file tree scan...")
-        get_file_tree(Config.SCAN_DIRS, force_rescan=True)
-        logger.info("Initial file tree scan complete and cached.")
+        initialize_file_tree()
     except Exception as e:
         logger.error(f"ERROR: Initial file tree scan failed: {e}", exc_info=True)
 
+    # Process whose caches were warmed by _ensure_file_watcher
+    warmed_pid: Optional[int] = None
+
+    # Start watching after the first request rather than here, so the watcher
+    # thread runs in each gunicorn worker and not only in the forking master.
+    @app.before_request
+    def _ensure_file_watcher() -> None:
+        nonlocal warmed_pid
+        try:
+            ensure_file_watcher()
+        except Exception as e:
+            logger.error(f"Could not start file watcher: {e}", exc_info=True)
+        if warmed_pid != os.getpid():
+            warmed_pid = os.getpid()
+            # Per worker as well: the index is built in a background thread
+            warm_path_search_index()
+            # Load the token encoding before the first prompt needs it
+            warm_tokenizer()
+
     # --- Routes ---
     # Helper to get DB path easily in routes
     def _db_path() -> Path:
         return get_app_db_path()
 
+    # Form fields holding the values of a template's own placeholders
+    template_value_prefix = "template_value."
+
+    def _with_placeholders(templates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Lets the form offer a field for each of a template's own placeholders
+        for template in templates:
+            try:
+                compiled = compiled_templates.get(
+                    template["id"], template.get("content") or ""
+                )
+                template["placeholders"] = list(compiled.custom_names)
+            except TemplateSyntaxError:
+                template["placeholders"] = []
+        return templates
+
     @app.route("/", methods=["GET"])
     def index() -> str:
         """Render the main application page."""
         logger.debug("Rendering index page")
         db_path = _db_path()
         try:
-            file_tree = get_file_tree(Config.SCAN_DIRS)
+            # Only the top level is rendered; folders load their children on demand
+            file_tree = get_top_level_listings(Config.SCAN_DIRS)
 
             # Get presets from DB
             presets = database.get_presets(db_path)
@@ -263,14 +321,14 @@ def create_app():
             presets_json = json.dumps(formatted_presets)
 
             # Get available templates from DB
-            templates = database.get_templates(db_path)
-            default_template_id = database.get_default_template_id(db_path)
+            templates = _with_placeholders(template_cache.get_templates(db_path))
+            default_template_id = template_cache.get_default_template_id(db_path)
             templates_json = json.dumps(templates)
 
             # Get default template content preview
             template_preview = "Default template not configured or found."
             if default_template_id:
-                default_template_data = database.get_template_by_id(
+                default_template_data = template_cache.get_template_by_id(
                     db_path, default_template_id
                 )
                 if default_template_data and default_template_data.get("content"):
@@ -307,6 +365,7 @@ def create_app():
                 default_template_id=default_template_id,
                 app_version=app_version,
                 host_info=host_info,
+                diff_context_lines=Config.DIFF_CONTEXT_LINES,
             )
         except Exception as e:
             logger.error(f"Error rendering index page: {e}", exc_info=True)
@@ -324,6 +383,7 @@ def create_app():
                 default_template_id=None,
                 app_version="Unknown",
                 host_info="Unknown",
+                diff_context_lines=Config.DIFF_CONTEXT_LINES,
             )
 
     @app.route("/generate", methods=["POST"])
@@ -342,7 +402,7 @@ def create_app():
                 template_id = int(template_id_str)
             else:
                 # Fallback to default template ID from DB
-                template_id = database.get_default_template_id(db_path)
+                template_id = template_cache.get_default_template_id(db_path)
                 if not template_id:
                     logger.error(
                         "Generate failed: No template ID provided and no default template set in DB."
@@ -363,22 +423,90 @@ def create_app():
                     400,
                 )
 
+            # Optional token budget to pack the context files into
+            model = request.form.get("model", "").strip() or None
+            budget: Optional[TokenBudget] = None
+            token_budget_str = request.form.get("token_budget", "").strip()
+            if token_budget_str:
+                try:
+                    budget = TokenBudget(
+                        int(token_budget_str),
+                        model=model,
+                        overflow=request.form.get("overflow_policy", "truncate"),
+                    )
+                except ValueError as e:
+                    logger.warning(f"Invalid token budget settings: {e}")
+                    return jsonify({"error": f"Invalid token budget: {e}"}), 400
+
+            # Optionally add the files the selected Python files import
+            imports: Optional[ImportExpansion] = None
+            import_depth_str = request.form.get("import_depth", "").strip()
+            if import_depth_str and import_depth_str != "0":
+                try:
+                    import_budget_str = request.form.get(
+                        "import_token_budget", ""
+                    ).strip()
+                    imports = ImportExpansion(
+                        int(import_depth_str),
+                        int(import_budget_str) if import_budget_str else None,
+                    )
+                except ValueError as e:
+                    logger.warning(f"Invalid import expansion settings: {e}")
+                    return jsonify({"error": f"Invalid import expansion: {e}"}), 400
+
+            # Compaction strategies checked in the form
+            compaction: Optional[Compaction] = None
+            strategies = request.form.getlist("compaction")
+            if strategies:
+                try:
+                    compaction = Compaction(strategies)
+                except ValueError as e:
+                    logger.warning(f"Invalid compaction settings: {e}")
+                    return jsonify({"error": f"Invalid compaction: {e}"}), 400
+
+            # Optionally include only the changes against a git ref
+            diff: Optional[DiffContext] = None
+            diff_base = request.form.get("diff_base", "").strip()
+            if diff_base:
+                try:
+                    context_lines_str = request.form.get(
+                        "diff_context_lines", ""
+                    ).strip()
+                    diff = DiffContext(
+                        diff_base,
+                        int(context_lines_str) if context_lines_str else None,
+                    )
+                except ValueError as e:
+                    logger.warning(f"Invalid diff settings: {e}")
+                    return jsonify({"error": f"Invalid diff settings: {e}"}), 400
+
+            template_values = {
+                key[len(template_value_prefix) :]: value
+                for key, value in request.form.items()
+                if key.startswith(template_value_prefix)
+            }
+
             logger.info(
                 f"Files selected ({len(selected_files)}), generating prompt using template ID: {template_id}..."
             )
 
             # Generate prompt using template ID (guaranteed to have one here)
-            final_prompt = generate_prompt(
+            prompt_chunks = generate_prompt_chunks(
                 db_path=db_path,
                 template_id=template_id,
                 context_files=selected_files,
                 jira_description=jira_desc,
                 additional_instructions=instructions,
+                budget=budget,
+                imports=imports,
+                compaction=compaction,
+                template_values=template_values,
+                diff=diff,
             )
 
             if (
-                final_prompt is None
-            ):  # Check if generate_prompt indicated an error (e.g., template not found)
+                prompt_chunks is None
+            ):  # Check if generation indicated an error (e.g., template not found)
                 logger.error(
                     f"Prompt generation failed for template ID {template_id}. Check logs for details."
                 )
@@ -391,25 +519,74 @@ def create_app():
                     500,
                 )
 
+            stream = request.values.get("stream") == "1"
+            # The fingerprint of the prompt's inputs identifies the prompt;
+            # the streamed and JSON responses are different representations
+            etag = prompt_chunks.fingerprint
+            if etag is not None and stream:
+                etag += "-text"
+            if etag is not None and request.if_none_match.contains(etag):
+                prompt_chunks.close()
+                logger.info("Prompt unchanged since the client's copy, returning 304.")
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            if stream:
+                # Send the prompt as plain text while it is generated, one
+                # context file at a time, instead of building it in memory
+                logger.info("Streaming prompt as a chunked response.")
+                response = Response(prompt_chunks, mimetype="text/plain")
+                if etag is not None:
+                    response.set_etag(etag)
+                if budget is not None and budget.report is not None:
+                    # Packing is done before streaming starts
+                    response.headers["X-Context-Report"] = json.dumps(
+                        budget.report, separators=(",", ":")
+                    )
+                if imports is not None and imports.report is not None:
+                    response.headers["X-Import-Report"] = json.dumps(
+                        imports.report, separators=(",", ":")
+                    )
+                if diff is not None and diff.report is not None:
+                    response.headers["X-Diff-Report"] = json.dumps(
+                        diff.report, separators=(",", ":")
+                    )
+                return response
+
+            final_prompt = "".join(prompt_chunks)
             char_count = len(final_prompt)
-            # TODO: Implement more accurate token estimation using tiktoken if needed
-            token_estimate = char_count // 4  # Rough estimate
+            token_count = count_tokens(final_prompt, model)
+            # Rough estimate if the tiktoken encoding is unavailable
+            token_estimate = token_count if token_count is not None else char_count // 4
 
             logger.info(
                 f"Prompt generated ({char_count} chars, ~{token_estimate} tokens), returning JSON."
             )
 
-            return jsonify(
-                {
-                    "prompt": final_prompt,
-                    "char_count": char_count,
-                    "token_estimate": token_estimate,
-                }
-            )
+            result = {
+                "prompt": final_prompt,
+                "char_count": char_count,
+                "token_estimate": token_estimate,
+                "tokens_estimated": token_count is None,
+            }
+            if budget is not None:
+                result["context_report"] = budget.report
+            if imports is not None:
+                result["import_report"] = imports.report
+            if diff is not None:
+                result["diff_report"] = diff.report
+            response = jsonify(result)
+            if etag is not None:
+                response.set_etag(etag)
+            return response
         # Catch specific errors if generate_prompt raises them
         except FileNotFoundError as e:
             logger.error(f"File not found during prompt generation: {e}", exc_info=True)
             return jsonify({"error": f"Context file not found: {e}"}), 404
+        except GitDiffError as e:
+            logger.warning(f"Could not diff the context files: {e}")
+            return jsonify({"error": f"Could not diff the context files: {e}"}), 400
         except ValueError as e:
             logger.error(f"Value error during prompt generation: {e}", exc_info=True)
             return (
@@ -422,6 +599,61 @@ def create_app():
             )
             return jsonify({"error": f"An unexpected server error occurred: {e}"}), 500
 
+    @app.route("/generate/batch", methods=["POST"])
+    def handle_generate_batch() -> Response:
+        """Generate the prompts of a JSONL manifest of jobs.
+
+        The manifest is uploaded as the file "manifest", sent as the form
+        field "manifest", or sent as the request body. Outputs are written
+        under the outputs directory; jobs without one return their prompt.
+        """
+        logger.info("--- Handling /generate/batch POST request ---")
+        db_path = _db_path()
+        try:
+            upload = request.files.get("manifest")
+            if upload is not None:
+                manifest = upload.read().decode("utf-8")
+            else:
+                manifest = request.form.get("manifest") or request.get_data(
+                    as_text=True
+                )
+            try:
+                jobs = parse_manifest(manifest.splitlines())
+            except ValueError as e:
+                return jsonify({"error": f"Invalid manifest: {e}"}), 400
+            if not jobs:
+                return jsonify({"error": "The manifest has no jobs."}), 400
+            if len(jobs) > Config.BATCH_MAX_JOBS:
+                return (
+                    jsonify(
+                        {
+                            "error": f"Too many jobs ({len(jobs)}), at most {Config.BATCH_MAX_JOBS} per request."
+                        }
+                    ),
+                    400,
+                )
+
+            compaction: Optional[Compaction] = None
+            strategies = request.form.getlist("compaction")
+            if strategies:
+                try:
+                    compaction = Compaction(strategies)
+                except ValueError as e:
+                    return jsonify({"error": f"Invalid compaction: {e}"}), 400
+
+            try:
+                report = run_batch(
+                    jobs, db_path, compaction, output_root=Config.DEFAULT_OUTPUT_DIR
+                )
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify(report)
+        except UnicodeDecodeError:
+            return jsonify({"error": "The manifest must be UTF-8 text."}), 400
+        except Exception as e:
+            logger.error(f"Error generating batch prompts: {e}", exc_info=True)
+            return jsonify({"error": "Server error generating batch prompts"}), 500
+
     @app.route("/get_file_content", methods=["GET"])
     def get_file_content() -> Response:
         """Get content of a file with strict path validation."""
@@ -594,14 +826,14 @@ def create_app():
 
     @app.route("/refresh_file_tree", methods=["GET"])
     def refresh_file_tree() -> Response:
-        """Rescan the file tree and return the rendered HTML fragment."""
+        """Rescan the file tree and return the rendered top-level HTML fragment."""
         logger.info("--- Handling /refresh_file_tree GET request ---")
         try:
-            file_tree = get_file_tree(Config.SCAN_DIRS, force_rescan=True)
-            # Assuming 'macros.html' has a render_file_tree macro
-            macro_import = "{% from 'macros.html' import render_file_tree %}"
+            get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+            file_tree = get_top_level_listings(Config.SCAN_DIRS)
+            macro_import = "{% from 'macros.html' import render_root_folders %}"
             rendered_html = render_template_string(
-                f"{macro_import}{{{{ render_file_tree(file_tree, 0) }}}}",
+                f"{macro_import}{{{{ render_root_folders(file_tree) }}}}",
                 file_tree=file_tree,
             )
             logger.info("File tree refreshed and HTML fragment generated.")
@@ -610,6 +842,121 @@ def create_app():
             logger.error(f"Error refreshing file tree: {e}", exc_info=True)
             return jsonify({"error": "Error refreshing file tree"}), 500
 
+    @app.route("/file_tree/children", methods=["GET"])
+    def get_directory_children() -> Response:
+        """Return one page of a folder's children for the file explorer."""
+        dir_path = request.args.get("path")
+        if not dir_path:
+            return jsonify({"error": "No directory path provided"}), 400
+        try:
+            offset = max(0, int(request.args.get("offset", 0)))
+            limit = min(
+                max(1, int(request.args.get("limit", Config.FILE_TREE_PAGE_SIZE))),
+                Config.FILE_TREE_PAGE_SIZE * 5,
+            )
+        except ValueError:
+            return jsonify({"error": "offset and limit must be integers"}), 400
+
+        try:
+            listing = list_directory_children(dir_path, offset, limit)
+            if listing is None:
+                return jsonify({"error": f"Directory not found: {dir_path}"}), 404
+            return jsonify(listing)
+        except Exception as e:
+            logger.error(f"Error listing directory {dir_path}: {e}", exc_info=True)
+            return jsonify({"error": "Server error listing directory"}), 500
+
+    @app.route("/file_tree/metadata", methods=["GET"])
+    def get_file_tree_metadata() -> Response:
+        """Return a file's size and exact token count, counting it if needed."""
+        file_path = request.args.get("path")
+        if not file_path:
+            return jsonify({"error": "No file path provided"}), 400
+        try:
+            metadata = get_file_metadata(file_path)
+            if metadata is None:
+                return jsonify({"error": f"File not found: {file_path}"}), 404
+            return jsonify(metadata)
+        except Exception as e:
+            logger.error(f"Error reading metadata of {file_path}: {e}", exc_info=True)
+            return jsonify({"error": "Server error reading file metadata"}), 500
+
+    @app.route("/file_tree/metadata", methods=["POST"])
+    def get_file_tree_metadata_batch() -> Response:
+        """Return the metadata of several files, counting their tokens together."""
+        data = request.get_json(silent=True) or {}
+        file_paths = data.get("paths")
+        if not isinstance(file_paths, list) or not all(
+            isinstance(path, str) for path in file_paths
+        ):
+            return jsonify({"error": "Expected a JSON list of paths"}), 400
+        try:
+            return jsonify({"files": get_files_metadata(file_paths)})
+        except Exception as e:
+            logger.error(
+                f"Error reading metadata of {len(file_paths)} files: {e}", exc_info=True
+            )
+            return jsonify({"error": "Server error reading file metadata"}), 500
+
+    @app.route("/file_tree/symbols", methods=["GET"])
+    def get_file_tree_symbols() -> Response:
+        """Return the classes and functions of a Python file, to select as context."""
+        file_path = request.args.get("path")
+        if not file_path:
+            return jsonify({"error": "No file path provided"}), 400
+        try:
+            symbols = get_file_symbols(file_path)
+            if symbols is None:
+                return jsonify({"error": f"File not found: {file_path}"}), 404
+            return jsonify({"path": file_path, "symbols": symbols})
+        except Exception as e:
+            logger.error(f"Error indexing symbols of {file_path}: {e}", exc_info=True)
+            return jsonify({"error": "Server error indexing file symbols"}), 500
+
+    @app.route("/symbol_index/stats", methods=["GET"])
+    def get_symbol_index_stats() -> Response:
+        """Return symbol index cache metrics."""
+        return jsonify(symbol_index.stats())
+
+    @app.route("/file_tree/stats", methods=["GET"])
+    def get_file_tree_stats() -> Response:
+        """Return file tree scan metrics (durations, stale responses, waits)."""
+        return jsonify(file_tree_cache.stats())
+
+    @app.route("/file_content/stats", methods=["GET"])
+    def get_file_content_stats() -> Response:
+        """Return file content cache metrics (hits, misses, evictions)."""
+        return jsonify(file_content_cache.stats())
+
+    @app.route("/prompt_cache/stats", methods=["GET"])
+    def get_prompt_cache_stats() -> Response:
+        """Return generated prompt cache metrics (hits, coalesced requests)."""
+        return jsonify(prompt_cache.stats())
+
+    @app.route("/template_cache/stats", methods=["GET"])
+    def get_template_cache_stats() -> Response:
+        """Return template cache metrics (hits, revision checks, reloads)."""
+        stats = template_cache.stats()
+        stats["compiled"] = compiled_templates.stats()
+        return jsonify(stats)
+
+    @app.route("/tokenizer/stats", methods=["GET"])
+    def get_tokenizer_stats() -> Response:
+        """Return token count cache metrics and the loaded encodings."""
+        return jsonify(token_count_cache.stats())
+
+    @app.route("/file_tree/search", methods=["GET"])
+    def search_files() -> Response:
+        """Search the cached file tree by file name or path."""
+        query = request.args.get("q", "").strip()
+        if len(query) < 2:
+            return jsonify({"results": [], "total": 0})
+        try:
+            return jsonify(search_file_paths(query))
+        except Exception as e:
+            logger.error(f"Error searching files for '{query}': {e}", exc_info=True)
+            return jsonify({"error": "Server error searching files"}), 500
+
     # Removed /rescan endpoint as /refresh_file_tree provides the needed data
     # @app.route("/rescan", methods=["POST"])
     # def rescan_files() -> Response: ...
@@ -626,8 +973,8 @@ def create_app():
         logger.debug("Handling GET /templates")
         db_path = _db_path()
         try:
-            templates_data = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates_data = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
             return jsonify(
                 {"templates": templates_data, "default_template_id": default_id}
             )
@@ -641,7 +988,7 @@ def create_app():
         logger.debug(f"Handling GET /templates/{template_id}")
         db_path = _db_path()
         try:
-            template_data = database.get_template_by_id(db_path, template_id)
+            template_data = template_cache.get_template_by_id(db_path, template_id)
             if not template_data:
                 return (
                     jsonify({"error": f"Template with ID {template_id} not found"}),
@@ -683,6 +1030,10 @@ def create_app():
                     ),
                     400,
                 )
+            try:
+                compile_template(content)
+            except TemplateSyntaxError as e:
+                return jsonify({"error": f"Invalid template: {e}"}), 400
             if not isinstance(is_default, bool):
                 try:
                     is_default = bool(int(is_default))  # Allow 0 or 1
@@ -710,8 +1061,8 @@ def create_app():
                 return jsonify({"error": result}), status_code
 
             # Return updated list
-            templates_data = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates_data = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
             new_template_id = result  # result is the new ID on success
 
             return (
@@ -763,6 +1114,10 @@ def create_app():
                     ),
                     400,
                 )
+            try:
+                compile_template(content)
+            except TemplateSyntaxError as e:
+                return jsonify({"error": f"Invalid template: {e}"}), 400
             if description is not None and not isinstance(description, str):
                 return jsonify({"error": "Description must be a string"}), 400
 
@@ -789,7 +1144,9 @@ def create_app():
 
             # Fetch existing description if not provided?
             if description is None:
-                existing_template = database.get_template_by_id(db_path, template_id)
+                existing_template = template_cache.get_template_by_id(
+                    db_path, template_id
+                )
                 description = (
                     existing_template.get("description", "")
                     if existing_template
@@ -811,8 +1168,8 @@ def create_app():
                     return jsonify({"error": error or "Failed to update template"}), 500
 
             # Return updated list
-            templates_data = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates_data = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
 
             return jsonify(
                 {
@@ -845,8 +1202,8 @@ def create_app():
                     return jsonify({"error": error or "Failed to delete template"}), 500
 
             # Return updated list
-            templates_data = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates_data = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
 
             return jsonify(
                 {
@@ -880,7 +1237,7 @@ def create_app():
                     )
 
             # Return updated list
-            templates_data = database.get_templates(db_path)
+            templates_data = template_cache.get_templates(db_path)
             # The default_id should now be template_id
 
             return jsonify(
@@ -903,8 +1260,8 @@ def create_app():
         db_path = _db_path()
         try:
             # Fetch current templates and default ID
-            templates = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
             # Note: initialize_app_database should have ensured defaults exist if needed
 
             return render_template(
@@ -944,8 +1301,8 @@ def create_app():
             logger.info("Standard templates re-initialized.")
 
             # Fetch the new state
-            templates = database.get_templates(db_path)
-            default_id = database.get_default_template_id(db_path)
+            templates = template_cache.get_templates(db_path)
+            default_id = template_cache.get_default_template_id(db_path)
 
             return jsonify(
                 {
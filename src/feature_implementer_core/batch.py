@@ -0,0 +1,299 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .compaction import Compaction
+from .config import Config
+from .file_utils import (
+    file_content_cache,
+    read_file_content,
+    save_prompt_to_file,
+)
+from .prompt_generator import generate_prompt
+from .symbol_index import split_symbol_selection
+from .template_cache import template_cache
+from .tokenizer import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Keys a manifest line may have, and the BatchJob field each one sets
+MANIFEST_KEYS = {
+    "id": "job_id",
+    "jira": "jira_description",
+    "jira_description": "jira_description",
+    "instructions": "additional_instructions",
+    "additional_instructions": "additional_instructions",
+    "context_files": "context_files",
+    "template_id": "template_id",
+    "template_values": "template_values",
+    "output": "output",
+}
+
+
+class BatchJob(NamedTuple):
+    """One prompt to generate, from a line of a batch manifest."""
+
+    job_id: str
+    jira_description: str = ""
+    additional_instructions: str = ""
+    context_files: Tuple[str, ...] = ()
+    template_id: Optional[int] = None
+    template_values: Optional[Dict[str, str]] = None
+    output: Optional[str] = None
+
+
+def parse_manifest(lines: Iterable[str]) -> List[BatchJob]:
+    """Parse a JSONL manifest into jobs, one JSON object per line.
+
+    Each object can have "id" (defaults to the line number), "jira" (the
+    ticket text), "instructions", "context_files" (paths, or "path::Name"
+    selections), "template_id" (defaults to the default template),
+    "template_values" and "output" (a file to write the prompt to). Blank
+    lines are skipped.
+
+    Raises:
+        ValueError: If a line is not a valid job, naming the line
+    """
+    jobs = []
+    seen_ids = set()
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number}: invalid JSON ({e.msg})")
+        if not isinstance(entry, dict):
+            raise ValueError(f"Line {number}: expected a JSON object")
+        unknown = sorted(set(entry) - set(MANIFEST_KEYS))
+        if unknown:
+            raise ValueError(f"Line {number}: unknown keys {', '.join(unknown)}")
+        fields: Dict[str, Any] = {
+            MANIFEST_KEYS[key]: value for key, value in entry.items()
+        }
+        fields["job_id"] = str(fields.get("job_id", number))
+        files = fields.get("context_files", [])
+        if not isinstance(files, list) or not all(isinstance(f, str) for f in files):
+            raise ValueError(f"Line {number}: context_files must be a list of paths")
+        fields["context_files"] = tuple(files)
+        template_id = fields.get("template_id")
+        if template_id is not None and (
+            not isinstance(template_id, int) or isinstance(template_id, bool)
+        ):
+            raise ValueError(f"Line {number}: template_id must be an integer")
+        values = fields.get("template_values")
+        if values is not None and (
+            not isinstance(values, dict)
+            or not all(isinstance(v, str) for v in values.values())
+        ):
+            raise ValueError(f"Line {number}: template_values must map names to text")
+        for key in ("jira_description", "additional_instructions", "output"):
+            if key in fields and not isinstance(fields[key], str):
+                raise ValueError(f"Line {number}: {key} must be a string")
+        if fields["job_id"] in seen_ids:
+            raise ValueError(f"Line {number}: duplicate job id {fields['job_id']}")
+        seen_ids.add(fields["job_id"])
+        jobs.append(BatchJob(**fields))
+    return jobs
+
+
+def _render_job(
+    job: BatchJob,
+    db_path: Path,
+    compaction: Optional[Compaction],
+    output_path: Optional[Path],
+) -> Dict[str, Any]:
+    """Generate one job's prompt and write it out, timing it."""
+    start = time.perf_counter()
+    result: Dict[str, Any] = {
+        "id": job.job_id,
+        "template_id": job.template_id,
+        "output": str(output_path) if output_path else None,
+        "context_files": len(job.context_files),
+    }
+    try:
+        prompt = generate_prompt(
+            db_path,
+            job.template_id,
+            context_files=list(job.context_files),
+            jira_description=job.jira_description,
+            additional_instructions=job.additional_instructions,
+            compaction=compaction,
+            template_values=job.template_values,
+        )
+        if prompt is None:
+            result["error"] = f"Template ID {job.template_id} not found"
+        elif output_path is not None and not save_prompt_to_file(prompt, output_path):
+            result["error"] = f"Could not write {output_path}"
+        else:
+            result["chars"] = len(prompt)
+            result["tokens_estimate"] = estimate_tokens(prompt)
+            if output_path is None:
+                result["prompt"] = prompt
+    except Exception as e:
+        logger.error(f"Batch job {job.job_id} failed: {e}", exc_info=True)
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def _render_chunk(
+    tasks: List[Tuple[BatchJob, Optional[Path]]],
+    contents: Dict[str, Tuple[int, int, str]],
+    db_path: Path,
+    compaction: Optional[Compaction],
+    workspace_root: str,
+) -> List[Dict[str, Any]]:
+    """Render a worker's share of the jobs, with the contents read for them."""
+    if str(Config.WORKSPACE_ROOT) != workspace_root:
+        Config.set_workspace_root(workspace_root)
+    # Files the parent already read are served from the cache, not re-read
+    for path, (mtime_ns, size, content) in contents.items():
+        file_content_cache.put(path, mtime_ns, size, content)
+    return [_render_job(job, db_path, compaction, output) for job, output in tasks]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Spawned, not forked: the server process runs other threads
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.BATCH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _job_paths(job: BatchJob) -> List[str]:
+    return [
+        str(Path(split_symbol_selection(entry)[0]).resolve())
+        for entry in job.context_files
+    ]
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    db_path: Path,
+    compaction: Optional[Compaction] = None,
+    output_root: Optional[Path] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Generate the prompts of a batch of jobs.
+
+    Every file the jobs use is read once, up front, on a thread pool; the
+    jobs are then rendered in chunks on a process pool, each chunk with the
+    contents its jobs need, so no file is read twice however many jobs
+    share it. Small batches are rendered in this process.
+
+    Args:
+        jobs: Jobs from parse_manifest
+        db_path: Database holding the templates
+        compaction: Strategies compacting the context files of every job
+        output_root: If given, output paths must lie within it and relative
+            ones are resolved against it (instead of the working directory)
+        max_workers: Processes to render on; defaults to Config.BATCH_WORKERS
+
+    Returns:
+        "jobs" (per job: id, output, chars, tokens_estimate, seconds, and the
+        prompt when it has no output, or an error) and "summary" (counts and
+        timings)
+
+    Raises:
+        ValueError: If an output path is outside output_root
+    """
+    start = time.perf_counter()
+    workers = max_workers or Config.BATCH_WORKERS
+    default_id = template_cache.get_default_template_id(db_path)
+    tasks: List[Tuple[BatchJob, Optional[Path]]] = []
+    for job in jobs:
+        output: Optional[Path] = None
+        if job.output:
+            base = output_root or Path.cwd()
+            output = (base / job.output).resolve()
+            if output_root is not None and not output.is_relative_to(
+                output_root.resolve()
+            ):
+                raise ValueError(
+                    f"Job {job.job_id}: output must be within {output_root}"
+                )
+        if job.template_id is None:
+            job = job._replace(template_id=default_id)
+        tasks.append((job, output))
+
+    # Read every file once, whichever jobs share it
+    job_paths = [_job_paths(job) for job, _ in tasks]
+    unique_paths = list(dict.fromkeys(path for paths in job_paths for path in paths))
+    with ThreadPoolExecutor(max_workers=Config.CONTEXT_READ_WORKERS) as executor:
+        list(executor.map(read_file_content, unique_paths))
+    read_seconds = time.perf_counter() - start
+
+    render_start = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    pooled = workers > 1 and len(tasks) >= Config.BATCH_POOL_MIN_JOBS
+    if pooled:
+        size = -(-len(tasks) // workers)
+        chunks = [
+            (tasks[i : i + size], job_paths[i : i + size])
+            for i in range(0, len(tasks), size)
+        ]
+        try:
+            futures = [
+                _get_pool().submit(
+                    _render_chunk,
+                    chunk,
+                    file_content_cache.entries(
+                        {path for paths in chunk_paths for path in paths}
+                    ),
+                    db_path,
+                    compaction,
+                    str(Config.WORKSPACE_ROOT),
+                )
+                for chunk, chunk_paths in chunks
+            ]
+            for future in futures:
+                results.extend(future.result())
+        except Exception as e:
+            logger.warning(f"Batch worker pool failed, rendering inline: {e}")
+            pooled = False
+            results = []
+    if not pooled:
+        results = [
+            _render_job(job, db_path, compaction, output) for job, output in tasks
+        ]
+
+    render_seconds = time.perf_counter() - render_start
+    total_seconds = time.perf_counter() - start
+    file_references = sum(len(paths) for paths in job_paths)
+    failed = sum(1 for result in results if "error" in result)
+    logger.info(
+        f"Generated {len(results) - failed} of {len(results)} batch prompts in "
+        f"{total_seconds:.2f}s ({len(unique_paths)} files read for "
+        f"{file_references} references)."
+    )
+    return {
+        "jobs": results,
+        "summary": {
+            "jobs": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "file_references": file_references,
+            "unique_files": len(unique_paths),
+            "workers": workers if pooled else 1,
+            "read_seconds": round(read_seconds, 4),
+            "render_seconds": round(render_seconds, 4),
+            "total_seconds": round(total_seconds, 4),
+        },
+    }
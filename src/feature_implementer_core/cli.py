@@ -1,8 +1,9 @@
 import argparse
 import logging
+import re
 import sys  # For sys.exit
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 # Use refactored config and database module
 from .config import (
@@ -12,8 +13,18 @@ from .config import (
     load_default_template_content,
 )
 from . import database
-from .prompt_generator import generate_prompt
+from .prompt_generator import (
+    OVERFLOW_POLICIES,
+    OVERFLOW_TRUNCATE,
+    TokenBudget,
+    generate_prompt_chunks,
+)
+from .batch import parse_manifest, run_batch
+from .compaction import COMPACTION_STRATEGIES, Compaction
 from .file_utils import save_prompt_to_file
+from .git_diff import DiffContext
+from .import_graph import ImportExpansion
+from .template_engine import TemplateSyntaxError, compile_template
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -110,7 +121,8 @@ def parse_arguments() -> argparse.Namespace:
         type=Path,
         nargs="*",
         default=[],
-        help="Paths to files to include as code context.",
+        help="Paths to files to include as code context; use path::Name to "
+        "include a single class or function (e.g. app.py::create_app).",
     )
     # --always-include seems redundant if presets are available?
     # parser.add_argument(
@@ -132,6 +144,87 @@ def parse_arguments() -> argparse.Namespace:
         default="",
         help="Additional implementation instructions (or path to a file containing them).",
     )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=None,
+        metavar="TOKENS",
+        help="Pack the context files into a prompt of at most this many tokens, in the order given.",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=None,
+        help="Model whose tokenizer counts tokens for --token-budget (defaults to the configured encoding).",
+    )
+    parser.add_argument(
+        "--overflow-policy",
+        choices=OVERFLOW_POLICIES,
+        default=OVERFLOW_TRUNCATE,
+        help="What happens to context files that don't fit --token-budget [truncate].",
+    )
+    parser.add_argument(
+        "--expand-imports",
+        type=int,
+        default=0,
+        metavar="DEPTH",
+        help="Also include the workspace files the Python context files import, "
+        "following imports this many levels deep.",
+    )
+    parser.add_argument(
+        "--import-token-budget",
+        type=int,
+        default=None,
+        metavar="TOKENS",
+        help="Stop adding imported files once they would take more than this many (estimated) tokens.",
+    )
+    parser.add_argument(
+        "--compact",
+        choices=COMPACTION_STRATEGIES,
+        nargs="*",
+        default=None,
+        metavar="STRATEGY",
+        help="Compact the context files with these strategies "
+        f"({', '.join(COMPACTION_STRATEGIES)}); all of them if none are given.",
+    )
+    parser.add_argument(
+        "--diff-base",
+        type=str,
+        default=None,
+        metavar="REF",
+        help="Include only the changes of the context files against this git ref "
+        "(e.g. main); files not in it are included whole.",
+    )
+    parser.add_argument(
+        "--diff-context",
+        type=int,
+        default=None,
+        metavar="LINES",
+        help=f"Unchanged lines around each change with --diff-base [{Config.DIFF_CONTEXT_LINES}].",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Fill in a placeholder {NAME} of the template; sections between "
+        "{?NAME} and {/NAME} are left out unless it is set. Can be repeated.",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="MANIFEST",
+        default=None,
+        help="Generate a prompt for each line of a JSONL manifest ('-' reads stdin), "
+        'e.g. {"id": "FEAT-1", "jira": "...", "context_files": ["app.py"], '
+        '"template_id": 2, "output": "feat-1.md"}.',
+    )
+    parser.add_argument(
+        "--batch-workers",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Processes rendering the prompts of a batch [FEATURE_IMPLEMENTER_BATCH_WORKERS].",
+    )
     parser.add_argument(
         "--output",
         type=Path,
@@ -226,6 +319,12 @@ def handle_template_operations(
             )
             sys.exit(1)
 
+        try:
+            compile_template(template_content)
+        except TemplateSyntaxError as e:
+            logger.error(f"Invalid template content in '{template_content_path}': {e}")
+            sys.exit(1)
+
         # Create the template
         success, result = database.add_template(
             db_path,
@@ -281,6 +380,57 @@ def handle_template_operations(
     return operation_performed
 
 
+def handle_batch(
+    args: argparse.Namespace, db_path: Path, logger: logging.Logger
+) -> None:
+    """Generate the prompts of a --batch manifest and exit."""
+    try:
+        if args.batch == "-":
+            jobs = parse_manifest(sys.stdin)
+        else:
+            with open(args.batch, encoding="utf-8") as manifest:
+                jobs = parse_manifest(manifest)
+    except (OSError, ValueError) as e:
+        logger.error(f"Invalid batch manifest {args.batch}: {e}")
+        sys.exit(1)
+
+    # Prompts without an output path go to the default output directory
+    jobs = [
+        (
+            job
+            if job.output
+            else job._replace(
+                output=str(
+                    Config.DEFAULT_OUTPUT_DIR
+                    / (re.sub(r"[^\w.-]", "_", job.job_id) + ".md")
+                )
+            )
+        )
+        for job in jobs
+    ]
+    compaction: Optional[Compaction] = None
+    if args.compact is not None:
+        compaction = Compaction(args.compact or COMPACTION_STRATEGIES)
+    report = run_batch(jobs, db_path, compaction, max_workers=args.batch_workers)
+    for result in report["jobs"]:
+        if "error" in result:
+            logger.error(f"Job {result['id']} failed: {result['error']}")
+        else:
+            logger.info(
+                f"Job {result['id']}: {result['chars']} chars "
+                f"(~{result['tokens_estimate']} tokens) in {result['seconds']:.3f}s "
+                f"-> {result['output']}"
+            )
+    summary = report["summary"]
+    logger.info(
+        f"Batch done: {summary['succeeded']} of {summary['jobs']} prompts in "
+        f"{summary['total_seconds']:.2f}s on {summary['workers']} worker(s); "
+        f"{summary['unique_files']} files read for {summary['file_references']} "
+        f"references in {summary['read_seconds']:.2f}s."
+    )
+    sys.exit(1 if summary["failed"] else 0)
+
+
 def main_cli() -> None:
     """Main CLI entry point for generating prompts and managing templates."""
     # Configure basic logging for CLI
@@ -354,6 +504,9 @@ def main_cli() -> None:
         # Template operation performed, exit early
         sys.exit(0)
 
+    if args.batch:
+        handle_batch(args, db_path, logger)
+
     # --- Proceed with Prompt Generation ---
     logger.info("Generating prompt...")
 
@@ -402,25 +555,74 @@ def main_cli() -> None:
         else:
             logger.info(f"Using specified template ID: {template_id_to_use}")
 
-        # Generate prompt using the chosen template ID
-        final_prompt = generate_prompt(
+        budget: Optional[TokenBudget] = None
+        if args.token_budget is not None:
+            budget = TokenBudget(
+                args.token_budget, model=args.model, overflow=args.overflow_policy
+            )
+        compaction: Optional[Compaction] = None
+        if args.compact is not None:
+            compaction = Compaction(args.compact or COMPACTION_STRATEGIES)
+        template_values: Dict[str, str] = {}
+        for assignment in args.set:
+            name, separator, value = assignment.partition("=")
+            if not separator or not name:
+                raise ValueError(f"--set expects NAME=VALUE, got '{assignment}'")
+            template_values[name] = value
+        imports: Optional[ImportExpansion] = None
+        if args.expand_imports:
+            imports = ImportExpansion(args.expand_imports, args.import_token_budget)
+        diff: Optional[DiffContext] = None
+        if args.diff_base is not None:
+            diff = DiffContext(args.diff_base, args.diff_context)
+
+        # Generate prompt using the chosen template ID; it is written to the
+        # file as it is generated
+        prompt_chunks = generate_prompt_chunks(
             db_path=db_path,
             template_id=template_id_to_use,
             context_files=all_context_files,
             jira_description=args.jira,  # TODO: Handle reading from file if path provided
             additional_instructions=args.instructions,  # TODO: Handle reading from file if path provided
+            budget=budget,
+            imports=imports,
+            compaction=compaction,
+            template_values=template_values,
+            diff=diff,
         )
 
-        if final_prompt is None:
+        if prompt_chunks is None:
             logger.error(
                 f"Prompt generation failed. Check logs for details (template ID: {template_id_to_use})."
             )
             sys.exit(1)
 
         # Save the prompt
-        saved = save_prompt_to_file(final_prompt, output_path)
+        saved = save_prompt_to_file(prompt_chunks, output_path)
         if saved:
             logger.info(f"Prompt saved successfully to: {output_path}")
+            if imports is not None and imports.report is not None:
+                for entry in imports.report["added"]:
+                    logger.info(
+                        f"Added imported file: {entry['path']} (depth {entry['depth']})"
+                    )
+                for entry in imports.report["skipped"]:
+                    logger.info(
+                        f"Skipped imported file over the import token budget: {entry['path']}"
+                    )
+            if diff is not None and diff.report is not None:
+                logger.info(
+                    f"Diffed against {diff.base_ref}: {diff.report['changed']} changed, "
+                    f"{diff.report['unchanged']} unchanged, {diff.report['new']} new, "
+                    f"{diff.report['outside_repository']} outside a repository."
+                )
+            if budget is not None and budget.report is not None:
+                for entry in budget.report["files"]:
+                    if entry["status"] != "included":
+                        logger.info(
+                            f"Context file {entry['status']}: {entry['path']} "
+                            f"({entry['included_tokens']} of {entry['tokens']} tokens)"
+                        )
         else:
             logger.error(f"Failed to save prompt to file: {output_path}")
             sys.exit(1)
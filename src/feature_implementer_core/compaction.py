@@ -0,0 +1,366 @@
+import ast
+import re
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+# Compaction strategies, in the order they are applied
+STRATEGY_LICENSE = "license"
+STRATEGY_COMMENTS = "comments"
+STRATEGY_DOCSTRINGS = "docstrings"
+STRATEGY_WHITESPACE = "whitespace"
+COMPACTION_STRATEGIES = (
+    STRATEGY_LICENSE,
+    STRATEGY_COMMENTS,
+    STRATEGY_DOCSTRINGS,
+    STRATEGY_WHITESPACE,
+)
+
+# A leading comment block mentioning one of these is a license banner
+LICENSE_PATTERN = re.compile(
+    r"copyright|licen[cs]e|spdx-license-identifier|all rights reserved", re.I
+)
+
+# Marks removed comments until their lines are cleaned up; NUL never
+# appears in the text files that reach compaction
+_REMOVED = "\0"
+
+
+class CommentSyntax(NamedTuple):
+    """How comments and strings are written in a language."""
+
+    line_comments: tuple
+    # (start, end) of block comments, or None
+    block_comment: Optional[tuple]
+    # Comments starting with these are documentation (the "docstrings" strategy)
+    doc_prefixes: tuple
+    # Quote characters of string literals that can hide comment markers
+    quotes: str
+    # Line comments only start at the beginning of a line or after whitespace
+    # (shell, YAML: "a#b" is not a comment)
+    comment_after_space: bool = False
+    # Strings can also be triple-quoted and span lines (Python)
+    triple_quotes: bool = False
+    # Regular expression literals (/.../flags) can hide comment markers
+    # (JavaScript, TypeScript)
+    regex_literals: bool = False
+
+
+C_SYNTAX = CommentSyntax(("//",), ("/*", "*/"), ("/**", "///", "//!"), "\"'`")
+JS_SYNTAX = C_SYNTAX._replace(regex_literals=True)
+# No single-quoted strings: 'a is a lifetime, not the start of a string
+RUST_SYNTAX = CommentSyntax(("//",), ("/*", "*/"), ("/**", "/*!", "///", "//!"), '"')
+CSS_SYNTAX = CommentSyntax((), ("/*", "*/"), (), "\"'")
+SCSS_SYNTAX = CommentSyntax(("//",), ("/*", "*/"), ("///",), "\"'")
+HASH_SYNTAX = CommentSyntax(("#",), None, (), "\"'", comment_after_space=True)
+SQL_SYNTAX = CommentSyntax(("--",), ("/*", "*/"), (), "'\"")
+MARKUP_SYNTAX = CommentSyntax((), ("<!--", "-->"), (), "")
+# Docstrings are found with the ast module instead
+PYTHON_SYNTAX = CommentSyntax(("#",), None, (), "\"'", triple_quotes=True)
+
+LANGUAGES: Dict[str, CommentSyntax] = {
+    "python": PYTHON_SYNTAX,
+    "c": C_SYNTAX,
+    "javascript": JS_SYNTAX,
+    "rust": RUST_SYNTAX,
+    "css": CSS_SYNTAX,
+    "scss": SCSS_SYNTAX,
+    "shell": HASH_SYNTAX,
+    "sql": SQL_SYNTAX,
+    "markup": MARKUP_SYNTAX,
+}
+
+# File extension (or name, for files without one) -> language
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".pyi": "python",
+    **dict.fromkeys(".js .jsx .mjs .cjs .ts .tsx .mts .cts".split(), "javascript"),
+    **dict.fromkeys(
+        ".java .c .h .cc .cpp .cxx .hpp .cs .go "
+        ".kt .kts .swift .scala .dart .php .groovy .gradle".split(),
+        "c",
+    ),
+    ".rs": "rust",
+    ".css": "css",
+    ".scss": "scss",
+    ".less": "scss",
+    **dict.fromkeys(
+        ".sh .bash .zsh .rb .yml .yaml .toml .r .pl .pm .cfg .conf "
+        "dockerfile makefile".split(),
+        "shell",
+    ),
+    ".sql": "sql",
+    **dict.fromkeys(".html .htm .xml .svg .vue .md".split(), "markup"),
+}
+
+
+def language_for(file_name: str) -> Optional[str]:
+    """Return the compaction language of a file, or None if it has none."""
+    name = file_name.rsplit("/", 1)[-1].lower()
+    dot = name.rfind(".")
+    return LANGUAGE_BY_EXTENSION.get(name[dot:] if dot > 0 else name)
+
+
+class Compaction:
+    """Compaction strategies applied to the context files of a prompt.
+
+    - license: drop a leading comment block that mentions a copyright or license
+    - comments: strip comments (but not documentation comments)
+    - docstrings: strip Python docstrings and documentation comments
+      (/** */, ///)
+    - whitespace: strip trailing whitespace and collapse runs of blank lines
+
+    The comment strategies know the comment and string syntax of Python,
+    C-like languages, Rust, CSS, shell-like languages (including YAML and
+    TOML), SQL and markup; other files only get whitespace compaction.
+    In JavaScript and TypeScript, a slash where an expression starts (after
+    an operator, an opening bracket, a comma, "return" or at the start of a
+    line) begins a regular expression literal, which is kept like a string.
+    Files that don't tokenize are left as they are.
+    """
+
+    def __init__(self, strategies: Iterable[str]):
+        strategies = frozenset(strategies)
+        unknown = strategies.difference(COMPACTION_STRATEGIES)
+        if unknown:
+            raise ValueError(
+                f"Unknown compaction strategy '{sorted(unknown)[0]}', expected "
+                f"any of: {', '.join(COMPACTION_STRATEGIES)}"
+            )
+        self.strategies: FrozenSet[str] = strategies
+
+    def __bool__(self) -> bool:
+        return bool(self.strategies)
+
+    def key(self) -> List[str]:
+        """Return the strategies in a stable order, for fingerprints and reports."""
+        return [name for name in COMPACTION_STRATEGIES if name in self.strategies]
+
+    def compact(self, text: str, file_name: str) -> str:
+        """Compact a file's text with the strategies that apply to its language."""
+        return compact_text(text, language_for(file_name), self.strategies)
+
+
+def _drop_license_banner(text: str, syntax: CommentSyntax) -> str:
+    """Remove the leading comment block if it is a license banner."""
+    start = 0
+    if text.startswith("#!"):
+        # Keep the shebang line
+        start = text.find("\n") + 1 or len(text)
+    parts = [re.escape(prefix) + r"[^\n]*" for prefix in syntax.line_comments]
+    if syntax.block_comment:
+        open_, close = syntax.block_comment
+        parts.append(re.escape(open_) + r".*?" + re.escape(close))
+    if not parts:
+        return text
+    comment = re.compile("|".join(parts), re.S)
+    whitespace = re.compile(r"\s*")
+    position = start
+    while True:
+        position = whitespace.match(text, position).end()
+        match = comment.match(text, position)
+        if match is None:
+            break
+        position = match.end()
+    banner = text[start:position]
+    if not LICENSE_PATTERN.search(banner):
+        return text
+    return text[:start] + text[position:].lstrip("\n")
+
+
+def _syntax_pattern(syntax: CommentSyntax) -> "re.Pattern[str]":
+    """Build a pattern matching the strings and comments of a language."""
+    parts = []
+    if syntax.triple_quotes:
+        for quote in syntax.quotes:
+            q = re.escape(quote * 3)
+            parts.append(rf"(?P<t{len(parts)}>{q}(?:\\.|[^\\])*?{q})")
+    for quote in syntax.quotes:
+        q = re.escape(quote)
+        # Backtick strings (template literals, Go raw strings) span lines
+        body = rf"[^{q}\\]" if quote == "`" else rf"[^{q}\\\n]"
+        parts.append(rf"(?P<s{len(parts)}>{q}(?:\\.|{body})*{q})")
+    if syntax.regex_literals:
+        # With the token before it, as lookbehinds can't have a variable width:
+        # after these a slash can't be a division
+        parts.append(
+            r"(?P<regex>(?:^|[(\[{,;:=!&|?+\-*%<>~^]|\breturn|\btypeof)[ \t]*"
+            r"/(?![/*])(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[A-Za-z]*)"
+        )
+    comments = []
+    for prefix in syntax.line_comments:
+        lead = r"(?:(?<=\s)|^)" if syntax.comment_after_space else ""
+        comments.append(lead + re.escape(prefix) + r"[^\n]*")
+    if syntax.block_comment:
+        open_, close = syntax.block_comment
+        comments.append(re.escape(open_) + r".*?" + re.escape(close))
+    parts.append("(?P<comment>" + "|".join(comments) + ")")
+    return re.compile("|".join(parts), re.S | re.M)
+
+
+_patterns: Dict[CommentSyntax, "re.Pattern[str]"] = {}
+
+
+def _strip_comments(
+    text: str, syntax: CommentSyntax, comments: bool, docs: bool
+) -> str:
+    """Remove comments (outside string literals) from source text.
+
+    Lines left empty by a removal are dropped entirely.
+    """
+    if not syntax.line_comments and not syntax.block_comment:
+        return text
+    pattern = _patterns.get(syntax)
+    if pattern is None:
+        pattern = _patterns[syntax] = _syntax_pattern(syntax)
+
+    def replace(match: "re.Match[str]") -> str:
+        comment = match.group("comment")
+        if comment is None:
+            return match.group(0)
+        is_doc = comment.startswith(syntax.doc_prefixes) and comment != "/**/"
+        if (docs if is_doc else comments) and not comment.startswith("#!"):
+            return _REMOVED
+        return comment
+
+    return _clean_removed_lines(pattern.sub(replace, text))
+
+
+def _clean_removed_lines(text: str) -> str:
+    """Drop lines that only held removed comments, and the markers in others."""
+    if _REMOVED not in text:
+        return text
+    lines = []
+    for line in text.split("\n"):
+        if _REMOVED in line:
+            line = line.replace(_REMOVED, "").rstrip()
+            if not line.strip():
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _docstring_lines(
+    body: List[ast.stmt], lines: List[str]
+) -> Iterator[Tuple[int, int, str]]:
+    """Yield (first, last, indent) of the docstrings of the definitions in body.
+
+    Only statements are visited, not expressions, and only docstrings on
+    lines of their own. indent is set for docstrings that are the only
+    statement of their body, which must then be replaced by "...".
+    """
+    for node in body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            found = _docstring_of(node.body, lines)
+            if found is not None:
+                first, last, before = found
+                yield first, last, before if len(node.body) == 1 else ""
+            yield from _docstring_lines(node.body, lines)
+            continue
+        for field in ("body", "orelse", "finalbody"):
+            yield from _docstring_lines(getattr(node, field, None) or [], lines)
+        for child in getattr(node, "handlers", None) or []:
+            yield from _docstring_lines(child.body, lines)
+        for child in getattr(node, "cases", None) or []:
+            yield from _docstring_lines(child.body, lines)
+
+
+def _docstring_of(
+    body: List[ast.stmt], lines: List[str]
+) -> Optional[Tuple[int, int, str]]:
+    """Return (first, last, indent) of a body's docstring, or None."""
+    if not (
+        body
+        and isinstance(body[0], ast.Expr)
+        and isinstance(body[0].value, ast.Constant)
+        and isinstance(body[0].value.value, str)
+    ):
+        return None
+    docstring = body[0]
+    first, last = docstring.lineno - 1, (docstring.end_lineno or 0) - 1
+    # Offsets are in UTF-8 bytes
+    before = lines[first].encode("utf-8")[: docstring.col_offset]
+    after = lines[last].encode("utf-8")[docstring.end_col_offset :].strip()
+    if before.strip() or (after and not after.startswith(b"#")):
+        return None
+    return first, last, before.decode("utf-8")
+
+
+def _strip_docstrings(text: str) -> str:
+    """Remove docstrings from Python source.
+
+    Indented code (such as a method cut out of a class) is parsed inside a
+    wrapper block. A docstring that is the only statement of its body is
+    replaced by "...", to keep the code valid. Source that doesn't parse is
+    left as it is.
+    """
+    wrapped = text[:1] in (" ", "\t")
+    source = "if True:\n" + text if wrapped else text
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return text
+    lines = source.split("\n")
+    dropped = set()
+    module_docstring = _docstring_of(tree.body, lines)
+    if module_docstring is not None:
+        dropped.update(range(module_docstring[0], module_docstring[1] + 1))
+    for first, last, indent in _docstring_lines(tree.body, lines):
+        dropped.update(range(first, last + 1))
+        if indent:
+            lines[first] = indent + "..."
+            dropped.discard(first)
+    if not dropped:
+        return text
+    result = [line for index, line in enumerate(lines) if index not in dropped]
+    return "\n".join(result[1:] if wrapped else result)
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Strip trailing whitespace and keep at most one blank line in a row."""
+    lines = []
+    blank = False
+    for line in text.split("\n"):
+        line = line.rstrip()
+        if not line:
+            if blank:
+                continue
+            blank = True
+        else:
+            blank = False
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def compact_text(text: str, language: Optional[str], strategies: FrozenSet[str]) -> str:
+    """Apply compaction strategies to source text of a language.
+
+    Args:
+        text: Source text, with universal newlines
+        language: Key of LANGUAGES, or None for files without comment syntax
+        strategies: Names from COMPACTION_STRATEGIES
+
+    Returns:
+        The compacted text
+    """
+    syntax = LANGUAGES.get(language) if language else None
+    if syntax is not None:
+        if STRATEGY_LICENSE in strategies:
+            text = _drop_license_banner(text, syntax)
+        comments = STRATEGY_COMMENTS in strategies
+        docs = STRATEGY_DOCSTRINGS in strategies
+        if docs and language == "python":
+            # Before comments are stripped: docstrings are found by line
+            text = _strip_docstrings(text)
+        if comments or (docs and syntax.doc_prefixes):
+            text = _strip_comments(text, syntax, comments, docs)
+    if STRATEGY_WHITESPACE in strategies:
+        text = _collapse_whitespace(text)
+    return text
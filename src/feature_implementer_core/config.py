@@ -91,6 +91,148 @@ class Config:
         # DB_PATH.name, # No longer need to ignore DB_PATH by name in workspace, as it's outside
     ]
 
+    # Also skip whatever the workspace's .gitignore files exclude
+    RESPECT_GITIGNORE = os.environ.get(
+        "FEATURE_IMPLEMENTER_RESPECT_GITIGNORE", "true"
+    ).lower() in ("1", "true", "yes")
+
+    # Threads used to list directories in parallel during a full scan. This
+    # mostly helps on network filesystems; 1 scans sequentially.
+    SCAN_WORKERS = int(os.environ.get("FEATURE_IMPLEMENTER_SCAN_WORKERS", "8"))
+    # Threads reading the selected context files of a prompt at once; 1 reads
+    # them one after another
+    CONTEXT_READ_WORKERS = int(
+        os.environ.get("FEATURE_IMPLEMENTER_CONTEXT_READ_WORKERS", "8")
+    )
+    # Total size of file contents kept in memory for previews and prompt
+    # generation, in bytes
+    CONTENT_CACHE_MAX_BYTES = int(
+        os.environ.get(
+            "FEATURE_IMPLEMENTER_CONTENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)
+        )
+    )
+    # Larger context files are cut down to an excerpt of their head and tail
+    CONTEXT_FILE_MAX_BYTES = int(
+        os.environ.get("FEATURE_IMPLEMENTER_CONTEXT_FILE_MAX_BYTES", str(1024 * 1024))
+    )
+    # Memory for generated prompts remembered by their inputs (0 disables)
+    PROMPT_CACHE_MAX_BYTES = int(
+        os.environ.get(
+            "FEATURE_IMPLEMENTER_PROMPT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)
+        )
+    )
+    # How long a request waits for an identical one already generating
+    PROMPT_COALESCE_WAIT_SECONDS = 30.0
+    # Templates kept parsed into text, placeholders and optional sections
+    COMPILED_TEMPLATE_CACHE_ENTRIES = 128
+    # Seconds cached templates are used before checking the database for
+    # template changes made by other processes
+    TEMPLATE_CACHE_CHECK_INTERVAL = float(
+        os.environ.get("FEATURE_IMPLEMENTER_TEMPLATE_CACHE_CHECK_INTERVAL", "1.0")
+    )
+    # Keep the cached file tree current by watching the workspace instead of
+    # rescanning it when the cache expires: "auto" (inotify on Linux, polling
+    # elsewhere), "inotify", "poll", or "off" to keep the TTL-based rescans.
+    FILE_WATCH_MODE = os.environ.get("FEATURE_IMPLEMENTER_FILE_WATCH", "auto").lower()
+    # Seconds between directory mtime checks when polling
+    FILE_WATCH_POLL_INTERVAL = float(
+        os.environ.get("FEATURE_IMPLEMENTER_FILE_WATCH_INTERVAL", "2.0")
+    )
+    # Children returned per request when the explorer expands a folder
+    FILE_TREE_PAGE_SIZE = 200
+    # Upper bound on file search results sent to the explorer
+    FILE_SEARCH_MAX_RESULTS = 200
+    # With several server processes only one watches and scans the workspace;
+    # the others pull its index changes from the database at most this often.
+    FILE_TREE_SYNC_INTERVAL = float(
+        os.environ.get("FEATURE_IMPLEMENTER_FILE_TREE_SYNC_INTERVAL", "1.0")
+    )
+
+    # tiktoken encoding used to count the tokens of context files
+    TOKEN_ENCODING = os.environ.get("FEATURE_IMPLEMENTER_TOKEN_ENCODING", "cl100k_base")
+    # Threads encoding several texts at once (tiktoken releases the GIL)
+    TOKENIZER_THREADS = int(
+        os.environ.get("FEATURE_IMPLEMENTER_TOKENIZER_THREADS", "4")
+    )
+    # Token counts of large texts remembered by content hash
+    TOKEN_COUNT_CACHE_ENTRIES = 10000
+    # Larger files only get a size-based token estimate in the explorer
+    TOKEN_COUNT_MAX_BYTES = 2 * 1024 * 1024
+    # Worker processes parsing Python files for symbol-level context
+    SYMBOL_INDEX_WORKERS = int(
+        os.environ.get(
+            "FEATURE_IMPLEMENTER_SYMBOL_INDEX_WORKERS", str(min(4, os.cpu_count() or 1))
+        )
+    )
+    # Fewer files than this are parsed in-process rather than on the workers
+    SYMBOL_INDEX_POOL_MIN_FILES = 16
+    # Worker processes rendering the prompts of a batch
+    BATCH_WORKERS = int(
+        os.environ.get(
+            "FEATURE_IMPLEMENTER_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))
+        )
+    )
+    # Smaller batches are rendered in-process rather than on the workers
+    BATCH_POOL_MIN_JOBS = 4
+    # Upper bound on the jobs of one /generate/batch request
+    BATCH_MAX_JOBS = 1000
+    # Unchanged lines around each hunk of a context file in diff mode
+    DIFF_CONTEXT_LINES = 3
+    # Longest a git call of diff mode may take
+    GIT_TIMEOUT_SECONDS = 30
+    # Python files whose symbols are remembered
+    SYMBOL_INDEX_MAX_FILES = 20000
+    # Files assumed to be binary without reading them (no token cost)
+    BINARY_EXTENSIONS = frozenset(
+        [
+            ".png",
+            ".jpg",
+            ".jpeg",
+            ".gif",
+            ".webp",
+            ".bmp",
+            ".ico",
+            ".pdf",
+            ".zip",
+            ".gz",
+            ".tar",
+            ".rar",
+            ".7z",
+            ".xlsx",
+            ".xls",
+            ".docx",
+            ".doc",
+            ".pptx",
+            ".ppt",
+            ".so",
+            ".dll",
+            ".dylib",
+            ".exe",
+            ".bin",
+            ".pyc",
+            ".class",
+            ".jar",
+            ".whl",
+            ".woff",
+            ".woff2",
+            ".ttf",
+            ".otf",
+            ".mp3",
+            ".mp4",
+            ".mov",
+            ".sqlite",
+            ".db",
+            ".pt",
+            ".pth",
+            ".ckpt",
+            ".safetensors",
+            ".onnx",
+            ".npy",
+            ".npz",
+            ".pkl",
+        ]
+    )
+
     # --- Default Template Content (loaded once) ---
     DEFAULT_TEMPLATE_CONTENT: str = ""
     try:
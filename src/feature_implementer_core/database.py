@@ -24,12 +24,63 @@ SCHEMA = {
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """,
+    "template_revision": """
+        CREATE TABLE IF NOT EXISTS template_revision (
+            id INTEGER PRIMARY KEY CHECK (id = 1), -- A single row
+            revision INTEGER NOT NULL DEFAULT 0 -- Bumped on every template write
+        )
+    """,
     "settings": """
         CREATE TABLE IF NOT EXISTS settings (
             key TEXT PRIMARY KEY,
             value TEXT
         )
     """,
+    "file_index_roots": """
+        CREATE TABLE IF NOT EXISTS file_index_roots (
+            root TEXT PRIMARY KEY,
+            signature TEXT NOT NULL, -- Scan settings the index was built with
+            saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "file_index": """
+        CREATE TABLE IF NOT EXISTS file_index (
+            root TEXT NOT NULL,
+            dir_path TEXT NOT NULL, -- Relative to root, '' for the root itself
+            mtime_ns INTEGER NOT NULL,
+            files TEXT NOT NULL, -- JSON encoded list of [name, size, mtime_ns]
+            subdirs TEXT NOT NULL, -- JSON encoded list of subdirectory names
+            PRIMARY KEY (root, dir_path)
+        )
+    """,
+    "file_index_generations": """
+        CREATE TABLE IF NOT EXISTS file_index_generations (
+            root TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0, -- Bumped on every index write
+            base_generation INTEGER NOT NULL DEFAULT 0 -- Oldest generation with change records
+        )
+    """,
+    "file_index_changes": """
+        CREATE TABLE IF NOT EXISTS file_index_changes (
+            root TEXT NOT NULL,
+            generation INTEGER NOT NULL,
+            dir_path TEXT NOT NULL -- Relative to root
+        )
+    """,
+    "file_index_changes_idx": """
+        CREATE INDEX IF NOT EXISTS file_index_changes_idx
+        ON file_index_changes (root, generation)
+    """,
+    "import_graph": """
+        CREATE TABLE IF NOT EXISTS import_graph (
+            root TEXT NOT NULL, -- Workspace root imports were resolved in
+            path TEXT NOT NULL, -- Absolute path of a Python file
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            imports TEXT NOT NULL, -- JSON encoded list of imported file paths
+            PRIMARY KEY (root, path)
+        )
+    """,
 }
 
 
@@ -52,7 +103,14 @@ def initialize_database(db_path: Path):
             cursor = conn.cursor()
             cursor.execute(SCHEMA["presets"])
             cursor.execute(SCHEMA["templates"])
+            cursor.execute(SCHEMA["template_revision"])
             cursor.execute(SCHEMA["settings"])
+            cursor.execute(SCHEMA["file_index_roots"])
+            cursor.execute(SCHEMA["file_index"])
+            cursor.execute(SCHEMA["file_index_generations"])
+            cursor.execute(SCHEMA["file_index_changes"])
+            cursor.execute(SCHEMA["file_index_changes_idx"])
+            cursor.execute(SCHEMA["import_graph"])
             conn.commit()
         logger.info("Database schema initialized successfully.")
     except sqlite3.Error as e:
@@ -62,6 +120,63 @@ def initialize_database(db_path: Path):
 
 # --- Template Functions ---
 
+# Template writes committed by this process. Caches compare it to see their
+# own process's writes at once; other processes' show in the revision row.
+template_writes = 0
+
+
+def _bump_template_revision(cursor: sqlite3.Cursor) -> None:
+    """Increment the template revision (within a transaction)."""
+    cursor.execute(
+        "INSERT OR IGNORE INTO template_revision (id, revision) VALUES (1, 0)"
+    )
+    cursor.execute("UPDATE template_revision SET revision = revision + 1")
+
+
+def _template_written() -> None:
+    """Record a committed template write of this process."""
+    global template_writes
+    template_writes += 1
+
+
+def get_template_revision(db_path: Path) -> Optional[int]:
+    """Get the revision of the templates table, or None if it can't be read."""
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT revision FROM template_revision WHERE id = 1")
+            row = cursor.fetchone()
+            return row["revision"] if row else 0
+    except sqlite3.Error as e:
+        logger.error(f"Database error reading template revision: {e}", exc_info=True)
+        return None
+
+
+def get_templates_with_revision(
+    db_path: Path,
+) -> Tuple[Optional[int], List[Dict[str, Any]]]:
+    """Read all templates and the revision they are at, consistently.
+
+    Returns:
+        The revision (None if it can't be read) and the templates, by name
+    """
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            # A read transaction, so no write lands between the two queries
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT revision FROM template_revision WHERE id = 1")
+            row = cursor.fetchone()
+            cursor.execute(
+                "SELECT id, name, description, content, is_default, created_at FROM templates ORDER BY name"
+            )
+            templates = [dict(row) for row in cursor.fetchall()]
+            conn.rollback()
+            return (row["revision"] if row else 0), templates
+    except sqlite3.Error as e:
+        logger.error(f"Database error fetching templates: {e}", exc_info=True)
+        return None, []
+
 
 def add_template(
     db_path: Path,
@@ -85,7 +200,9 @@ def add_template(
                 (name, content, description, 1 if is_default else 0),
             )
             template_id = cursor.lastrowid
+            _bump_template_revision(cursor)
             conn.commit()
+            _template_written()
             logger.info(f"Template '{name}' added with ID {template_id}")
             return True, template_id
     except sqlite3.IntegrityError:
@@ -169,7 +286,9 @@ def update_template(
                    WHERE id = ?""",
                 (name, content, description, 1 if is_default else 0, template_id),
             )
+            _bump_template_revision(cursor)
             conn.commit()
+            _template_written()
             logger.info(f"Template ID {template_id} updated successfully.")
             return True, None
     except sqlite3.IntegrityError:
@@ -204,8 +323,11 @@ def delete_template(db_path: Path, template_id: int) -> Tuple[bool, Optional[str
                 return False, "Cannot delete the default template."
 
             cursor.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+            deleted = cursor.rowcount
+            _bump_template_revision(cursor)
             conn.commit()
-            if cursor.rowcount > 0:
+            _template_written()
+            if deleted > 0:
                 logger.info(f"Template ID {template_id} deleted successfully.")
                 return True, None
             else:
@@ -241,7 +363,9 @@ def set_default_template(db_path: Path, template_id: int) -> Tuple[bool, Optiona
             cursor.execute(
                 "UPDATE templates SET is_default = 1 WHERE id = ?", (template_id,)
             )
+            _bump_template_revision(cursor)
             conn.commit()
+            _template_written()
             logger.info(f"Template ID {template_id} successfully set as default.")
             return True, None
     except sqlite3.Error as e:
@@ -276,7 +400,9 @@ def delete_all_templates(db_path: Path) -> bool:
         with get_db_connection(db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM templates")
+            _bump_template_revision(cursor)
             conn.commit()
+            _template_written()
             logger.info("All templates deleted successfully.")
             return True
     except sqlite3.Error as e:
@@ -410,6 +536,296 @@ def set_setting(db_path: Path, key: str, value: str) -> bool:
         return False
 
 
+# --- File Index Functions ---
+
+# Directory listing as stored:
+# (mtime_ns, [name, size, mtime_ns] per file, subdirectory names)
+IndexEntry = Tuple[int, List[List[Any]], List[str]]
+
+# Number of generations of change records kept for incremental syncs
+FILE_INDEX_CHANGE_RETENTION = 1000
+
+
+def _bump_file_index_generation(cursor: sqlite3.Cursor, root: str) -> int:
+    """Increment and return the index generation of a root (within a transaction)."""
+    cursor.execute(
+        "INSERT OR IGNORE INTO file_index_generations (root, generation, base_generation) VALUES (?, 0, 0)",
+        (root,),
+    )
+    cursor.execute(
+        "UPDATE file_index_generations SET generation = generation + 1 WHERE root = ?",
+        (root,),
+    )
+    cursor.execute(
+        "SELECT generation FROM file_index_generations WHERE root = ?", (root,)
+    )
+    return cursor.fetchone()["generation"]
+
+
+def _fetch_file_index_entries(
+    cursor: sqlite3.Cursor, root: str, dir_paths: List[str]
+) -> Dict[str, IndexEntry]:
+    """Fetch the stored listings of specific directories of a root."""
+    entries = {}
+    # Stay well below SQLite's bound parameter limit
+    for start in range(0, len(dir_paths), 500):
+        chunk = dir_paths[start : start + 500]
+        placeholders = ", ".join("?" for _ in chunk)
+        cursor.execute(
+            f"SELECT dir_path, mtime_ns, files, subdirs FROM file_index WHERE root = ? AND dir_path IN ({placeholders})",
+            (root, *chunk),
+        )
+        for row in cursor.fetchall():
+            entries[row["dir_path"]] = (
+                row["mtime_ns"],
+                json.loads(row["files"]),
+                json.loads(row["subdirs"]),
+            )
+    return entries
+
+
+def save_file_index(
+    db_path: Path, root: str, signature: str, entries: Dict[str, IndexEntry]
+) -> Optional[int]:
+    """Replace the persisted file index of a scan root.
+
+    Returns:
+        The new index generation, or None on failure
+    """
+    logger.debug(f"Saving file index for {root} ({len(entries)} directories)")
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM file_index WHERE root = ?", (root,))
+            cursor.executemany(
+                "INSERT INTO file_index (root, dir_path, mtime_ns, files, subdirs) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (root, dir_path, mtime_ns, json.dumps(files), json.dumps(subdirs))
+                    for dir_path, (mtime_ns, files, subdirs) in entries.items()
+                ],
+            )
+            cursor.execute(
+                "INSERT OR REPLACE INTO file_index_roots (root, signature) VALUES (?, ?)",
+                (root, signature),
+            )
+            # Readers at an older generation must reload everything
+            generation = _bump_file_index_generation(cursor, root)
+            cursor.execute(
+                "UPDATE file_index_generations SET base_generation = ? WHERE root = ?",
+                (generation, root),
+            )
+            cursor.execute("DELETE FROM file_index_changes WHERE root = ?", (root,))
+            conn.commit()
+            return generation
+    except sqlite3.Error as e:
+        logger.error(f"Database error saving file index for {root}: {e}", exc_info=True)
+        return None
+
+
+def update_file_index(
+    db_path: Path,
+    root: str,
+    changed: Dict[str, IndexEntry],
+    removed: List[str],
+) -> Optional[int]:
+    """Apply incremental directory changes to the persisted file index of a root.
+
+    The changed directories are recorded under a new generation so other
+    processes can fetch just those rows.
+
+    Returns:
+        The new index generation, or None on failure
+    """
+    logger.debug(
+        f"Updating file index for {root}: {len(changed)} changed, {len(removed)} removed"
+    )
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "DELETE FROM file_index WHERE root = ? AND dir_path = ?",
+                [(root, dir_path) for dir_path in removed],
+            )
+            cursor.executemany(
+                "INSERT OR REPLACE INTO file_index (root, dir_path, mtime_ns, files, subdirs) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (root, dir_path, mtime_ns, json.dumps(files), json.dumps(subdirs))
+                    for dir_path, (mtime_ns, files, subdirs) in changed.items()
+                ],
+            )
+            generation = _bump_file_index_generation(cursor, root)
+            cursor.executemany(
+                "INSERT INTO file_index_changes (root, generation, dir_path) VALUES (?, ?, ?)",
+                [(root, generation, dir_path) for dir_path in [*changed, *removed]],
+            )
+            # Drop old change records; readers that far behind reload fully
+            base_generation = generation - FILE_INDEX_CHANGE_RETENTION
+            cursor.execute(
+                "DELETE FROM file_index_changes WHERE root = ? AND generation <= ?",
+                (root, base_generation),
+            )
+            cursor.execute(
+                "UPDATE file_index_generations SET base_generation = MAX(base_generation, ?) WHERE root = ?",
+                (base_generation, root),
+            )
+            conn.commit()
+            return generation
+    except sqlite3.Error as e:
+        logger.error(
+            f"Database error updating file index for {root}: {e}", exc_info=True
+        )
+        return None
+
+
+def get_file_index(
+    db_path: Path, root: str, signature: str
+) -> Optional[Tuple[int, Dict[str, IndexEntry]]]:
+    """Load the persisted file index of a root.
+
+    Returns:
+        Tuple of (generation, entries by relative directory), or None if nothing
+        was saved for the root or it was saved with different scan settings
+    """
+    logger.debug(f"Loading file index for {root}")
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT signature FROM file_index_roots WHERE root = ?", (root,)
+            )
+            row = cursor.fetchone()
+            if not row or row["signature"] != signature:
+                logger.debug(f"No usable file index stored for {root}")
+                return None
+
+            # Read the generation first: rows written meanwhile are re-applied
+            # by the next sync, which is harmless.
+            cursor.execute(
+                "SELECT generation FROM file_index_generations WHERE root = ?", (root,)
+            )
+            row = cursor.fetchone()
+            generation = row["generation"] if row else 0
+
+            cursor.execute(
+                "SELECT dir_path, mtime_ns, files, subdirs FROM file_index WHERE root = ?",
+                (root,),
+            )
+            entries = {
+                row["dir_path"]: (
+                    row["mtime_ns"],
+                    json.loads(row["files"]),
+                    json.loads(row["subdirs"]),
+                )
+                for row in cursor.fetchall()
+            }
+            return generation, entries
+    except (sqlite3.Error, json.JSONDecodeError) as e:
+        logger.error(f"Error loading file index for {root}: {e}", exc_info=True)
+        return None
+
+
+def get_file_index_changes(
+    db_path: Path, root: str, since_generation: int
+) -> Optional[Tuple[int, Dict[str, Optional[IndexEntry]]]]:
+    """Get the directories of a root that changed after a generation.
+
+    Returns:
+        Tuple of (current generation, entries by relative directory with None
+        for removed directories), or None if the change records no longer
+        reach back to since_generation and the whole index must be reloaded
+    """
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT generation, base_generation FROM file_index_generations WHERE root = ?",
+                (root,),
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            if since_generation < row["base_generation"]:
+                return None
+            generation = row["generation"]
+            if since_generation >= generation:
+                return generation, {}
+
+            cursor.execute(
+                "SELECT DISTINCT dir_path FROM file_index_changes WHERE root = ? AND generation > ?",
+                (root, since_generation),
+            )
+            dir_paths = [row["dir_path"] for row in cursor.fetchall()]
+            entries = _fetch_file_index_entries(cursor, root, dir_paths)
+            return generation, {
+                dir_path: entries.get(dir_path) for dir_path in dir_paths
+            }
+    except (sqlite3.Error, json.JSONDecodeError) as e:
+        logger.error(f"Error loading file index changes for {root}: {e}", exc_info=True)
+        return None
+
+
+# --- Import Graph Functions ---
+
+# Imports of a Python file as stored: (mtime_ns, size, imported file paths)
+ImportGraphEntry = Tuple[int, int, List[str]]
+
+
+def get_import_graph(db_path: Path, root: str) -> Dict[str, ImportGraphEntry]:
+    """Load the persisted imports of the Python files of a workspace root.
+
+    Returns:
+        Entries by absolute file path, empty if nothing was saved or on error
+    """
+    logger.debug(f"Loading import graph for {root}")
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT path, mtime_ns, size, imports FROM import_graph WHERE root = ?",
+                (root,),
+            )
+            return {
+                row["path"]: (row["mtime_ns"], row["size"], json.loads(row["imports"]))
+                for row in cursor.fetchall()
+            }
+    except (sqlite3.Error, json.JSONDecodeError) as e:
+        logger.error(f"Error loading import graph for {root}: {e}", exc_info=True)
+        return {}
+
+
+def update_import_graph(
+    db_path: Path,
+    root: str,
+    changed: Dict[str, ImportGraphEntry],
+    removed: List[str],
+) -> bool:
+    """Store the imports of files that were (re)parsed and forget removed files."""
+    logger.debug(
+        f"Updating import graph for {root}: {len(changed)} changed, {len(removed)} removed"
+    )
+    try:
+        with get_db_connection(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "DELETE FROM import_graph WHERE root = ? AND path = ?",
+                [(root, path) for path in removed],
+            )
+            cursor.executemany(
+                "INSERT OR REPLACE INTO import_graph (root, path, mtime_ns, size, imports) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (root, path, mtime_ns, size, json.dumps(imports))
+                    for path, (mtime_ns, size, imports) in changed.items()
+                ],
+            )
+            conn.commit()
+            return True
+    except sqlite3.Error as e:
+        logger.error(
+            f"Database error updating import graph for {root}: {e}", exc_info=True
+        )
+        return False
+
+
 # Example Usage (can be removed or put under if __name__ == "__main__")
 # if __name__ == "__main__":
 #     DB_FILE = Path("./feature_implementer.db")
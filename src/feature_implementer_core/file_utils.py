@@ -1,21 +1,182 @@
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
+import bisect
+import heapq
+import json
+import os
+import posixpath
+import sys
+import threading
 import time
 import logging
-from typing import Dict, Any, List, Union, Tuple, Optional
+import mmap
+from typing import (
+    BinaryIO,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Set,
+    Union,
+    Tuple,
+    Optional,
+)
 
-from .config import Config
+from . import database
+from .config import Config, get_app_db_path
+from .ignore_rules import IgnoreMatcher, IgnoreRules
+from .path_search import PathSearchIndex
+from .symbol_index import is_python_file, symbol_index
+from .tokenizer import count_tokens_batch
+
+
+class DirSnapshot(NamedTuple):
+    """Non-ignored entries directly inside one scanned directory.
+
+    Names are interned, so names that recur across directories (such as
+    __init__.py or index.js) are stored once.
+    """
+
+    # Directory mtime, or the mtime of its .gitignore if that is newer
+    mtime_ns: int
+    files: Tuple[str, ...]
+    subdirs: Tuple[str, ...]
+    # Size and mtime_ns of each file, flattened in the order of files
+    file_stats: "array[int]" = array("q")
+
+    def file_stat(self, position: int) -> Tuple[int, int]:
+        """Return (size, mtime_ns) of the file at a position in files."""
+        return self.file_stats[2 * position], self.file_stats[2 * position + 1]
+
+    def iter_files(self) -> Iterator[Tuple[str, int, int]]:
+        """Yield (name, size, mtime_ns) for every file."""
+        stats = self.file_stats
+        for position, name in enumerate(self.files):
+            yield name, stats[2 * position], stats[2 * position + 1]
+
+
+class DirTotals(NamedTuple):
+    """Rolled-up cost of everything indexed below a directory."""
+
+    files: int
+    size: int
+    # Exact counts where known, size-based estimates otherwise
+    tokens: int
+    # Number of files whose tokens are only estimated
+    estimated_files: int
+
+
+EMPTY_TOTALS = DirTotals(0, 0, 0, 0)
+
+
+class FileTree:
+    """The scanned directories as shown by the file explorer.
+
+    A view over the per-directory index instead of a nested dict holding
+    the absolute path of every file: names are stored once, in the
+    directory snapshots, and paths are joined on demand. Directories with
+    no files anywhere below them are hidden, based on the rolled-up totals.
+    The index and totals are shared with FileTreeCache and patched in place.
+    """
+
+    __slots__ = ("roots", "errors", "dir_index", "dir_totals")
+
+    def __init__(
+        self,
+        roots: Dict[str, str],
+        errors: Dict[str, str],
+        dir_index: Dict[str, DirSnapshot],
+        dir_totals: Dict[str, DirTotals],
+    ):
+        # Start directory name -> absolute posix path, for scanned directories
+        self.roots = roots
+        # Start directory name -> error message, for directories that failed
+        self.errors = errors
+        self.dir_index = dir_index
+        self.dir_totals = dir_totals
+
+    def __len__(self) -> int:
+        return len(self.roots) + len(self.errors)
+
+    def _has_files(self, dir_path: str) -> bool:
+        totals = self.dir_totals.get(dir_path)
+        return totals is not None and totals.files > 0
+
+    def has_directory(self, dir_path: str) -> bool:
+        """Check if a directory is part of the tree (scan roots always are)."""
+        if dir_path not in self.dir_index:
+            return False
+        root = _root_of(dir_path, self.roots.values())
+        return root is not None and (dir_path == root or self._has_files(dir_path))
+
+    def folders(self, dir_path: str) -> List[str]:
+        """Return the names of a directory's non-empty subdirectories."""
+        snapshot = self.dir_index.get(dir_path)
+        if snapshot is None:
+            return []
+        return [
+            name
+            for name in snapshot.subdirs
+            if self._has_files(posixpath.join(dir_path, name))
+        ]
+
+    def child_count(self, dir_path: str) -> int:
+        """Return the number of files and non-empty folders directly in a directory."""
+        snapshot = self.dir_index.get(dir_path)
+        if snapshot is None:
+            return 0
+        return len(snapshot.files) + len(self.folders(dir_path))
+
+    def to_dict(self, dir_path: str) -> Dict[str, Any]:
+        """Serialize a directory as a nested dict mapping file names to absolute paths."""
+        snapshot = self.dir_index.get(dir_path)
+        if snapshot is None:
+            return {}
+        entries = [(name, True) for name in self.folders(dir_path)]
+        entries.extend((name, False) for name in snapshot.files)
+        node: Dict[str, Any] = {}
+        for name, is_dir in sorted(entries):
+            child_path = posixpath.join(dir_path, name)
+            node[name] = self.to_dict(child_path) if is_dir else child_path
+        return node
 
 
 # Define a better caching structure with TTL and lock mechanism
 class FileTreeCache:
     def __init__(self, ttl_seconds: int = 300):
-        self.cache: Optional[Dict[str, Any]] = None
+        self.cache: Optional[FileTree] = None
+        # Per-directory listings keyed by absolute posix path, used to patch
+        # the tree incrementally instead of rescanning everything.
+        self.dir_index: Dict[str, DirSnapshot] = {}
+        # Rolled-up totals per indexed directory, kept in step with dir_index
+        self.dir_totals: Dict[str, DirTotals] = {}
+        # Set by file_watcher while a watcher keeps the cache current
+        self.watcher: Optional[Any] = None
+        # Set by file_watcher while another process scans the workspace: the
+        # tree is then only loaded and synced from its persisted index
+        self.follows_index: bool = False
+        # Persisted index generation per scan root that the cache reflects
+        self.generations: Dict[str, int] = {}
         self.timestamp: float = 0
-        self.scanning: bool = False
         self.ttl_seconds: int = ttl_seconds
         self.logger = logging.getLogger(__name__)
+        # Single-flight state: set while a full scan runs, waited on by
+        # callers that need its result.
+        self._lock = threading.Lock()
+        self._scan_done: Optional[threading.Event] = None
+        # Counters reported by stats()
+        self.scan_count: int = 0
+        self.last_scan_seconds: Optional[float] = None
+        self.total_scan_seconds: float = 0.0
+        self.max_scan_seconds: float = 0.0
+        self.stale_served: int = 0
+        self.scan_waits: int = 0
 
-    def get(self, force_rescan: bool = False) -> Optional[Dict[str, Any]]:
+    def get(self, force_rescan: bool = False) -> Optional[FileTree]:
         """Get the cached file tree if valid."""
         if force_rescan:
             return None
@@ -25,27 +186,229 @@ class FileTreeCache:
             return self.cache
         return None
 
-    def set(self, tree: Dict[str, Any]) -> None:
+    def set(
+        self,
+        tree: FileTree,
+        dir_index: Optional[Dict[str, DirSnapshot]] = None,
+        dir_totals: Optional[Dict[str, DirTotals]] = None,
+    ) -> None:
         """Update the cache with new data."""
         self.cache = tree
+        if dir_index is not None:
+            self.dir_index = dir_index
+        if dir_totals is not None:
+            self.dir_totals = dir_totals
         self.timestamp = time.time()
 
+    def is_live(self) -> bool:
+        """Check if a running watcher is keeping the cached tree current."""
+        return (
+            self.cache is not None
+            and self.watcher is not None
+            and self.watcher.is_alive()
+        )
+
     def is_scanning(self) -> bool:
         """Check if a scan is in progress."""
-        return self.scanning
+        return self._scan_done is not None
+
+    def begin_scan(self) -> Tuple[bool, threading.Event]:
+        """Claim the full scan, or join the one already in progress.
 
-    def set_scanning(self, is_scanning: bool) -> None:
-        """Update scanning flag."""
-        self.scanning = is_scanning
+        Returns:
+            Tuple of (True if the caller must run the scan and call end_scan,
+            event set when the scan finishes)
+        """
+        with self._lock:
+            if self._scan_done is not None:
+                return False, self._scan_done
+            self._scan_done = threading.Event()
+            return True, self._scan_done
+
+    def end_scan(self, duration_seconds: Optional[float] = None) -> None:
+        """Finish the claimed scan and wake up waiting callers."""
+        with self._lock:
+            if duration_seconds is not None:
+                self.scan_count += 1
+                self.last_scan_seconds = duration_seconds
+                self.total_scan_seconds += duration_seconds
+                self.max_scan_seconds = max(self.max_scan_seconds, duration_seconds)
+            done, self._scan_done = self._scan_done, None
+        if done is not None:
+            done.set()
+
+    def record_stale_served(self) -> None:
+        """Count a request answered with an expired tree."""
+        with self._lock:
+            self.stale_served += 1
+
+    def record_scan_wait(self) -> None:
+        """Count a request that waited for another caller's scan."""
+        with self._lock:
+            self.scan_waits += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return scan metrics for monitoring."""
+        with self._lock:
+            return {
+                "scan_count": self.scan_count,
+                "last_scan_seconds": self.last_scan_seconds,
+                "avg_scan_seconds": (
+                    self.total_scan_seconds / self.scan_count
+                    if self.scan_count
+                    else None
+                ),
+                "max_scan_seconds": self.max_scan_seconds,
+                "scanning": self._scan_done is not None,
+                "stale_served": self.stale_served,
+                "scan_waits": self.scan_waits,
+                "live": self.is_live(),
+                "cache_age_seconds": (
+                    time.time() - self.timestamp if self.cache is not None else None
+                ),
+                "directories": len(self.dir_index),
+            }
 
 
 # Initialize the cache
 file_tree_cache = FileTreeCache()
+# Built from file_tree_cache.dir_index on first search and kept in step with it
+path_search_index = PathSearchIndex()
+
+
+class FileContentCache:
+    """Process-wide LRU cache of file contents, bounded by their UTF-8 size.
+
+    Entries are keyed by (path, mtime_ns, size), so a stat is enough to tell
+    whether a cached content is still current; a changed file simply misses
+    and its old entry ages out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        # path -> (mtime_ns, size, content, encoded bytes of content)
+        self._entries: "OrderedDict[str, Tuple[int, int, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, path: str, mtime_ns: int, size: int) -> Optional[str]:
+        """Return the cached content of a file if it matches the stat."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == mtime_ns and entry[1] == size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, path: str, mtime_ns: int, size: int, content: str) -> None:
+        """Cache a file's content, evicting the least recently used ones."""
+        # Truncated files and binary placeholders cost less than their size
+        cost = len(content.encode("utf-8", errors="surrogatepass"))
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old[3]
+            self._entries[path] = (mtime_ns, size, content, cost)
+            self._bytes += cost
+            while self._bytes > self.max_bytes:
+                _, (_, _, _, evicted_cost) = self._entries.popitem(last=False)
+                self._bytes -= evicted_cost
+                self.evictions += 1
+
+    def entries(self, paths: Iterable[str]) -> Dict[str, Tuple[int, int, str]]:
+        """Return the cached (mtime_ns, size, content) of those paths cached."""
+        with self._lock:
+            return {
+                path: self._entries[path][:3] for path in paths if path in self._entries
+            }
+
+    def clear(self) -> None:
+        """Drop all cached contents."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+# Shared by file previews and prompt generation
+file_content_cache = FileContentCache(Config.CONTENT_CACHE_MAX_BYTES)
+
+
+def _decode_text(data: bytes) -> str:
+    """Decode file bytes as UTF-8 with universal newlines, like text mode."""
+    text = data.decode("utf-8", errors="replace")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _read_text_excerpt(f: BinaryIO, max_bytes: int) -> str:
+    """Read the head and tail of a large text file through mmap.
+
+    Only the excerpts are paged in. Both are cut at line boundaries and
+    joined by a marker saying how much was left out.
+    """
+    tail_bytes = int(max_bytes * TRUNCATED_TAIL_FRACTION)
+    head_bytes = max_bytes - tail_bytes
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size = len(mapped)
+        head_end = mapped.rfind(b"\n", 0, head_bytes) + 1 or head_bytes
+        tail_start = mapped.find(b"\n", size - tail_bytes) + 1 or size - tail_bytes
+        head = mapped[:head_end]
+        tail = mapped[tail_start:]
+    omitted = tail_start - head_end
+    return (
+        f"{_decode_text(head)}"
+        f"\n[... truncated: {_format_size(omitted)} of {_format_size(size)} omitted ...]\n"
+        f"{_decode_text(tail)}"
+    )
+
+
+def _read_context_text(path: str, name: str, size: int) -> str:
+    """Read a file for a prompt or preview, classifying it first.
+
+    Binary files (by extension, or a NUL byte in the first
+    BINARY_SNIFF_BYTES) are replaced by a placeholder, and text files over
+    Config.CONTEXT_FILE_MAX_BYTES by an excerpt of their head and tail.
+    """
+    binary_placeholder = f"[Binary file not included: {_format_size(size)}]"
+    if _is_binary_name(name):
+        return binary_placeholder
+    with open(path, "rb") as f:
+        head = f.read(BINARY_SNIFF_BYTES)
+        if b"\0" in head:
+            return binary_placeholder
+        if size > Config.CONTEXT_FILE_MAX_BYTES:
+            return _read_text_excerpt(f, Config.CONTEXT_FILE_MAX_BYTES)
+        return _decode_text(head + f.read())
 
 
 def read_file_content(file_path: Union[Path, str]) -> str:
     """Read content from a file safely.
 
+    Binary files come back as a placeholder and text files larger than
+    Config.CONTEXT_FILE_MAX_BYTES as a head and tail excerpt with a
+    truncation marker. Contents are served from file_content_cache while the
+    file's mtime and size are unchanged.
+
     Args:
         file_path: Path to the file to read
 
@@ -55,7 +418,16 @@ def read_file_content(file_path: Union[Path, str]) -> str:
     logger = logging.getLogger(__name__)
     try:
         path = Path(file_path) if not isinstance(file_path, Path) else file_path
-        return path.read_text()
+        key = str(path)
+        stat = os.stat(key)
+        content = file_content_cache.get(key, stat.st_mtime_ns, stat.st_size)
+        if content is None:
+            content = _read_context_text(key, path.name, stat.st_size)
+            # Only cache what was read if the file didn't change meanwhile
+            after = os.stat(key)
+            if (after.st_mtime_ns, after.st_size) == (stat.st_mtime_ns, stat.st_size):
+                file_content_cache.put(key, stat.st_mtime_ns, stat.st_size, content)
+        return content
     except FileNotFoundError:
         logger.warning(f"File not found: {file_path}")
         return ""
@@ -64,111 +436,1257 @@ def read_file_content(file_path: Union[Path, str]) -> str:
         return ""
 
 
-def get_file_tree(start_dirs: List[str], force_rescan: bool = False) -> Dict[str, Any]:
+def read_source_text(file_path: Union[Path, str]) -> str:
+    """Read the whole text of a source file, for cutting out line ranges.
+
+    Files within Config.CONTEXT_FILE_MAX_BYTES come from read_file_content
+    (and its cache); larger ones are read in full instead of as an excerpt.
+
+    Args:
+        file_path: Path to the file to read
+
+    Returns:
+        String content of the file or empty string on error
+    """
+    try:
+        if os.stat(file_path).st_size <= Config.CONTEXT_FILE_MAX_BYTES:
+            return read_file_content(file_path)
+        with open(file_path, "rb") as f:
+            return _decode_text(f.read())
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"Could not read file {file_path}: {e}")
+        return ""
+
+
+def get_mtime_ns(path: str) -> Optional[int]:
+    """Return the mtime of a path in nanoseconds, or None if it is gone."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+_ignore_matchers: Dict[Tuple[str, Tuple[str, ...], bool], IgnoreMatcher] = {}
+_ignore_matchers_lock = threading.Lock()
+
+
+def get_ignore_matcher(dir_path: str) -> IgnoreMatcher:
+    """Return the ignore matcher for a scanned directory.
+
+    Patterns are relative to the workspace root, or to the scan directory
+    for scan directories outside the workspace. Matchers are rebuilt when
+    the ignore configuration changes.
+    """
+    workspace = Config.WORKSPACE_ROOT.as_posix()
+    base = workspace
+    if _root_of(dir_path, [workspace]) is None:
+        base = _root_of(dir_path, _scan_roots()) or dir_path
+    key = (base, tuple(Config.IGNORE_PATTERNS), Config.RESPECT_GITIGNORE)
+    matcher = _ignore_matchers.get(key)
+    if matcher is None:
+        with _ignore_matchers_lock:
+            matcher = _ignore_matchers.get(key)
+            if matcher is None:
+                matcher = IgnoreMatcher(
+                    base, Config.IGNORE_PATTERNS, Config.RESPECT_GITIGNORE
+                )
+                _ignore_matchers[key] = matcher
+    return matcher
+
+
+def _list_directory(
+    dir_path: str, matcher: IgnoreMatcher, parent_rules: IgnoreRules
+) -> Tuple[Optional[DirSnapshot], IgnoreRules]:
+    """List a directory, applying the rules inherited from its parent and its own .gitignore.
+
+    Returns:
+        Tuple of (snapshot or None if the directory is gone or unreadable,
+        rules in effect for the directory's subdirectories)
+    """
+    # Stat before listing so a change made during the listing leaves a
+    # newer mtime on disk and is picked up by the next check.
+    mtime_ns = get_mtime_ns(dir_path)
+    if mtime_ns is None:
+        return None, parent_rules
+
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+        gitignore_mtime_ns = None
+        if matcher.use_gitignore:
+            for entry in entries:
+                if entry.name == ".gitignore" and entry.is_file():
+                    gitignore_mtime_ns = entry.stat().st_mtime_ns
+                    break
+        rules = matcher.extend(parent_rules, dir_path, gitignore_mtime_ns)
+        if gitignore_mtime_ns is not None and not rules.is_ignored(
+            matcher.relative_dir(dir_path) or "", ".gitignore", False
+        ):
+            # Editing a .gitignore in place leaves the directory mtime alone
+            mtime_ns = max(mtime_ns, gitignore_mtime_ns)
+        rel_dir = matcher.relative_dir(dir_path) or ""
+
+        files = []
+        subdirs = []
+        for entry in entries:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if rules.is_ignored(rel_dir, entry.name, is_dir):
+                continue
+            if is_dir:
+                subdirs.append(sys.intern(entry.name))
+            elif entry.is_file():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed while listing
+                files.append((sys.intern(entry.name), stat.st_size, stat.st_mtime_ns))
+    except OSError:
+        return None, parent_rules
+    return _make_snapshot(mtime_ns, files, subdirs), rules
+
+
+def _make_snapshot(
+    mtime_ns: int, files: List[Tuple[str, int, int]], subdirs: List[str]
+) -> DirSnapshot:
+    """Build a snapshot from unsorted (name, size, mtime_ns) files and subdirectory names."""
+    files.sort()
+    file_stats = array("q")
+    for _, size, file_mtime_ns in files:
+        file_stats.append(size)
+        file_stats.append(file_mtime_ns)
+    return DirSnapshot(
+        mtime_ns,
+        tuple(name for name, _, _ in files),
+        tuple(sorted(subdirs)),
+        file_stats,
+    )
+
+
+def snapshot_directory(dir_path: str) -> Optional[DirSnapshot]:
+    """List the non-ignored files and subdirectories directly inside a directory.
+
+    Entries are classified from the cached DirEntry type info; only files
+    are stat'ed, for their size and mtime. Ignore patterns and .gitignore
+    files are evaluated with a compiled IgnoreMatcher.
+
+    Args:
+        dir_path: Absolute posix path of the directory
+
+    Returns:
+        DirSnapshot of the directory, or None if it no longer exists or is unreadable
+    """
+    matcher = get_ignore_matcher(dir_path)
+    snapshot, _ = _list_directory(dir_path, matcher, matcher.parent_rules(dir_path))
+    return snapshot
+
+
+# Upper bound on directories listed per thread pool task
+SCAN_BATCH_SIZE = 64
+
+
+def _snapshot_batch(
+    batch: List[Tuple[str, IgnoreRules]], matcher: IgnoreMatcher
+) -> List[Tuple[str, Optional[DirSnapshot], IgnoreRules]]:
+    """Snapshot several directories in one thread pool task."""
+    return [
+        (dir_path, *_list_directory(dir_path, matcher, parent_rules))
+        for dir_path, parent_rules in batch
+    ]
+
+
+def scan_directory_index(
+    start_path: Path, max_workers: Optional[int] = None
+) -> Dict[str, DirSnapshot]:
+    """Walk a start directory and return its per-directory index.
+
+    Ignored directories are pruned and never descended into; the ignore
+    rules in effect for each directory are handed down to its children, so
+    every .gitignore is read once. Sibling subtrees are listed in parallel on
+    a thread pool (os.scandir releases the GIL while waiting on the
+    filesystem), with directories handed out in small batches so task
+    overhead stays low on fast local disks.
+
+    Args:
+        start_path: Directory to scan
+        max_workers: Thread pool size; defaults to Config.SCAN_WORKERS
+
+    Returns:
+        Mapping of absolute posix directory path to its DirSnapshot
+    """
+    workers = max_workers or Config.SCAN_WORKERS
+    root = start_path.as_posix()
+    matcher = get_ignore_matcher(root)
+    dir_index: Dict[str, DirSnapshot] = {}
+
+    if workers <= 1:
+        pending_dirs = [(root, matcher.parent_rules(root))]
+        while pending_dirs:
+            dir_path, parent_rules = pending_dirs.pop()
+            snapshot, rules = _list_directory(dir_path, matcher, parent_rules)
+            if snapshot is None:
+                continue
+            dir_index[dir_path] = snapshot
+            pending_dirs.extend(
+                (posixpath.join(dir_path, name), rules) for name in snapshot.subdirs
+            )
+        return dir_index
+
+    queue = [(root, matcher.parent_rules(root))]
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="file-scan"
+    ) as executor:
+        pending: Set[Future] = set()
+        while queue or pending:
+            # Hand out directories in batches to keep per-task overhead low,
+            # but small enough that every worker gets a share.
+            while queue and len(pending) < workers * 2:
+                batch_size = max(1, min(SCAN_BATCH_SIZE, len(queue) // workers))
+                batch = queue[-batch_size:]
+                del queue[-batch_size:]
+                pending.add(executor.submit(_snapshot_batch, batch, matcher))
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for dir_path, snapshot, rules in future.result():
+                    if snapshot is None:
+                        continue
+                    dir_index[dir_path] = snapshot
+                    queue.extend(
+                        (posixpath.join(dir_path, name), rules)
+                        for name in snapshot.subdirs
+                    )
+    return dir_index
+
+
+def _index_new_subtree(
+    dir_path: str,
+    dir_index: Dict[str, DirSnapshot],
+    added: Dict[str, DirSnapshot],
+    known_snapshots: Optional[Dict[str, Optional[DirSnapshot]]] = None,
+) -> None:
+    """Index a directory that appeared since the last scan, including its subdirectories."""
+    pending = [dir_path]
+    while pending:
+        current = pending.pop()
+        snapshot = (
+            known_snapshots.get(current)
+            if known_snapshots is not None
+            else snapshot_directory(current)
+        )
+        if snapshot is None:
+            continue
+        dir_index[current] = snapshot
+        added[current] = snapshot
+        pending.extend(posixpath.join(current, name) for name in snapshot.subdirs)
+
+
+def _drop_subtree(
+    dir_path: str, dir_index: Dict[str, DirSnapshot], removed: List[str]
+) -> None:
+    """Remove a directory and everything indexed below it."""
+    pending = [dir_path]
+    while pending:
+        current = pending.pop()
+        snapshot = dir_index.pop(current, None)
+        if snapshot is None:
+            continue
+        removed.append(current)
+        pending.extend(posixpath.join(current, name) for name in snapshot.subdirs)
+
+
+def _estimate_tokens(size: int) -> int:
+    """Rough token count of a text file from its size (about 4 bytes per token)."""
+    return size // 4
+
+
+def _is_binary_name(name: str) -> bool:
+    """Check if a file name has the extension of a known binary format."""
+    return posixpath.splitext(name)[1].lower() in Config.BINARY_EXTENSIONS
+
+
+# Lazily computed token counts by absolute posix path:
+# (size, mtime_ns, binary, tokens or None if the file was not counted)
+_file_token_counts: Dict[str, Tuple[int, int, bool, Optional[int]]] = {}
+
+
+def _file_cost(
+    path: str, name: str, size: int, mtime_ns: int
+) -> Tuple[int, bool, bool]:
+    """Return the token cost of a file version.
+
+    Returns:
+        Tuple of (tokens, True if the tokens are only estimated, binary flag)
+    """
+    counted = _file_token_counts.get(path)
+    if counted is not None and counted[:2] == (size, mtime_ns):
+        _, _, binary, tokens = counted
+        if binary:
+            return 0, False, True
+        if tokens is not None:
+            return tokens, False, False
+    elif _is_binary_name(name):
+        return 0, False, True
+    return _estimate_tokens(size), True, False
+
+
+def _indexed_file_stats(dir_path: str, name: str) -> Optional[Tuple[int, int]]:
+    """Return the indexed (size, mtime_ns) of a file, or None if it is not indexed."""
+    snapshot = file_tree_cache.dir_index.get(dir_path)
+    if snapshot is None or not snapshot.file_stats:
+        return None
+    position = bisect.bisect_left(snapshot.files, name)
+    if position == len(snapshot.files) or snapshot.files[position] != name:
+        return None
+    return snapshot.file_stat(position)
+
+
+def _sum_totals(
+    dir_path: str, snapshot: DirSnapshot, dir_totals: Dict[str, DirTotals]
+) -> DirTotals:
+    """Total a directory's own files plus the totals of its subdirectories."""
+    files = size = tokens = estimated_files = 0
+    for name, file_size, mtime_ns in snapshot.iter_files():
+        file_tokens, estimated, _ = _file_cost(
+            posixpath.join(dir_path, name), name, file_size, mtime_ns
+        )
+        files += 1
+        size += file_size
+        tokens += file_tokens
+        estimated_files += estimated
+    for name in snapshot.subdirs:
+        child = dir_totals.get(posixpath.join(dir_path, name))
+        if child is not None:
+            files += child.files
+            size += child.size
+            tokens += child.tokens
+            estimated_files += child.estimated_files
+    return DirTotals(files, size, tokens, estimated_files)
+
+
+def compute_dir_totals(dir_index: Dict[str, DirSnapshot]) -> Dict[str, DirTotals]:
+    """Roll up file counts, sizes and token costs for every indexed directory."""
+    dir_totals: Dict[str, DirTotals] = {}
+    # Deepest directories first, so children are totalled before their parents
+    for dir_path in sorted(dir_index, key=lambda path: path.count("/"), reverse=True):
+        dir_totals[dir_path] = _sum_totals(dir_path, dir_index[dir_path], dir_totals)
+    return dir_totals
+
+
+def _update_dir_totals(changed: Iterable[str], removed: Iterable[str]) -> None:
+    """Re-total changed directories and their ancestors; callers must hold _refresh_lock."""
+    dir_index = file_tree_cache.dir_index
+    dir_totals = file_tree_cache.dir_totals
+    dirty = set(changed)
+    for dir_path in removed:
+        dir_totals.pop(dir_path, None)
+        dirty.add(posixpath.dirname(dir_path))
+
+    pending = set(dirty)
+    for dir_path in dirty:
+        parent = posixpath.dirname(dir_path)
+        while parent in dir_index and parent not in pending:
+            pending.add(parent)
+            parent = posixpath.dirname(parent)
+
+    for dir_path in sorted(pending, key=lambda path: path.count("/"), reverse=True):
+        snapshot = dir_index.get(dir_path)
+        if snapshot is None:
+            dir_totals.pop(dir_path, None)
+        else:
+            dir_totals[dir_path] = _sum_totals(dir_path, snapshot, dir_totals)
+
+
+def _store_token_count(
+    path: str, size: int, mtime_ns: int, binary: bool, tokens: Optional[int]
+) -> None:
+    """Cache a file's token count and fold it into the totals of its directories."""
+    dir_path, name = posixpath.split(path)
+    with _refresh_lock:
+        indexed = _indexed_file_stats(dir_path, name) == (size, mtime_ns)
+        before_tokens, before_estimated, _ = _file_cost(path, name, size, mtime_ns)
+        _file_token_counts[path] = (size, mtime_ns, binary, tokens)
+        if not indexed:
+            return  # The totals use another version of the file
+        after_tokens, after_estimated, _ = _file_cost(path, name, size, mtime_ns)
+        delta_tokens = after_tokens - before_tokens
+        delta_estimated = after_estimated - before_estimated
+        dir_totals = file_tree_cache.dir_totals
+        current = dir_path
+        while current in dir_totals:
+            totals = dir_totals[current]
+            dir_totals[current] = totals._replace(
+                tokens=totals.tokens + delta_tokens,
+                estimated_files=totals.estimated_files + delta_estimated,
+            )
+            parent = posixpath.dirname(current)
+            if parent == current:
+                break
+            current = parent
+
+
+# Bytes read from the start of a file to tell binary from text
+BINARY_SNIFF_BYTES = 8192
+# Files whose tokens are counted together when several are requested
+TOKEN_COUNT_BATCH_FILES = 32
+# Share of Config.CONTEXT_FILE_MAX_BYTES taken from the end of a truncated file
+TRUNCATED_TAIL_FRACTION = 0.2
+
+
+def _read_countable_text(path: str, name: str, size: int) -> Tuple[bool, Optional[str]]:
+    """Read a file to classify it and return the text to count tokens of.
+
+    Returns:
+        Tuple of (binary flag, text or None if the file is not counted)
+    """
+    if _is_binary_name(name):
+        return True, None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(BINARY_SNIFF_BYTES)
+            if b"\0" in head:
+                return True, None
+            if size > Config.TOKEN_COUNT_MAX_BYTES:
+                return False, None
+            data = head + f.read()
+    except OSError as e:
+        logging.getLogger(__name__).warning(f"Could not read file {path}: {e}")
+        return False, None
+    return False, data.decode("utf-8", errors="replace")
+
+
+def _format_size(size: int) -> str:
+    """Format a byte count for display."""
+    if size < 1024:
+        return f"{size} B"
+    value = float(size)
+    for unit in ("KB", "MB", "GB"):
+        value /= 1024
+        if value < 1024 or unit == "GB":
+            break
+    return f"{value:.1f} {unit}"
+
+
+def _format_tokens(tokens: int, estimated: bool) -> str:
+    """Format a token count for display, marking estimates with "~"."""
+    text = f"{tokens / 1000:.1f}k" if tokens >= 1000 else str(tokens)
+    return f"{'~' if estimated else ''}{text} tokens"
+
+
+def _file_cost_fields(path: str, name: str, size: int, mtime_ns: int) -> Dict[str, Any]:
+    """Describe the cost of a file for the explorer."""
+    tokens, estimated, binary = _file_cost(path, name, size, mtime_ns)
+    cost = (
+        f"binary · {_format_size(size)}"
+        if binary
+        else f"{_format_size(size)} · {_format_tokens(tokens, estimated)}"
+    )
+    return {
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "binary": binary,
+        "tokens": tokens,
+        "tokens_estimated": estimated,
+        "cost": cost,
+    }
+
+
+def _totals_fields(totals: DirTotals) -> Dict[str, Any]:
+    """Describe the rolled-up cost of a directory for the explorer."""
+    estimated = totals.estimated_files > 0
+    noun = "file" if totals.files == 1 else "files"
+    return {
+        "file_count": totals.files,
+        "size": totals.size,
+        "tokens": totals.tokens,
+        "tokens_estimated": estimated,
+        "cost": (
+            f"{totals.files} {noun} · {_format_size(totals.size)} · "
+            f"{_format_tokens(totals.tokens, estimated)}"
+        ),
+    }
+
+
+def get_files_metadata(file_paths: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Return the size, mtime, binary flag and token count of indexed files.
+
+    Token counts are computed on first request, for all the files that need
+    it in one batch, and cached until a file's size or mtime changes;
+    directory totals then use them instead of the size-based estimate.
+
+    Args:
+        file_paths: Absolute posix paths of files in the cached tree
+
+    Returns:
+        Dictionary describing each file by the requested path, None for files
+        not in the tree
+    """
+    get_file_tree(Config.SCAN_DIRS)
+    stats: Dict[str, Tuple[str, str, int, int]] = {}
+    to_count: List[Tuple[str, int, int, Optional[str]]] = []
+
+    def count_pending() -> None:
+        # Encoded together on the tokenizer's thread pool
+        texts = [text for _, _, _, text in to_count if text is not None]
+        counts = iter(count_tokens_batch(texts))
+        for path, size, mtime_ns, text in to_count:
+            tokens = next(counts) if text is not None else None
+            _store_token_count(path, size, mtime_ns, False, tokens)
+        to_count.clear()
+
+    for file_path in dict.fromkeys(file_paths):
+        path = posixpath.normpath(file_path)
+        dir_path, name = posixpath.split(path)
+        if _indexed_file_stats(dir_path, name) is None:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        size, mtime_ns = stat.st_size, stat.st_mtime_ns
+        stats[file_path] = (path, name, size, mtime_ns)
+        counted = _file_token_counts.get(path)
+        if counted is None or counted[:2] != (size, mtime_ns):
+            binary, text = _read_countable_text(path, name, size)
+            if binary:
+                _store_token_count(path, size, mtime_ns, True, None)
+                continue
+            to_count.append((path, size, mtime_ns, text))
+            if len(to_count) >= TOKEN_COUNT_BATCH_FILES:
+                count_pending()
+    count_pending()
+
+    metadata: Dict[str, Optional[Dict[str, Any]]] = {}
+    for file_path in file_paths:
+        if file_path not in stats:
+            metadata[file_path] = None
+            continue
+        path, name, size, mtime_ns = stats[file_path]
+        metadata[file_path] = {
+            "name": name,
+            "path": path,
+            **_file_cost_fields(path, name, size, mtime_ns),
+        }
+    return metadata
+
+
+def get_file_metadata(file_path: str) -> Optional[Dict[str, Any]]:
+    """Return the size, mtime, binary flag and token count of an indexed file.
+
+    See get_files_metadata.
+
+    Args:
+        file_path: Absolute posix path of a file in the cached tree
+
+    Returns:
+        Dictionary describing the file, or None if it is not in the tree
+    """
+    return get_files_metadata([file_path])[file_path]
+
+
+def get_file_symbols(file_path: str) -> Optional[List[Dict[str, Any]]]:
+    """Return the classes and functions of an indexed Python file.
+
+    Each symbol can be selected as context as "path::name".
+
+    Args:
+        file_path: Absolute posix path of a file in the cached tree
+
+    Returns:
+        List of symbols (name, kind, start and end line), empty if the file
+        is not Python or doesn't parse, or None if it is not in the tree
+    """
+    dir_path, name = posixpath.split(file_path)
+    if _indexed_file_stats(dir_path, name) is None:
+        return None
+    if not is_python_file(name):
+        return []
+    return [symbol._asdict() for symbol in symbol_index.get(file_path) or []]
+
+
+def _scan_roots() -> Dict[str, str]:
+    """Map the absolute posix path of each scan directory to its tree key."""
+    return {
+        (Config.WORKSPACE_ROOT / start_dir_name).as_posix(): start_dir_name
+        for start_dir_name in Config.SCAN_DIRS
+    }
+
+
+def _root_of(dir_path: str, roots: Iterable[str]) -> Optional[str]:
+    """Return the scan root containing a directory, if any."""
+    return next(
+        (r for r in roots if dir_path == r or dir_path.startswith(r.rstrip("/") + "/")),
+        None,
+    )
+
+
+def _relative_dir(dir_path: str, root: str) -> str:
+    """Return a directory path relative to its root ('' for the root itself)."""
+    return "" if dir_path == root else posixpath.relpath(dir_path, root)
+
+
+# Bumped whenever the layout of persisted index entries changes
+FILE_INDEX_FORMAT = 2
+
+
+def _index_signature() -> str:
+    """Describe the scan settings a persisted index is only valid for."""
+    return json.dumps(
+        {
+            "format": FILE_INDEX_FORMAT,
+            "ignore_patterns": sorted(Config.IGNORE_PATTERNS),
+            "gitignore": Config.RESPECT_GITIGNORE,
+        }
+    )
+
+
+def _to_index_entry(snapshot: DirSnapshot) -> database.IndexEntry:
+    """Convert a snapshot to its persisted form."""
+    return (
+        snapshot.mtime_ns,
+        [list(file) for file in snapshot.iter_files()],
+        list(snapshot.subdirs),
+    )
+
+
+def _from_index_entry(entry: database.IndexEntry) -> DirSnapshot:
+    """Convert a persisted index entry back to a snapshot."""
+    mtime_ns, files, subdirs = entry
+    return _make_snapshot(
+        mtime_ns,
+        [
+            (sys.intern(name), size, file_mtime_ns)
+            for name, size, file_mtime_ns in files
+        ],
+        [sys.intern(name) for name in subdirs],
+    )
+
+
+def _save_file_index(root: str, dir_index: Dict[str, DirSnapshot]) -> None:
+    """Persist the full index of one scan root so the next start can skip the scan."""
+    entries = {
+        _relative_dir(dir_path, root): _to_index_entry(snapshot)
+        for dir_path, snapshot in dir_index.items()
+    }
+    generation = database.save_file_index(
+        get_app_db_path(), root, _index_signature(), entries
+    )
+    if generation is not None:
+        file_tree_cache.generations[root] = generation
+
+
+def _persist_index_changes(
+    changed: Dict[str, DirSnapshot], removed: List[str], roots: Iterable[str]
+) -> None:
+    """Write incremental index changes to the database, grouped by scan root."""
+    updates: Dict[str, Tuple[Dict[str, database.IndexEntry], List[str]]] = {}
+    for dir_path, snapshot in changed.items():
+        root = _root_of(dir_path, roots)
+        if root is not None:
+            updates.setdefault(root, ({}, []))[0][_relative_dir(dir_path, root)] = (
+                _to_index_entry(snapshot)
+            )
+    for dir_path in removed:
+        root = _root_of(dir_path, roots)
+        if root is not None:
+            updates.setdefault(root, ({}, []))[1].append(_relative_dir(dir_path, root))
+
+    for root, (root_changed, root_removed) in updates.items():
+        generation = database.update_file_index(
+            get_app_db_path(), root, root_changed, root_removed
+        )
+        if generation is not None:
+            file_tree_cache.generations[root] = generation
+
+
+def load_persisted_file_tree(start_dirs: List[str]) -> bool:
+    """Seed the cache from the file index saved by a previous run.
+
+    Args:
+        start_dirs: List of directory names to load
+
+    Returns:
+        True if every start directory had a usable persisted index
+    """
+    logger = logging.getLogger(__name__)
+    roots: Dict[str, str] = {}
+    dir_index: Dict[str, DirSnapshot] = {}
+    generations: Dict[str, int] = {}
+    for start_dir_name in start_dirs:
+        root = (Config.WORKSPACE_ROOT / start_dir_name).as_posix()
+        stored = database.get_file_index(get_app_db_path(), root, _index_signature())
+        if stored is None or "" not in stored[1]:
+            return False
+        generations[root], entries = stored
+
+        root_index = {
+            (posixpath.join(root, rel_dir) if rel_dir else root): _from_index_entry(
+                entry
+            )
+            for rel_dir, entry in entries.items()
+        }
+        dir_index.update(root_index)
+        roots[start_dir_name] = root
+
+    logger.info(f"Loaded persisted file index ({len(dir_index)} directories).")
+    dir_totals = compute_dir_totals(dir_index)
+    file_tree_cache.set(
+        FileTree(roots, {}, dir_index, dir_totals), dir_index, dir_totals
+    )
+    file_tree_cache.generations = generations
+    path_search_index.clear()
+    return True
+
+
+def sync_file_tree_from_database(start_dirs: List[str]) -> bool:
+    """Apply index changes persisted by another process to the cached tree.
+
+    Used by processes that don't scan themselves: only the directories
+    recorded as changed since the cached generation are fetched and patched
+    in, without touching the filesystem. Falls back to reloading the whole
+    persisted index if the change records no longer reach back far enough.
+
+    Args:
+        start_dirs: List of directory names to sync
+
+    Returns:
+        True if the cache is in sync with the persisted index
+    """
+    logger = logging.getLogger(__name__)
+    db_path = get_app_db_path()
+    with _refresh_lock:
+        if file_tree_cache.cache is None:
+            return load_persisted_file_tree(start_dirs)
+
+        known: Dict[str, Optional[DirSnapshot]] = {}
+        generations: Dict[str, int] = {}
+        for start_dir_name in start_dirs:
+            root = (Config.WORKSPACE_ROOT / start_dir_name).as_posix()
+            since = file_tree_cache.generations.get(root)
+            result = (
+                database.get_file_index_changes(db_path, root, since)
+                if since is not None
+                else None
+            )
+            if result is None:
+                logger.info("File index changed too much to sync; reloading it.")
+                return load_persisted_file_tree(start_dirs)
+
+            generations[root], entries = result
+            for rel_dir, entry in entries.items():
+                dir_path = posixpath.join(root, rel_dir) if rel_dir else root
+                known[dir_path] = (
+                    _from_index_entry(entry) if entry is not None else None
+                )
+
+        if known:
+            changed, removed = _refresh_directories(known, known_snapshots=known)
+            logger.debug(
+                f"Synced file index: {len(changed)} directories updated, {len(removed)} removed."
+            )
+        file_tree_cache.generations.update(generations)
+        return True
+
+
+def directory_version(
+    dir_path: str, snapshot: Optional[DirSnapshot] = None
+) -> Optional[int]:
+    """Return the on-disk counterpart of DirSnapshot.mtime_ns for a directory.
+
+    Args:
+        dir_path: Absolute posix path of the directory
+        snapshot: Indexed snapshot; its .gitignore is only checked if it lists one
+
+    Returns:
+        The directory mtime, or its .gitignore's if newer; None if the directory is gone
+    """
+    mtime_ns = get_mtime_ns(dir_path)
+    if (
+        mtime_ns is not None
+        and snapshot is not None
+        and Config.RESPECT_GITIGNORE
+        and ".gitignore" in snapshot.files
+    ):
+        gitignore_mtime_ns = get_mtime_ns(posixpath.join(dir_path, ".gitignore"))
+        if gitignore_mtime_ns is not None:
+            mtime_ns = max(mtime_ns, gitignore_mtime_ns)
+    return mtime_ns
+
+
+def find_stale_directories(dir_index: Dict[str, DirSnapshot]) -> Set[str]:
+    """Return indexed directories whose mtime on disk differs from the index."""
+    return {
+        dir_path
+        for dir_path, snapshot in list(dir_index.items())
+        if directory_version(dir_path, snapshot) != snapshot.mtime_ns
+    }
+
+
+def _gitignore_changed(
+    dir_path: str, old_snapshot: DirSnapshot, snapshot: DirSnapshot
+) -> bool:
+    """Check if a directory's .gitignore was added, edited or removed between listings."""
+    if not Config.RESPECT_GITIGNORE:
+        return False
+    if ".gitignore" not in snapshot.files:
+        return ".gitignore" in old_snapshot.files
+    # The old listing's version is at least as new as anything it saw
+    gitignore_mtime_ns = get_mtime_ns(posixpath.join(dir_path, ".gitignore"))
+    return gitignore_mtime_ns is not None and gitignore_mtime_ns > old_snapshot.mtime_ns
+
+
+def _indexed_descendants(dir_path: str, dir_index: Dict[str, DirSnapshot]) -> List[str]:
+    """Return every indexed directory below a directory."""
+    descendants = []
+    snapshot = dir_index.get(dir_path)
+    pending = (
+        [posixpath.join(dir_path, name) for name in snapshot.subdirs]
+        if snapshot
+        else []
+    )
+    while pending:
+        current = pending.pop()
+        current_snapshot = dir_index.get(current)
+        if current_snapshot is None:
+            continue
+        descendants.append(current)
+        pending.extend(
+            posixpath.join(current, name) for name in current_snapshot.subdirs
+        )
+    return descendants
+
+
+# Serializes patches to the cached tree and index (watcher, index sync)
+_refresh_lock = threading.Lock()
+
+
+def refresh_directories(
+    dirty_dirs: Iterable[str],
+) -> Tuple[Dict[str, DirSnapshot], List[str]]:
+    """Re-list changed directories and patch the cached tree accordingly.
+
+    Only the given directories are read from disk (plus any newly created
+    subdirectories), so the cost is proportional to the change rather than
+    to the size of the workspace.
+
+    Args:
+        dirty_dirs: Absolute posix paths of directories whose entries may have changed
+
+    Returns:
+        Tuple of (directories whose snapshot was added or updated, directories removed)
+    """
+    with _refresh_lock:
+        changed, removed = _refresh_directories(dirty_dirs)
+    if changed or removed:
+        _persist_index_changes(changed, removed, _scan_roots())
+    return changed, removed
+
+
+def _refresh_directories(
+    dirty_dirs: Iterable[str],
+    known_snapshots: Optional[Dict[str, Optional[DirSnapshot]]] = None,
+) -> Tuple[Dict[str, DirSnapshot], List[str]]:
+    """Patch the cached tree; callers must hold _refresh_lock.
+
+    Directories are listed from disk unless known_snapshots is given, in
+    which case their snapshots (None for removed directories) are taken
+    from it instead.
+    """
+    global file_tree_cache
+    logger = logging.getLogger(__name__)
+
+    tree = file_tree_cache.cache
+    if tree is None:
+        return {}, []
+    dir_index = file_tree_cache.dir_index
+    roots = _scan_roots()
+
+    pending = set(dirty_dirs)
+    # A vanished directory is removed through its parent's listing
+    for dir_path in list(pending) if known_snapshots is None else []:
+        if dir_path not in roots and not os.path.isdir(dir_path):
+            pending.add(posixpath.dirname(dir_path))
+
+    changed: Dict[str, DirSnapshot] = {}
+    removed: List[str] = []
+    # Parents first, so subtrees dropped by a parent are skipped below
+    queue = [(dir_path.count("/"), dir_path) for dir_path in pending]
+    heapq.heapify(queue)
+    while queue:
+        _, dir_path = heapq.heappop(queue)
+        old_snapshot = dir_index.get(dir_path)
+        if old_snapshot is None:
+            continue
+
+        snapshot = (
+            known_snapshots.get(dir_path)
+            if known_snapshots is not None
+            else snapshot_directory(dir_path)
+        )
+        if snapshot is None:
+            if dir_path in roots:
+                logger.warning(f"Scan directory disappeared: {dir_path}")
+            _drop_subtree(dir_path, dir_index, removed)
+            continue
+        if snapshot == old_snapshot:
+            continue
+
+        dir_index[dir_path] = snapshot
+        changed[dir_path] = snapshot
+        if known_snapshots is None and _gitignore_changed(
+            dir_path, old_snapshot, snapshot
+        ):
+            # The whole subtree inherits the changed rules
+            for descendant in _indexed_descendants(dir_path, dir_index):
+                if descendant not in pending:
+                    pending.add(descendant)
+                    heapq.heappush(queue, (descendant.count("/"), descendant))
+        if (snapshot.files, snapshot.subdirs) == (
+            old_snapshot.files,
+            old_snapshot.subdirs,
+        ):
+            continue  # Same entries, only mtimes or sizes moved
+
+        for name in set(old_snapshot.subdirs) - set(snapshot.subdirs):
+            _drop_subtree(posixpath.join(dir_path, name), dir_index, removed)
+        for name in set(snapshot.subdirs) - set(old_snapshot.subdirs):
+            _index_new_subtree(
+                posixpath.join(dir_path, name), dir_index, changed, known_snapshots
+            )
+
+    if changed or removed:
+        logger.debug(
+            f"Patched file index: {len(changed)} directories updated, {len(removed)} removed."
+        )
+        # The cached FileTree reads the index and totals, so it is current now
+        _update_dir_totals(changed, removed)
+        path_search_index.update(
+            {dir_path: snapshot.files for dir_path, snapshot in changed.items()},
+            removed,
+        )
+        file_tree_cache.set(tree)
+    return changed, removed
+
+
+def get_file_tree(start_dirs: List[str], force_rescan: bool = False) -> FileTree:
     """Get a hierarchical tree of files in the specified directories.
 
+    While a file watcher is running the cached tree is kept current
+    incrementally, so neither the TTL nor force_rescan trigger a full walk.
+    While another process scans the workspace, the tree is loaded from the
+    index it persisted and never scanned here.
+    Otherwise an expired tree is returned as is while a background thread
+    rescans (stale-while-revalidate). Only one full scan runs at a time:
+    callers that need a fresh tree wait for the scan in progress instead of
+    starting their own.
+
     Args:
         start_dirs: List of directory names to scan
         force_rescan: If True, ignore cache and rebuild the file tree
 
     Returns:
-        Dictionary representing the file tree structure
+        FileTree of the start directories (empty if no scan has completed)
     """
     global file_tree_cache
-    logger = logging.getLogger(__name__)
+
+    if file_tree_cache.is_live():
+        if force_rescan:
+            # Apply pending changes now instead of waiting for the watcher
+            file_tree_cache.watcher.flush()
+        return file_tree_cache.cache
+    if file_tree_cache.follows_index:
+        # Nothing loaded yet, the scanner may still be writing its index
+        sync_file_tree_from_database(start_dirs)
+        return file_tree_cache.cache or _empty_tree()
 
     # Check cache first unless force_rescan
     cached_tree = file_tree_cache.get(force_rescan)
     if cached_tree is not None:
         return cached_tree
 
-    # Prevent concurrent scans
-    if file_tree_cache.is_scanning():
-        logger.info(
-            "File scan already in progress, returning cached data or empty dict"
+    stale_tree = file_tree_cache.cache
+    if stale_tree is not None and not force_rescan:
+        file_tree_cache.record_stale_served()
+        is_owner, _ = file_tree_cache.begin_scan()
+        if is_owner:
+            threading.Thread(
+                target=_run_claimed_scan,
+                args=(list(start_dirs),),
+                name="file-tree-rescan",
+                daemon=True,
+            ).start()
+        return stale_tree
+
+    is_owner, scan_done = file_tree_cache.begin_scan()
+    if not is_owner:
+        logging.getLogger(__name__).info(
+            "File scan already in progress, waiting for it to finish"
         )
-        return file_tree_cache.cache or {}
+        file_tree_cache.record_scan_wait()
+        scan_done.wait()
+        return file_tree_cache.cache or _empty_tree()
+    return _run_claimed_scan(start_dirs)
+
+
+def _empty_tree() -> FileTree:
+    """Return a tree without any directories."""
+    return FileTree({}, {}, {}, {})
 
+
+def _run_claimed_scan(start_dirs: List[str]) -> FileTree:
+    """Run the full scan claimed with begin_scan, always releasing the claim."""
+    logger = logging.getLogger(__name__)
+    start_time = time.time()
+    duration = None
     try:
-        file_tree_cache.set_scanning(True)
+        tree = _scan_file_tree(start_dirs)
+        duration = time.time() - start_time
+        return tree
+    except Exception as e:
+        logger.error(f"File tree scan failed: {e}", exc_info=True)
+        return file_tree_cache.cache or _empty_tree()
+    finally:
+        file_tree_cache.end_scan(duration)
 
-        logger.info("Scanning file tree...")
-        tree = {}
-        start_time = time.time()
 
-        for start_dir_name in start_dirs:
-            start_path = Config.WORKSPACE_ROOT / start_dir_name
-            if not start_path.is_dir():
-                tree[start_dir_name] = {"error": f"Directory not found: {start_path}"}
-                continue
+def _scan_file_tree(start_dirs: List[str]) -> FileTree:
+    """Walk all start directories, persist their index and replace the cached tree."""
+    logger = logging.getLogger(__name__)
+    logger.info("Scanning file tree...")
+    roots: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    dir_index: Dict[str, DirSnapshot] = {}
+    start_time = time.time()
 
-            dir_tree = {}
-            try:
-                for item in sorted(start_path.rglob("*")):
-                    # Improved ignore pattern check - match exact parts only
-                    if item.name in Config.IGNORE_PATTERNS:
-                        continue
-                    if any(part in Config.IGNORE_PATTERNS for part in item.parts):
-                        continue
+    for start_dir_name in start_dirs:
+        start_path = Config.WORKSPACE_ROOT / start_dir_name
+        if not start_path.is_dir():
+            errors[start_dir_name] = f"Directory not found: {start_path}"
+            continue
 
-                    if item.is_file():
-                        relative_path = item.relative_to(start_path)
-                        current_level = dir_tree
-                        parts = list(relative_path.parts)
-
-                        for i, part in enumerate(parts):
-                            if i == len(parts) - 1:
-                                current_level[part] = (
-                                    Config.WORKSPACE_ROOT
-                                    / start_dir_name
-                                    / relative_path
-                                ).as_posix()
-                            else:
-                                if part not in current_level:
-                                    current_level[part] = {}
-                                if isinstance(current_level[part], str):
-                                    logger.warning(
-                                        f"Path conflict for {part} in {start_dir_name}"
-                                    )
-                                    continue
-                                current_level = current_level[part]
-            except Exception as e:
-                logger.error(
-                    f"Error scanning directory {start_path}: {e}", exc_info=True
-                )
-                tree[start_dir_name] = {"error": f"Error scanning: {e}"}
-                continue
+        try:
+            start_index = scan_directory_index(start_path)
+        except Exception as e:
+            logger.error(f"Error scanning directory {start_path}: {e}", exc_info=True)
+            errors[start_dir_name] = f"Error scanning: {e}"
+            continue
 
-            tree[start_dir_name] = dir_tree
+        dir_index.update(start_index)
+        roots[start_dir_name] = start_path.as_posix()
+        _save_file_index(start_path.as_posix(), start_index)
 
-        end_time = time.time()
-        logger.info(f"File tree scan completed in {end_time - start_time:.2f} seconds.")
+    end_time = time.time()
+    logger.info(f"File tree scan completed in {end_time - start_time:.2f} seconds.")
+
+    # Update cache with new tree
+    dir_totals = compute_dir_totals(dir_index)
+    tree = FileTree(roots, errors, dir_index, dir_totals)
+    file_tree_cache.set(tree, dir_index, dir_totals)
+    path_search_index.clear()
+    return tree
 
-        # Update cache with new tree
-        file_tree_cache.set(tree)
-        return tree
-    finally:
-        file_tree_cache.set_scanning(False)
 
+def list_directory_children(
+    dir_path: str, offset: int = 0, limit: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """Return one page of a directory's children from the cached file tree.
 
-def save_prompt_to_file(prompt_content: str, output_path: Union[Path, str]) -> bool:
+    Folders come first, then files, each sorted case-insensitively as the
+    explorer shows them. Folders include the number of direct children so
+    the explorer can render them without loading their contents, and every
+    entry carries its size and token cost (rolled up for folders).
+
+    Args:
+        dir_path: Absolute posix path of a directory inside a scan directory
+        offset: Index of the first child to return
+        limit: Maximum number of children; defaults to Config.FILE_TREE_PAGE_SIZE
+
+    Returns:
+        Dictionary with the page of entries and the total child count, or None
+        if the directory is not in the tree
+    """
+    limit = limit or Config.FILE_TREE_PAGE_SIZE
+    dir_path = dir_path.rstrip("/") or "/"
+    tree = get_file_tree(Config.SCAN_DIRS)
+    if not tree.has_directory(dir_path):
+        return None
+
+    snapshot = tree.dir_index[dir_path]
+    dir_totals = tree.dir_totals
+    # Files are referenced by their position in the snapshot
+    names: List[Tuple[str, int]] = [
+        (name, -1) for name in sorted(tree.folders(dir_path), key=str.lower)
+    ]
+    names.extend(
+        sorted(
+            ((name, position) for position, name in enumerate(snapshot.files)),
+            key=lambda item: item[0].lower(),
+        )
+    )
+    entries = []
+    for name, position in names[offset : offset + limit]:
+        child_path = posixpath.join(dir_path, name)
+        if position < 0:
+            entries.append(
+                {
+                    "name": name,
+                    "path": child_path,
+                    "type": "folder",
+                    "child_count": tree.child_count(child_path),
+                    **_totals_fields(dir_totals.get(child_path, EMPTY_TOTALS)),
+                }
+            )
+        else:
+            entries.append(
+                {
+                    "name": name,
+                    "path": child_path,
+                    "type": "file",
+                    **_file_cost_fields(
+                        child_path, name, *snapshot.file_stat(position)
+                    ),
+                }
+            )
+
+    return {
+        "path": dir_path,
+        "totals": _totals_fields(dir_totals.get(dir_path, EMPTY_TOTALS)),
+        "offset": offset,
+        "limit": limit,
+        "total": len(names),
+        "has_more": offset + limit < len(names),
+        "entries": entries,
+    }
+
+
+def get_top_level_listings(start_dirs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Return the first page of children of each start directory.
+
+    Args:
+        start_dirs: List of directory names
+
+    Returns:
+        Listings keyed by start directory name, or a dict with an "error" key
+        for directories that could not be scanned
+    """
+    tree = get_file_tree(start_dirs)
+    listings: Dict[str, Dict[str, Any]] = {}
+    for start_dir_name in start_dirs:
+        if start_dir_name in tree.errors:
+            listings[start_dir_name] = {"error": tree.errors[start_dir_name]}
+            continue
+        root = (Config.WORKSPACE_ROOT / start_dir_name).as_posix()
+        listing = list_directory_children(root)
+        listings[start_dir_name] = listing or {
+            "path": root,
+            "offset": 0,
+            "limit": Config.FILE_TREE_PAGE_SIZE,
+            "total": 0,
+            "has_more": False,
+            "totals": _totals_fields(EMPTY_TOTALS),
+            "entries": [],
+        }
+    return listings
+
+
+def _ensure_path_search_index() -> None:
+    """Build the path search index from the cached file index if needed."""
+    path_search_index.ensure_built(
+        lambda: [
+            (dir_path, snapshot.files)
+            for dir_path, snapshot in list(file_tree_cache.dir_index.items())
+        ],
+        Config.WORKSPACE_ROOT.as_posix(),
+    )
+
+
+# Process that started building the path search index in the background
+_search_warmup_pid: Optional[int] = None
+
+
+def warm_path_search_index() -> None:
+    """Start building the path search index in the background, once per process."""
+    global _search_warmup_pid
+    if path_search_index.is_built() or _search_warmup_pid == os.getpid():
+        return
+    _search_warmup_pid = os.getpid()
+    threading.Thread(
+        target=_ensure_path_search_index, name="path-search-index", daemon=True
+    ).start()
+
+
+def search_file_paths(query: str, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Find cached files whose name or workspace-relative path matches a query.
+
+    Matching is case-insensitive and ranked: exact file names first, then
+    name prefixes, names containing the query, paths containing it, paths
+    containing the "/"-separated parts of the query in order, and finally
+    names containing the query's characters in order ("flutl" finds
+    file_utils.py). Lookups go through a trigram index of the cached tree.
+
+    Args:
+        query: Search text
+        limit: Maximum number of results; defaults to Config.FILE_SEARCH_MAX_RESULTS
+
+    Returns:
+        Dictionary with the matching files and the total number of matches
+    """
+    limit = limit or Config.FILE_SEARCH_MAX_RESULTS
+    get_file_tree(Config.SCAN_DIRS)
+    _ensure_path_search_index()
+    matches, total = path_search_index.search(query, limit)
+    return {"results": [match._asdict() for match in matches], "total": total}
+
+
+def save_prompt_to_file(
+    prompt_content: Union[str, Iterable[str]], output_path: Union[Path, str]
+) -> bool:
     """Save the generated prompt to a file.
 
+    The prompt is written to a temporary file next to output_path, which
+    replaces output_path only once the whole prompt is written, so a failed
+    generation never leaves a truncated prompt or clobbers an existing file.
+
     Args:
-        prompt_content: Content to write to file
+        prompt_content: Content to write to file, or chunks of it (as from
+            generate_prompt_chunks), which are written as they come
         output_path: Path where to save the file
 
     Returns:
-        True if file was saved successfully, False otherwise
+        True if file was saved successfully, False if it could not be written
+
+    Raises:
+        Exception: Whatever generating the chunks raised
     """
     logger = logging.getLogger(__name__)
     output_path = Path(output_path)
     output_dir = output_path.parent
+    temp_path = output_dir / (
+        f".{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    chunks = iter(
+        [prompt_content] if isinstance(prompt_content, str) else prompt_content
+    )
+    generating = False
     try:
         output_dir.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(prompt_content)
+        with temp_path.open("w") as output_file:
+            while True:
+                generating = True
+                chunk = next(chunks, None)
+                generating = False
+                if chunk is None:
+                    break
+                output_file.write(chunk)
+        os.replace(temp_path, output_path)
         logger.info(f"Successfully generated prompt at: {output_path}")
         return True
     except Exception as e:
+        if generating:
+            raise
         logger.error(f"Error: Could not write output file {output_path}: {e}")
         return False
+    finally:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
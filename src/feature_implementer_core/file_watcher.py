@@ -0,0 +1,475 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process watches on its own
+    fcntl = None
+
+from .config import Config
+from .file_utils import (
+    DirSnapshot,
+    directory_version,
+    file_tree_cache,
+    find_stale_directories,
+    get_file_tree,
+    load_persisted_file_tree,
+    refresh_directories,
+    sync_file_tree_from_database,
+)
+
+logger = logging.getLogger(__name__)
+
+# inotify event bits, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# Structural changes, plus writes so edited .gitignore files and file sizes
+# are noticed
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class InotifyBackend:
+    """Watches every indexed directory with a Linux inotify watch."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self._wd_to_dir: Dict[int, str] = {}
+        self._dir_to_wd: Dict[str, int] = {}
+
+    def add_dir(self, dir_path: str, mtime_ns: int) -> None:
+        """Start watching a directory (no-op if already watched)."""
+        if dir_path in self._dir_to_wd:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            # ENOSPC here means fs.inotify.max_user_watches is exhausted
+            raise OSError(
+                errno, f"inotify_add_watch({dir_path}) failed: {os.strerror(errno)}"
+            )
+        self._wd_to_dir[wd] = dir_path
+        self._dir_to_wd[dir_path] = wd
+
+    def remove_dir(self, dir_path: str) -> None:
+        """Stop watching a directory."""
+        wd = self._dir_to_wd.pop(dir_path, None)
+        if wd is not None and self._wd_to_dir.pop(wd, None) is not None:
+            # Fails harmlessly if the kernel already dropped the watch
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def wait(self, timeout: float) -> bool:
+        """Block until events are available or the timeout expires."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        return bool(readable)
+
+    def read_changes(self) -> Optional[Set[str]]:
+        """Drain pending events.
+
+        Returns:
+            Set of directories whose entries changed, or None if the kernel
+            queue overflowed and events were lost
+        """
+        dirty: Set[str] = set()
+        overflowed = False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+                name_start = offset + EVENT_HEADER.size
+                offset = name_start + name_len
+                if mask & IN_Q_OVERFLOW:
+                    overflowed = True
+                    continue
+                dir_path = self._wd_to_dir.get(wd)
+                if dir_path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    # Watch removed by the kernel (directory deleted or unmounted)
+                    self._wd_to_dir.pop(wd, None)
+                    self._dir_to_wd.pop(dir_path, None)
+                dirty.add(dir_path)
+        return None if overflowed else dirty
+
+    def close(self) -> None:
+        """Release the inotify file descriptor."""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingBackend:
+    """Portable fallback that compares directory mtimes on an interval.
+
+    Adding, removing or renaming an entry updates the mtime of its parent
+    directory, so one stat per directory detects every structural change.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._mtimes: Dict[str, int] = {}
+        self._next_poll = time.monotonic() + interval_seconds
+
+    def add_dir(self, dir_path: str, mtime_ns: int) -> None:
+        """Start tracking a directory, or record its latest mtime."""
+        self._mtimes[dir_path] = mtime_ns
+
+    def remove_dir(self, dir_path: str) -> None:
+        """Stop tracking a directory."""
+        self._mtimes.pop(dir_path, None)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep until the next poll is due or the timeout expires."""
+        remaining = self._next_poll - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(remaining, timeout))
+        return time.monotonic() >= self._next_poll
+
+    def read_changes(self) -> Optional[Set[str]]:
+        """Return directories whose mtime differs from the recorded one."""
+        self._next_poll = time.monotonic() + self.interval_seconds
+        dir_index = file_tree_cache.dir_index
+        return {
+            dir_path
+            for dir_path, mtime_ns in list(self._mtimes.items())
+            if directory_version(dir_path, dir_index.get(dir_path)) != mtime_ns
+        }
+
+    def close(self) -> None:
+        """Nothing to release for polling."""
+
+
+class FileTreeWatcher(threading.Thread):
+    """Background thread that applies workspace changes to the cached file tree."""
+
+    def __init__(
+        self,
+        backend: Union[InotifyBackend, PollingBackend],
+        debounce_seconds: float = 0.2,
+    ):
+        super().__init__(name="file-tree-watcher", daemon=True)
+        self.backend = backend
+        self.debounce_seconds = debounce_seconds
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        logger.info(f"File watcher started ({type(self.backend).__name__}).")
+        try:
+            # Catch changes made since the scan, or since a persisted index
+            # loaded at startup was saved, before the subscription
+            with self._lock:
+                stale = find_stale_directories(file_tree_cache.dir_index)
+                if stale:
+                    logger.info(
+                        f"Revalidating {len(stale)} directories changed since scan."
+                    )
+                    self.apply(stale)
+        except Exception as e:
+            logger.error(f"File watcher revalidation failed: {e}", exc_info=True)
+        while not self._stop_event.is_set():
+            try:
+                if not self.backend.wait(1.0):
+                    continue
+                # Let bursts (git checkout, npm install) coalesce into one patch
+                time.sleep(self.debounce_seconds)
+                self.flush()
+            except Exception as e:
+                logger.error(f"File watcher error: {e}", exc_info=True)
+                time.sleep(1.0)
+        self.backend.close()
+        logger.info("File watcher stopped.")
+
+    def flush(self) -> None:
+        """Apply all pending changes to the cached tree synchronously."""
+        with self._lock:
+            dirty = self.backend.read_changes()
+            if dirty is None:
+                logger.warning(
+                    "File watcher event queue overflowed; revalidating all directories."
+                )
+                dirty = find_stale_directories(file_tree_cache.dir_index)
+            if dirty:
+                self.apply(dirty)
+
+    def apply(self, dirty: Set[str]) -> None:
+        """Patch the tree for the given directories and update subscriptions."""
+        changed, removed = refresh_directories(dirty)
+        for dir_path in removed:
+            self.backend.remove_dir(dir_path)
+        for dir_path, snapshot in changed.items():
+            try:
+                self.backend.add_dir(dir_path, snapshot.mtime_ns)
+            except OSError as e:
+                logger.warning(f"Cannot watch {dir_path}, changes may be missed: {e}")
+
+    def stop(self) -> None:
+        """Ask the watcher thread to exit."""
+        self._stop_event.set()
+
+
+class ScannerLock:
+    """Non-blocking file lock electing the one process that watches the workspace.
+
+    The lock is held for the lifetime of the process, so the kernel releases
+    it when the scanning process exits and another process can take over.
+    """
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self._fd: Optional[int] = None
+        if hasattr(os, "register_at_fork"):
+            # A forked child shares the descriptor but isn't the scanner
+            os.register_at_fork(after_in_child=self._forget)
+
+    def acquire(self) -> bool:
+        """Try to take the lock; True if this process holds it."""
+        if fcntl is None:
+            return True
+        if self._fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def is_held(self) -> bool:
+        """Check if this process holds the lock."""
+        return self._fd is not None
+
+    def release(self) -> None:
+        """Give up the lock so another process can become the scanner."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _forget(self) -> None:
+        # Closing the child's copy leaves the parent's lock in place
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SharedTreeFollower:
+    """Keeps a non-scanning process's tree in sync with the scanner's index.
+
+    Stands in for a watcher in FileTreeCache, so cached trees are served
+    without TTL rescans; changes are pulled from the database instead.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._next_sync = 0.0
+
+    def is_alive(self) -> bool:
+        return True
+
+    def sync_due(self) -> bool:
+        """Check if the last sync is older than the sync interval."""
+        return time.monotonic() >= self._next_sync
+
+    def flush(self) -> None:
+        """Pull the latest index changes from the database now."""
+        self._next_sync = time.monotonic() + self.interval_seconds
+        sync_file_tree_from_database(Config.SCAN_DIRS)
+
+
+def _create_backend(
+    dir_index: Dict[str, DirSnapshot],
+) -> Union[InotifyBackend, PollingBackend]:
+    """Create the configured backend and subscribe it to all indexed directories."""
+    mode = Config.FILE_WATCH_MODE
+    if mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+        backend = None
+        try:
+            backend = InotifyBackend()
+            for dir_path, snapshot in list(dir_index.items()):
+                backend.add_dir(dir_path, snapshot.mtime_ns)
+            return backend
+        except (OSError, AttributeError) as e:
+            if backend is not None:
+                backend.close()
+            logger.warning(
+                f"inotify unavailable ({e}); falling back to polling every "
+                f"{Config.FILE_WATCH_POLL_INTERVAL}s."
+            )
+    elif mode == "inotify":
+        logger.warning("inotify is only available on Linux; falling back to polling.")
+
+    backend = PollingBackend(Config.FILE_WATCH_POLL_INTERVAL)
+    for dir_path, snapshot in list(dir_index.items()):
+        backend.add_dir(dir_path, snapshot.mtime_ns)
+    return backend
+
+
+def _scanner_lock_path() -> Path:
+    """Lock file shared by all processes serving the same workspace."""
+    workspace_hash = hashlib.sha1(
+        Config.WORKSPACE_ROOT.as_posix().encode("utf-8")
+    ).hexdigest()[:12]
+    return Config.APP_DATA_DIR / f"file-scanner-{workspace_hash}.lock"
+
+
+_watcher: Optional[Union[FileTreeWatcher, SharedTreeFollower]] = None
+_watcher_lock = threading.Lock()
+_scanner_lock: Optional[ScannerLock] = None
+
+
+def _get_scanner_lock() -> ScannerLock:
+    """Return this process's handle on the workspace's scanner lock."""
+    global _scanner_lock
+    if _scanner_lock is None:
+        _scanner_lock = ScannerLock(_scanner_lock_path())
+    return _scanner_lock
+
+
+def _try_scanner_lock() -> bool:
+    """Try to take the scanner lock; True if this process may scan."""
+    try:
+        return _get_scanner_lock().acquire()
+    except OSError as e:
+        logger.warning(f"Cannot use scanner lock, scanning independently: {e}")
+        return True
+
+
+def initialize_file_tree() -> None:
+    """Seed this process's cached tree when the server starts.
+
+    Loads the file index persisted by a previous run or by the scanning
+    process. Only if there is none is the workspace scanned, and only if no
+    other process is the scanner: the scanner lock is held during the scan,
+    so one process at a time writes the index, and released afterwards,
+    since the scanner is elected among the processes serving requests (see
+    ensure_file_watcher). No thread is left running, as the caller may fork.
+    """
+    if load_persisted_file_tree(Config.SCAN_DIRS):
+        return
+    with _watcher_lock:
+        release = not _get_scanner_lock().is_held()
+        if not _try_scanner_lock():
+            logger.info("Another process scans the workspace; following its index.")
+            return
+        try:
+            logger.info("Performing initial file tree scan...")
+            get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+            logger.info("Initial file tree scan complete and cached.")
+        finally:
+            if release:
+                _get_scanner_lock().release()
+
+
+def _watcher_current() -> bool:
+    """Check if the current watcher needs no attention (caller may skip the lock)."""
+    if isinstance(_watcher, FileTreeWatcher):
+        return _watcher.is_alive()
+    if isinstance(_watcher, SharedTreeFollower):
+        return not _watcher.sync_due()
+    return False
+
+
+def ensure_file_watcher() -> Optional[Union[FileTreeWatcher, SharedTreeFollower]]:
+    """Keep this process's cached tree current, if watching is enabled.
+
+    Cheap enough to call on every request. Threads don't survive fork(), so
+    this runs in each gunicorn worker on its first request. Workers elect a
+    single scanner through a lock file: it scans the workspace if nothing
+    was loaded at startup, runs the FileTreeWatcher, which first revalidates
+    the loaded index, and persists every change to the file index. The
+    other workers never scan: they load the index and follow along by
+    applying the changed directories from the database.
+
+    Returns:
+        The watcher or follower in use, or None if watching is disabled or
+        there is nothing to watch
+    """
+    global _watcher
+    if Config.FILE_WATCH_MODE == "off":
+        return None
+    if _watcher_current():
+        return _watcher
+
+    with _watcher_lock:
+        if _watcher_current():
+            return _watcher
+
+        if _try_scanner_lock():
+            if isinstance(_watcher, SharedTreeFollower):
+                # Taking over from a scanner that exited: catch up on its
+                # persisted changes before watching the disk ourselves.
+                logger.info("Taking over file watching for the workspace.")
+                _watcher.flush()
+            file_tree_cache.follows_index = False
+            if file_tree_cache.cache is None:
+                get_file_tree(Config.SCAN_DIRS)
+            if not file_tree_cache.dir_index:
+                return None
+            backend = _create_backend(file_tree_cache.dir_index)
+            watcher = FileTreeWatcher(backend)
+            watcher.start()
+            file_tree_cache.watcher = watcher
+            _watcher = watcher
+            return watcher
+
+        if not isinstance(_watcher, SharedTreeFollower):
+            logger.info("Another process watches the workspace; following its index.")
+            _watcher = SharedTreeFollower(Config.FILE_TREE_SYNC_INTERVAL)
+            file_tree_cache.watcher = _watcher
+            file_tree_cache.follows_index = True
+        _watcher.flush()
+        return _watcher
+
+
+def stop_file_watcher() -> None:
+    """Stop the watcher for this process, reverting to TTL-based rescans."""
+    global _watcher
+    with _watcher_lock:
+        if isinstance(_watcher, FileTreeWatcher):
+            _watcher.stop()
+            _watcher.join(timeout=5)
+        if _scanner_lock is not None:
+            _scanner_lock.release()
+        _watcher = None
+        file_tree_cache.watcher = None
+        file_tree_cache.follows_index = False
@@ -0,0 +1,256 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# What a context file is in diff mode
+DIFF_CHANGED = "changed"
+DIFF_UNCHANGED = "unchanged"
+# Not in the base ref (added since, or untracked): included whole
+DIFF_NEW = "new"
+# Not in a git repository: included whole
+DIFF_UNTRACKED = "outside_repository"
+
+
+class GitDiffError(ValueError):
+    """The diff against a base ref could not be taken."""
+
+
+class FileDiff(NamedTuple):
+    """How a context file differs from the base ref."""
+
+    status: str
+    # The changed hunks, from the first "@@" line on
+    hunks: str = ""
+    added: Optional[int] = None
+    deleted: Optional[int] = None
+
+
+class DiffContext:
+    """Options for including only the changes of the context files.
+
+    Instead of their whole content, context files are included as the hunks
+    in which their working tree copy differs from base_ref, each with
+    context_lines unchanged lines around it. Files that are not in base_ref
+    yet, or not in a git repository, are included whole. The diffs are
+    taken with the local git binary, a few calls per repository covering
+    all of its files.
+
+    After load(), report lists each file's status and changed lines.
+    """
+
+    def __init__(self, base_ref: str, context_lines: Optional[int] = None):
+        base_ref = base_ref.strip()
+        if not base_ref:
+            raise ValueError("Diff base ref must not be empty")
+        if base_ref.startswith("-") or any(c.isspace() for c in base_ref):
+            raise ValueError(f"Invalid diff base ref '{base_ref}'")
+        if context_lines is None:
+            context_lines = Config.DIFF_CONTEXT_LINES
+        if context_lines < 0:
+            raise ValueError("Diff context lines must not be negative")
+        self.base_ref = base_ref
+        self.context_lines = context_lines
+        # Commit base_ref resolved to in each repository, by repository root
+        self.commits: Dict[str, str] = {}
+        self.files: Dict[Path, FileDiff] = {}
+        self.report: Optional[Dict[str, Any]] = None
+
+    def key(self) -> List[Any]:
+        """Return what the diffs depend on besides the files, for fingerprints."""
+        return [self.context_lines, sorted(self.commits.items())]
+
+    def label(self, file_path: Path) -> str:
+        """Return the header label of a file's block."""
+        file_diff = self.files.get(file_path)
+        if file_diff is None or file_diff.status == DIFF_CHANGED:
+            return f"(diff against {self.base_ref})"
+        if file_diff.status == DIFF_NEW:
+            return f"(new since {self.base_ref})"
+        return ""
+
+    def load(self, paths: Sequence[Path]) -> None:
+        """Take the diffs of the given files against the base ref.
+
+        Sets commits, files and report.
+
+        Raises:
+            GitDiffError: If git is unavailable or the base ref is unknown
+        """
+        if shutil.which("git") is None:
+            raise GitDiffError("git is not installed")
+        by_root: Dict[str, List[Path]] = {}
+        self.files = {}
+        for file_path in paths:
+            root = _repository_root(file_path.parent)
+            if root is None:
+                self.files[file_path] = FileDiff(DIFF_UNTRACKED)
+            else:
+                by_root.setdefault(root, []).append(file_path)
+        for root, files in by_root.items():
+            commit = self.commits.get(root) or _resolve_commit(root, self.base_ref)
+            self.commits[root] = commit
+            self.files.update(_diff_files(root, commit, files, self.context_lines))
+
+        statuses = [self.files[file_path].status for file_path in paths]
+        self.report = {
+            "base_ref": self.base_ref,
+            "context_lines": self.context_lines,
+            "commits": dict(self.commits),
+            "changed": statuses.count(DIFF_CHANGED),
+            "unchanged": statuses.count(DIFF_UNCHANGED),
+            "new": statuses.count(DIFF_NEW),
+            "outside_repository": statuses.count(DIFF_UNTRACKED),
+            "files": [
+                {
+                    "path": file_path.as_posix(),
+                    "status": self.files[file_path].status,
+                    "added": self.files[file_path].added,
+                    "deleted": self.files[file_path].deleted,
+                }
+                for file_path in paths
+            ],
+        }
+        logger.info(
+            f"Diffed {len(paths)} context files against {self.base_ref}: "
+            f"{self.report['changed']} changed, {self.report['unchanged']} unchanged, "
+            f"{self.report['new']} new."
+        )
+
+
+def _git(args: List[str], cwd: str) -> str:
+    """Run git in cwd and return its output.
+
+    Raises:
+        GitDiffError: If git is missing, fails or times out
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-c", "core.quotePath=false", *args],
+            cwd=cwd,
+            capture_output=True,
+            check=True,
+            timeout=Config.GIT_TIMEOUT_SECONDS,
+            # Keep prompts, pagers and the user's diff drivers out of it
+            env={**os.environ, "GIT_TERMINAL_PROMPT": "0", "GIT_PAGER": "cat"},
+        )
+    except FileNotFoundError:
+        raise GitDiffError("git is not installed")
+    except subprocess.TimeoutExpired:
+        raise GitDiffError(f"git {args[0]} timed out in {cwd}")
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode("utf-8", errors="replace").strip()
+        raise GitDiffError(f"git {args[0]} failed in {cwd}: {message}")
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+# Repository root of each directory asked about (None: not in a repository)
+_roots: Dict[str, Optional[str]] = {}
+_roots_lock = threading.Lock()
+
+
+def _repository_root(dir_path: Path) -> Optional[str]:
+    key = str(dir_path)
+    with _roots_lock:
+        if key in _roots:
+            return _roots[key]
+    try:
+        root: Optional[str] = str(
+            Path(_git(["rev-parse", "--show-toplevel"], key).strip()).resolve()
+        )
+    except GitDiffError:
+        root = None
+    with _roots_lock:
+        _roots[key] = root
+    return root
+
+
+def _resolve_commit(root: str, base_ref: str) -> str:
+    try:
+        return _git(
+            ["rev-parse", "--verify", "--quiet", f"{base_ref}^{{commit}}"], root
+        ).strip()
+    except GitDiffError:
+        raise GitDiffError(f"Unknown git ref '{base_ref}' in {root}")
+
+
+def _hunks(patch: str) -> str:
+    """Return the hunks of a file's patch, without its header lines."""
+    start = patch.find("\n@@")
+    if start == -1:
+        # No text hunks: a binary or mode-only change
+        return (
+            "[Binary file changed]"
+            if "\nBinary files " in patch
+            else "[File mode changed]"
+        )
+    return patch[start + 1 :].rstrip("\n")
+
+
+def _diff_files(
+    root: str, commit: str, files: List[Path], context_lines: int
+) -> Dict[Path, FileDiff]:
+    """Diff files of one repository against a commit, in a few git calls."""
+    paths = {file_path.relative_to(root).as_posix(): file_path for file_path in files}
+    # Literal pathspecs: file names are not taken as glob patterns
+    literal = [f":(literal){path}" for path in paths]
+    in_base = set(
+        _git(["ls-tree", "-r", "-z", "--name-only", commit, "--", *literal], root)
+        .rstrip("\0")
+        .split("\0")
+    )
+
+    # Changed lines per file, which also tells which files changed at all
+    changed: Dict[str, Any] = {}
+    numstat = _git(
+        ["diff", "--numstat", "-z", "--no-renames", commit, "--", *literal], root
+    )
+    for entry in numstat.split("\0"):
+        if entry:
+            added, deleted, path = entry.split("\t", 2)
+            changed[path] = (
+                int(added) if added != "-" else None,
+                int(deleted) if deleted != "-" else None,
+            )
+
+    patches: Dict[str, str] = {}
+    diff_args = [
+        "diff",
+        "--no-color",
+        "--no-ext-diff",
+        "--no-renames",
+        f"--unified={context_lines}",
+        commit,
+        "--",
+    ]
+    if changed:
+        output = _git(diff_args + [f":(literal){path}" for path in changed], root)
+        headers = {f"a/{path} b/{path}": path for path in changed}
+        for patch in ("\n" + output).split("\ndiff --git ")[1:]:
+            path = headers.get(patch.split("\n", 1)[0])
+            if path is not None:
+                patches[path] = patch
+        for path in changed:
+            if path not in patches:
+                # Quoted in the header (unusual characters): diff it alone
+                patches[path] = _git(diff_args + [f":(literal){path}"], root)
+
+    diffs: Dict[Path, FileDiff] = {}
+    for path, file_path in paths.items():
+        if path not in in_base:
+            diffs[file_path] = FileDiff(DIFF_NEW)
+        elif path in changed:
+            added, deleted = changed[path]
+            diffs[file_path] = FileDiff(
+                DIFF_CHANGED, _hunks(patches.get(path, "")), added, deleted
+            )
+        else:
+            diffs[file_path] = FileDiff(DIFF_UNCHANGED, added=0, deleted=0)
+    return diffs
@@ -0,0 +1,318 @@
+import logging
+import os
+import posixpath
+import re
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+GLOB_CHARS = frozenset("*?[\\")
+
+
+class IgnoreRule(NamedTuple):
+    """One compiled gitignore-style pattern."""
+
+    negate: bool
+    dir_only: bool
+    # Directory (relative to the matcher base) whose direct entries the rule
+    # applies to; None for name patterns that apply at any depth.
+    dir_key: Optional[str]
+    # Literal entry name, when the last segment has no glob characters
+    literal: Optional[str]
+    # Regex for the entry name, or for the whole relative path if full_path
+    regex: str
+    full_path: bool
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a gitignore glob into a regex (without anchors).
+
+    "*" and "?" never match "/", while "**" spans directories when it
+    forms a whole path segment ("**/x", "x/**", "a/**/b").
+    """
+    i, n = 0, len(pattern)
+    out: List[str] = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                j = i + 2
+                at_start = i == 0 or pattern[i - 1] == "/"
+                at_end = j == n or pattern[j] == "/"
+                if at_start and at_end:
+                    if j == n:
+                        out.append(".*")
+                        i = j
+                    else:
+                        out.append("(?:.*/)?")
+                        i = j + 1
+                    continue
+                out.append("[^/]*")
+                i = j
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            # A "]" right after the opening bracket is part of the set
+            j = pattern.find(
+                "]", i + 2 if pattern[i + 1 : i + 2] in ("!", "^") else i + 1
+            )
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : j].replace("\\", "\\\\").replace("[", "\\[")
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_rule(line: str, base_dir: str = "") -> Optional[IgnoreRule]:
+    """Parse one gitignore line.
+
+    Args:
+        line: Pattern line as found in a .gitignore file
+        base_dir: Directory of the .gitignore, relative to the matcher base
+
+    Returns:
+        The compiled rule, or None for blank lines and comments
+    """
+    line = line.rstrip("\r\n")
+    # Trailing spaces are dropped unless escaped
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if not line or line.startswith("#"):
+        return None
+
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+
+    if "/" not in line:
+        # A bare name matches at any depth. Rules only apply below the
+        # directory of their .gitignore, so no path prefix is needed.
+        literal = line if not GLOB_CHARS.intersection(line) else None
+        return IgnoreRule(negate, dir_only, None, literal, glob_to_regex(line), False)
+
+    # Anchored to the .gitignore directory
+    line = line.lstrip("/")
+    full = posixpath.join(base_dir, line) if base_dir else line
+    parent, _, name = full.rpartition("/")
+    if not GLOB_CHARS.intersection(parent):
+        literal = name if not GLOB_CHARS.intersection(name) else None
+        return IgnoreRule(negate, dir_only, parent, literal, glob_to_regex(name), False)
+    regex = (re.escape(base_dir) + "/" if base_dir else "") + glob_to_regex(line)
+    return IgnoreRule(negate, dir_only, None, None, regex, True)
+
+
+def _combine(regexes: List[str]) -> Optional["re.Pattern[str]"]:
+    if not regexes:
+        return None
+    return re.compile("(?:" + "|".join(regexes) + r")\Z", re.DOTALL)
+
+
+class IgnoreRules:
+    """The ignore rules in effect inside one directory, compiled for matching.
+
+    Without negated patterns every rule kind is folded into a set of literal
+    names and a single alternation regex, so an entry is checked in one
+    pass. Negations need gitignore's last-match-wins order, so rule sets
+    containing them are evaluated rule by rule.
+    """
+
+    def __init__(self, rules: Tuple[IgnoreRule, ...]):
+        self.rules = rules
+        self._ordered: Optional[List[Tuple[IgnoreRule, "re.Pattern[str]"]]] = None
+        if any(rule.negate for rule in rules):
+            self._ordered = [
+                (rule, re.compile(rule.regex + r"\Z", re.DOTALL))
+                for rule in reversed(rules)
+            ]
+            return
+
+        names: Dict[bool, set] = {False: set(), True: set()}
+        name_regexes: Dict[bool, List[str]] = {False: [], True: []}
+        path_regexes: Dict[bool, List[str]] = {False: [], True: []}
+        by_dir: Dict[str, Dict[bool, List[str]]] = {}
+        for rule in rules:
+            if rule.full_path:
+                path_regexes[rule.dir_only].append(rule.regex)
+            elif rule.dir_key is not None:
+                by_dir.setdefault(rule.dir_key, {False: [], True: []})[
+                    rule.dir_only
+                ].append(rule.regex)
+            elif rule.literal is not None:
+                names[rule.dir_only].add(rule.literal)
+            else:
+                name_regexes[rule.dir_only].append(rule.regex)
+
+        self._names: FrozenSet[str] = frozenset(names[False])
+        self._dir_names: FrozenSet[str] = frozenset(names[True])
+        self._name_re = _combine(name_regexes[False])
+        self._dir_name_re = _combine(name_regexes[True])
+        self._path_re = _combine(path_regexes[False])
+        self._dir_path_re = _combine(path_regexes[True])
+        self._by_dir = {
+            key: (_combine(kinds[False]), _combine(kinds[True]))
+            for key, kinds in by_dir.items()
+        }
+
+    def extend(self, rules: Iterable[IgnoreRule]) -> "IgnoreRules":
+        """Return a rule set with more rules that take precedence over these."""
+        rules = tuple(rules)
+        return IgnoreRules(self.rules + rules) if rules else self
+
+    def is_ignored(self, rel_dir: str, name: str, is_dir: bool) -> bool:
+        """Check an entry of a directory against the rules.
+
+        Args:
+            rel_dir: Directory containing the entry, relative to the matcher base
+            name: Entry name
+            is_dir: Whether the entry is a directory
+
+        Returns:
+            True if the entry is ignored
+        """
+        if self._ordered is not None:
+            return self._is_ignored_ordered(rel_dir, name, is_dir)
+
+        if name in self._names or (is_dir and name in self._dir_names):
+            return True
+        if self._name_re is not None and self._name_re.match(name):
+            return True
+        if is_dir and self._dir_name_re is not None and self._dir_name_re.match(name):
+            return True
+        dir_rules = self._by_dir.get(rel_dir)
+        if dir_rules is not None:
+            if dir_rules[0] is not None and dir_rules[0].match(name):
+                return True
+            if is_dir and dir_rules[1] is not None and dir_rules[1].match(name):
+                return True
+        if self._path_re is not None or self._dir_path_re is not None:
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if self._path_re is not None and self._path_re.match(rel_path):
+                return True
+            if is_dir and self._dir_path_re is not None:
+                return bool(self._dir_path_re.match(rel_path))
+        return False
+
+    def _is_ignored_ordered(self, rel_dir: str, name: str, is_dir: bool) -> bool:
+        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+        for rule, regex in self._ordered:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.full_path:
+                matched = regex.match(rel_path)
+            elif rule.dir_key is not None and rule.dir_key != rel_dir:
+                continue
+            else:
+                matched = regex.match(name)
+            if matched:
+                return not rule.negate
+        return False
+
+
+def read_gitignore(path: str, base_dir: str) -> List[IgnoreRule]:
+    """Parse a .gitignore file into rules relative to the matcher base."""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return []
+    rules = []
+    for line in lines:
+        rule = parse_rule(line, base_dir)
+        if rule is not None:
+            rules.append(rule)
+    return rules
+
+
+class IgnoreMatcher:
+    """Resolves the ignore rules for directories below a base directory.
+
+    Rules come from the configured patterns (relative to the base) and,
+    optionally, from every .gitignore between the base and the directory.
+    Rule sets are cached per directory and only rebuilt when a .gitignore
+    changes.
+    """
+
+    def __init__(self, base: str, patterns: Iterable[str], use_gitignore: bool):
+        self.base = base.rstrip("/") or "/"
+        self.use_gitignore = use_gitignore
+        rules = [parse_rule(p.replace(os.sep, "/")) for p in patterns]
+        self.base_rules = IgnoreRules(tuple(r for r in rules if r is not None))
+        # dir_path -> (.gitignore mtime, parent rules, rules)
+        self._cache: Dict[str, Tuple[Optional[int], IgnoreRules, IgnoreRules]] = {}
+
+    def relative_dir(self, dir_path: str) -> Optional[str]:
+        """Return a directory relative to the base, or None if outside it."""
+        if dir_path == self.base:
+            return ""
+        prefix = self.base if self.base.endswith("/") else self.base + "/"
+        return dir_path[len(prefix) :] if dir_path.startswith(prefix) else None
+
+    def parent_rules(self, dir_path: str) -> IgnoreRules:
+        """Return the rules inherited by a directory from its ancestors."""
+        if self.relative_dir(dir_path) in (None, ""):
+            return self.base_rules
+        return self.rules_for(posixpath.dirname(dir_path))
+
+    def rules_for(self, dir_path: str) -> IgnoreRules:
+        """Return the rules in effect for the entries of a directory."""
+        parent = self.parent_rules(dir_path)
+        if not self.use_gitignore:
+            return parent
+        try:
+            mtime_ns: Optional[int] = os.stat(
+                posixpath.join(dir_path, ".gitignore")
+            ).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        return self.extend(parent, dir_path, mtime_ns)
+
+    def extend(
+        self, parent: IgnoreRules, dir_path: str, gitignore_mtime_ns: Optional[int]
+    ) -> IgnoreRules:
+        """Add a directory's own .gitignore to the rules inherited from its parent.
+
+        Args:
+            parent: Rules in effect for the parent directory
+            dir_path: Absolute posix path of the directory
+            gitignore_mtime_ns: mtime of the directory's .gitignore, None if absent
+
+        Returns:
+            Rules for the directory's entries
+        """
+        if not self.use_gitignore or gitignore_mtime_ns is None:
+            return parent
+        rel_dir = self.relative_dir(dir_path)
+        if rel_dir is None:
+            return parent
+
+        cached = self._cache.get(dir_path)
+        if (
+            cached is not None
+            and cached[0] == gitignore_mtime_ns
+            and cached[1] is parent
+        ):
+            return cached[2]
+        rules = parent.extend(
+            read_gitignore(posixpath.join(dir_path, ".gitignore"), rel_dir)
+        )
+        self._cache[dir_path] = (gitignore_mtime_ns, parent, rules)
+        return rules
@@ -0,0 +1,293 @@
+import ast
+import logging
+import os
+import posixpath
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import database
+from .symbol_index import is_python_file
+
+logger = logging.getLogger(__name__)
+
+
+def _module_file(base: str) -> Optional[str]:
+    """Return the file a module path (without extension) refers to, if any."""
+    if os.path.isfile(base + ".py"):
+        return base + ".py"
+    init_file = posixpath.join(base, "__init__.py")
+    if os.path.isfile(init_file):
+        return init_file
+    return None
+
+
+def _search_dirs(file_path: str, root: str) -> List[str]:
+    """Return the directories an absolute import is looked up in, nearest first.
+
+    These are the file's own directory and its ancestors up to the workspace
+    root, which covers flat layouts, src/ layouts and namespace packages
+    without knowing the project's import path.
+    """
+    dirs = []
+    dir_path = posixpath.dirname(file_path)
+    while True:
+        dirs.append(dir_path)
+        if dir_path == root:
+            return dirs
+        parent = posixpath.dirname(dir_path)
+        if parent == dir_path:
+            return dirs
+        dir_path = parent
+
+
+def parse_imports(source: bytes, file_path: str, root: str) -> List[str]:
+    """List the workspace files a Python file imports.
+
+    Absolute imports are looked up from the file's directory up to the root,
+    relative ones from the file's package. For "from a import b", the
+    submodule a/b is preferred over the package a. Imports that resolve to
+    nothing in the workspace (the standard library, installed packages) are
+    left out.
+
+    Args:
+        source: Content of the file
+        file_path: Absolute posix path of the file
+        root: Absolute posix path of the workspace root
+
+    Returns:
+        Imported file paths, in the order first imported
+
+    Raises:
+        SyntaxError: If the source does not parse
+    """
+    tree = ast.parse(source)
+    if not file_path.startswith(root.rstrip("/") + "/"):
+        return []
+    search_dirs = _search_dirs(file_path, root)
+    resolved: Dict[str, Optional[str]] = {}
+
+    def find(base: str) -> Optional[str]:
+        if base not in resolved:
+            resolved[base] = _module_file(base)
+        return resolved[base]
+
+    def find_absolute(candidates: List[str]) -> Optional[str]:
+        for dir_path in search_dirs:
+            for candidate in candidates:
+                found = find(posixpath.join(dir_path, *candidate.split(".")))
+                if found:
+                    return found
+        return None
+
+    def prefixes(module: str) -> List[str]:
+        parts = module.split(".")
+        return [".".join(parts[:end]) for end in range(len(parts), 0, -1)]
+
+    imports: Dict[str, None] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                found = find_absolute(prefixes(alias.name))
+                if found:
+                    imports[found] = None
+        elif isinstance(node, ast.ImportFrom):
+            names = [alias.name for alias in node.names if alias.name != "*"]
+            if node.level:
+                base = posixpath.dirname(file_path)
+                for _ in range(node.level - 1):
+                    base = posixpath.dirname(base)
+                if node.module:
+                    base = posixpath.join(base, *node.module.split("."))
+                found_names = [find(posixpath.join(base, name)) for name in names]
+                found_any = [found for found in found_names if found]
+                if len(found_any) < len(names) or not names:
+                    found_any.append(find(base))
+            else:
+                module = node.module or ""
+                found_any = [
+                    find_absolute([f"{module}.{name}"] + prefixes(module))
+                    for name in names
+                ] or [find_absolute(prefixes(module))]
+            for found in found_any:
+                if found:
+                    imports[found] = None
+    imports.pop(file_path, None)
+    return list(imports)
+
+
+def _read_imports(path: str, root: str) -> Optional[Tuple[int, int, List[str]]]:
+    """Parse a file's imports, or return None if it is gone."""
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            source = f.read()
+    except OSError:
+        return None
+    try:
+        imports = parse_imports(source, path, root)
+    except (SyntaxError, ValueError):
+        imports = []
+    return stat.st_mtime_ns, stat.st_size, imports
+
+
+class ImportGraph:
+    """Which workspace files each Python file imports.
+
+    Loaded from the database on first use and kept in memory; a file is
+    re-parsed only when its mtime or size no longer match, and the new
+    entries are written back, so the graph is built once and then updated
+    incrementally.
+    """
+
+    def __init__(self) -> None:
+        # path -> (mtime_ns, size, imported paths)
+        self._entries: Dict[str, database.ImportGraphEntry] = {}
+        self._loaded: Optional[Tuple[str, str]] = None
+        self._lock = threading.Lock()
+        self.parsed: int = 0
+
+    def _ensure_loaded(self, db_path: Path, root: str) -> None:
+        key = (str(db_path), root)
+        if self._loaded != key:
+            self._entries = database.get_import_graph(db_path, root)
+            self._loaded = key
+            logger.debug(f"Loaded imports of {len(self._entries)} files for {root}")
+
+    def imports_of(
+        self, paths: Sequence[str], db_path: Path, root: str
+    ) -> Dict[str, Tuple[int, List[str]]]:
+        """Return the size and imports of Python files, parsing changed ones.
+
+        Args:
+            paths: Absolute posix paths of Python files
+            db_path: Database the graph is persisted in
+            root: Absolute posix path of the workspace root
+
+        Returns:
+            (size, imported paths) by path, for the files that exist
+        """
+        result: Dict[str, Tuple[int, List[str]]] = {}
+        changed: Dict[str, database.ImportGraphEntry] = {}
+        removed: List[str] = []
+        with self._lock:
+            self._ensure_loaded(db_path, root)
+            loaded = self._loaded
+            cached = {path: self._entries.get(path) for path in paths}
+        # Files are parsed without holding the lock, so other requests can
+        # read the graph meanwhile; two may parse the same file at once
+        for path, entry in cached.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if entry is not None:
+                    removed.append(path)
+                continue
+            if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                entry = _read_imports(path, root)
+                if entry is None:
+                    continue
+                changed[path] = entry
+            result[path] = (entry[1], entry[2])
+        if changed or removed:
+            with self._lock:
+                self.parsed += len(changed)
+                # Unless the graph of another database or root was loaded since
+                if self._loaded == loaded:
+                    for path in removed:
+                        self._entries.pop(path, None)
+                    self._entries.update(changed)
+            database.update_import_graph(db_path, root, changed, removed)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Return graph metrics for monitoring."""
+        with self._lock:
+            return {"files": len(self._entries), "parsed": self.parsed}
+
+
+import_graph = ImportGraph()
+
+
+class ImportExpansion:
+    """Options for adding the imports of the selected files to the context.
+
+    Python files among the selected ones are expanded with the workspace
+    files they import, then the files those import, up to max_depth levels.
+    Files are added nearest first, and skipped once their estimated tokens
+    (about 4 bytes per token) would exceed max_tokens.
+
+    After generation, report lists the files that were added and skipped.
+    """
+
+    def __init__(self, max_depth: int = 1, max_tokens: Optional[int] = None):
+        if max_depth <= 0:
+            raise ValueError("Import depth must be a positive number of levels")
+        if max_tokens is not None and max_tokens <= 0:
+            raise ValueError("Import token budget must be a positive number of tokens")
+        self.max_depth = max_depth
+        self.max_tokens = max_tokens
+        self.report: Optional[Dict[str, Any]] = None
+
+
+def expand_imports(
+    paths: Sequence[Path], expansion: ImportExpansion, db_path: Path, root: Path
+) -> List[Path]:
+    """Find the workspace files the given ones import, transitively.
+
+    Sets expansion.report.
+
+    Args:
+        paths: Selected files
+        expansion: Depth and token limits
+        db_path: Database the import graph is persisted in
+        root: Workspace root; imports outside it are not followed
+
+    Returns:
+        Imported files not among paths, nearest first
+    """
+    root_path = root.as_posix()
+    selected = list(dict.fromkeys(path.as_posix() for path in paths))
+    seen = set(selected)
+    level = [path for path in selected if is_python_file(path)]
+    added: List[Dict[str, Any]] = []
+    skipped: List[Dict[str, Any]] = []
+    tokens_left = expansion.max_tokens
+    for depth in range(1, expansion.max_depth + 1):
+        graph = import_graph.imports_of(level, db_path, root_path)
+        candidates = [
+            imported
+            for path in level
+            for imported in graph.get(path, (0, []))[1]
+            if imported not in seen
+        ]
+        candidates = list(dict.fromkeys(candidates))
+        seen.update(candidates)
+        sizes = import_graph.imports_of(candidates, db_path, root_path)
+        level = []
+        for path in candidates:
+            if path not in sizes:
+                continue
+            # Rounded up, like the explorer's size-based estimates
+            tokens = -(-sizes[path][0] // 4)
+            entry = {"path": path, "depth": depth, "tokens_estimate": tokens}
+            if tokens_left is not None and tokens > tokens_left:
+                skipped.append(entry)
+                continue
+            if tokens_left is not None:
+                tokens_left -= tokens
+            added.append(entry)
+            level.append(path)
+        if not level:
+            break
+    expansion.report = {
+        "max_depth": expansion.max_depth,
+        "max_tokens": expansion.max_tokens,
+        "added": added,
+        "skipped": skipped,
+    }
+    logger.info(
+        f"Expanded {len(paths)} context files with {len(added)} imported files "
+        f"({len(skipped)} skipped over the token budget)."
+    )
+    return [Path(entry["path"]) for entry in added]
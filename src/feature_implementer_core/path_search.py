@@ -0,0 +1,460 @@
+import heapq
+import logging
+import re
+import threading
+from array import array
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+# Characters with their own bit in a name's character mask; anything else
+# shares the last bit.
+_MASK_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_-."
+
+# Rank tiers, best first
+TIER_NAME_EXACT = 0
+TIER_NAME_PREFIX = 1
+TIER_NAME_CONTAINS = 2
+TIER_PATH_CONTAINS = 3
+TIER_PATH_PARTS = 4
+TIER_FUZZY = 5
+
+
+class PathMatch(NamedTuple):
+    """A file found by a path search."""
+
+    name: str
+    path: str
+    relative_path: str
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _char_mask(text: str) -> int:
+    mask = 0
+    for char in set(text):
+        position = _MASK_CHARS.find(char)
+        mask |= 1 << (position if position >= 0 else len(_MASK_CHARS))
+    return mask
+
+
+def _intersect(postings: Dict[str, "array[int]"], grams: Set[str]) -> Set[int]:
+    """Return the ids listed under every trigram."""
+    lists = []
+    for gram in grams:
+        ids = postings.get(gram)
+        if ids is None:
+            return set()
+        lists.append(ids)
+    lists.sort(key=len)
+    result = set(lists[0])
+    for ids in lists[1:]:
+        if not result:
+            break
+        result.intersection_update(ids)
+    return result
+
+
+def _rank(
+    query: str, parts: List[str], name: str, dir_key: str
+) -> Optional[Tuple[int, str]]:
+    """Rank a lowercase file name and directory against a query.
+
+    Returns:
+        Tuple of (tier, lowercase relative path), or None if it doesn't match
+    """
+    path = f"{dir_key}/{name}" if dir_key else name
+    if name == query:
+        return TIER_NAME_EXACT, path
+    if name.startswith(query):
+        return TIER_NAME_PREFIX, path
+    if query in name:
+        return TIER_NAME_CONTAINS, path
+    if query in path:
+        return TIER_PATH_CONTAINS, path
+    if len(parts) > 1:
+        position = -1
+        for part in parts:
+            position = path.find(part, position + 1)
+            if position == -1:
+                return None
+        return TIER_PATH_PARTS, path
+    return None
+
+
+class PathSearchIndex:
+    """Ranked file path search over the scanned directories.
+
+    Distinct lowercase file names and directory paths are indexed by trigram
+    separately, so a name shared by many files, or the path of a directory
+    with many files below it, is indexed once. Queries are split on "/"; the
+    longest part narrows the candidates through the postings and only those
+    are checked and ranked: exact name, name prefix, name substring, path
+    substring, then the parts in order. If that leaves room, file names
+    containing the query as a subsequence ("flutl" for file_utils.py) are
+    added, pre-filtered by character masks.
+
+    The index is updated per directory. Removed files leave stale ids behind,
+    which are skipped, until enough accumulate to rebuild.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._base = ""
+        self._reset()
+
+    def _reset(self) -> None:
+        self._dir_ids: Dict[str, int] = {}
+        # Absolute posix path per directory id, None once removed
+        self._dir_paths: List[Optional[str]] = []
+        # Lowercase path relative to the base per directory id
+        self._dir_keys: List[str] = []
+        # Live file ids per directory id
+        self._dir_files: List["array[int]"] = []
+        self._dir_postings: Dict[str, "array[int]"] = {}
+        # Distinct lowercase file names
+        self._name_ids: Dict[str, int] = {}
+        self._name_keys: List[str] = []
+        self._name_masks = array("Q")
+        # File ids per name id, including removed ones
+        self._name_files: List["array[int]"] = []
+        self._name_live = array("i")
+        self._name_postings: Dict[str, "array[int]"] = {}
+        # Name per file id, None once removed
+        self._file_names: List[Optional[str]] = []
+        self._file_dirs = array("i")
+        self._file_name_ids = array("i")
+        self._live_files = 0
+
+    def is_built(self) -> bool:
+        """Check if the index holds the current directories."""
+        return self._built
+
+    def clear(self) -> None:
+        """Drop the index; it is rebuilt on the next ensure_built."""
+        with self._lock:
+            self._built = False
+            self._reset()
+
+    def ensure_built(
+        self, source: Callable[[], Iterable[Tuple[str, Sequence[str]]]], base: str
+    ) -> None:
+        """Build the index unless it already is.
+
+        Args:
+            source: Returns (absolute posix directory path, file names) pairs
+            base: Directory that relative paths are reported against
+        """
+        if self._built:
+            return
+        with self._lock:
+            if not self._built:
+                self.rebuild(source(), base)
+
+    def rebuild(
+        self, directories: Iterable[Tuple[str, Sequence[str]]], base: str
+    ) -> None:
+        """Index all files from scratch.
+
+        Args:
+            directories: (absolute posix directory path, file names) pairs
+            base: Directory that relative paths are reported against
+        """
+        with self._lock:
+            self._reset()
+            self._base = base.rstrip("/")
+            for dir_path, names in directories:
+                self._set_dir_files(dir_path, names)
+            self._built = True
+            logger.debug(
+                f"Built path search index: {self._live_files} files, "
+                f"{len(self._dir_ids)} directories"
+            )
+
+    def update(self, changed: Dict[str, Sequence[str]], removed: Iterable[str]) -> None:
+        """Apply directory changes; applying the same change twice is harmless.
+
+        Args:
+            changed: File names of added or changed directories by absolute posix path
+            removed: Absolute posix paths of removed directories
+        """
+        with self._lock:
+            if not self._built:
+                return
+            for dir_path in removed:
+                self._remove_dir(dir_path)
+            for dir_path, names in changed.items():
+                self._set_dir_files(dir_path, names)
+            # Compact once stale ids outnumber live ones
+            if len(self._file_names) > 2 * self._live_files + 10_000:
+                directories = [
+                    (dir_path, [self._file_names[i] for i in self._dir_files[dir_id]])
+                    for dir_path, dir_id in self._dir_ids.items()
+                ]
+                self.rebuild(directories, self._base)
+
+    def _add_dir(self, dir_path: str) -> int:
+        dir_id = len(self._dir_paths)
+        if dir_path == self._base:
+            key = ""
+        elif dir_path.startswith(self._base + "/"):
+            key = dir_path[len(self._base) + 1 :]
+        else:
+            key = dir_path
+        key = key.lower()
+        self._dir_ids[dir_path] = dir_id
+        self._dir_paths.append(dir_path)
+        self._dir_keys.append(key)
+        self._dir_files.append(array("i"))
+        for gram in _trigrams(key):
+            self._dir_postings.setdefault(gram, array("i")).append(dir_id)
+        return dir_id
+
+    def _add_name(self, lowered: str) -> int:
+        name_id = len(self._name_keys)
+        self._name_ids[lowered] = name_id
+        self._name_keys.append(lowered)
+        self._name_masks.append(_char_mask(lowered))
+        self._name_files.append(array("i"))
+        self._name_live.append(0)
+        for gram in _trigrams(lowered):
+            self._name_postings.setdefault(gram, array("i")).append(name_id)
+        return name_id
+
+    def _add_file(self, dir_id: int, name: str) -> int:
+        file_id = len(self._file_names)
+        lowered = name.lower()
+        name_id = self._name_ids.get(lowered)
+        if name_id is None:
+            name_id = self._add_name(lowered)
+        self._file_names.append(name)
+        self._file_dirs.append(dir_id)
+        self._file_name_ids.append(name_id)
+        self._name_files[name_id].append(file_id)
+        self._name_live[name_id] += 1
+        self._live_files += 1
+        return file_id
+
+    def _drop_file(self, file_id: int) -> None:
+        self._file_names[file_id] = None
+        self._name_live[self._file_name_ids[file_id]] -= 1
+        self._live_files -= 1
+
+    def _set_dir_files(self, dir_path: str, names: Sequence[str]) -> None:
+        dir_id = self._dir_ids.get(dir_path)
+        if dir_id is None:
+            dir_id = self._add_dir(dir_path)
+        current = {self._file_names[i]: i for i in self._dir_files[dir_id]}
+        wanted = set(names)
+        file_ids = array("i")
+        for name, file_id in current.items():
+            if name in wanted:
+                file_ids.append(file_id)
+            else:
+                self._drop_file(file_id)
+        for name in names:
+            if name not in current:
+                file_ids.append(self._add_file(dir_id, name))
+        self._dir_files[dir_id] = file_ids
+
+    def _remove_dir(self, dir_path: str) -> None:
+        dir_id = self._dir_ids.pop(dir_path, None)
+        if dir_id is None:
+            return
+        for file_id in self._dir_files[dir_id]:
+            self._drop_file(file_id)
+        self._dir_files[dir_id] = array("i")
+        self._dir_paths[dir_id] = None
+
+    def _match(self, file_id: int) -> PathMatch:
+        name = self._file_names[file_id]
+        dir_path = self._dir_paths[self._file_dirs[file_id]]
+        path = f"{dir_path.rstrip('/')}/{name}"
+        if path.startswith(self._base + "/"):
+            relative = path[len(self._base) + 1 :]
+        else:
+            relative = path
+        return PathMatch(name, path, relative)
+
+    def _path_key(self, file_id: int) -> str:
+        dir_key = self._dir_keys[self._file_dirs[file_id]]
+        name_key = self._name_keys[self._file_name_ids[file_id]]
+        return f"{dir_key}/{name_key}" if dir_key else name_key
+
+    def search(self, query: str, limit: int) -> Tuple[List[PathMatch], int]:
+        """Find files matching a query, best matches first.
+
+        Within a tier, shorter names (or shallower directories, for path
+        matches) come first, then shorter paths.
+
+        Args:
+            query: Search text, case-insensitive; "/" separates parts that must
+                appear in the path in order
+            limit: Maximum number of matches to return
+
+        Returns:
+            Tuple of (matches, total number of matching files)
+        """
+        query = query.strip().lower()
+        parts = [part.strip() for part in query.split("/") if part.strip()]
+        if not parts:
+            return [], 0
+
+        with self._lock:
+            if len(parts) == 1:
+                scored, total = self._search_single(parts[0], limit)
+            else:
+                scored, total = self._search_parts(query, parts)
+            if total < limit and "/" not in query and len(query) >= 3:
+                fuzzy = self._search_fuzzy(query, {item[-1] for item in scored})
+                scored.extend(fuzzy)
+                total += len(fuzzy)
+            best = heapq.nsmallest(limit, scored)
+            return [self._match(item[-1]) for item in best], total
+
+    def _search_single(
+        self, query: str, limit: int
+    ) -> Tuple[List[Tuple[int, int, int, str, int]], int]:
+        """Search for one part, ranking only as many files as needed.
+
+        Names are ranked once for all files sharing them. Every file below a
+        directory whose path contains the query matches at the path tier, so
+        those are counted per directory and taken from the shallowest
+        directories down.
+        """
+        if len(query) >= 3:
+            grams = _trigrams(query)
+            name_ids: Iterable[int] = _intersect(self._name_postings, grams)
+            dir_ids: Iterable[int] = _intersect(self._dir_postings, grams)
+        else:
+            name_ids = range(len(self._name_keys))
+            dir_ids = range(len(self._dir_keys))
+
+        groups = []
+        for name_id in name_ids:
+            key = self._name_keys[name_id]
+            if not self._name_live[name_id] or query not in key:
+                continue
+            if key == query:
+                tier = TIER_NAME_EXACT
+            elif key.startswith(query):
+                tier = TIER_NAME_PREFIX
+            else:
+                tier = TIER_NAME_CONTAINS
+            groups.append((tier, len(key), name_id))
+        groups.sort()
+
+        matched_dirs = sorted(
+            (
+                (len(self._dir_keys[dir_id]), self._dir_keys[dir_id], dir_id)
+                for dir_id in dir_ids
+                if self._dir_paths[dir_id] is not None
+                and query in self._dir_keys[dir_id]
+            )
+        )
+        matched_dir_ids = {dir_id for _, _, dir_id in matched_dirs}
+
+        total = sum(len(self._dir_files[dir_id]) for _, _, dir_id in matched_dirs)
+        for _, _, name_id in groups:
+            for file_id in self._name_files[name_id]:
+                if (
+                    self._file_names[file_id] is not None
+                    and self._file_dirs[file_id] not in matched_dir_ids
+                ):
+                    total += 1  # Otherwise counted with its directory
+
+        # Groups and directories are in rank order, so stop once the limit is
+        # reached and the next one ranks strictly lower
+        scored: List[Tuple[int, int, int, str, int]] = []
+        last = None
+        for tier, length, name_id in groups:
+            if len(scored) >= limit and (tier, length) != last:
+                break
+            last = (tier, length)
+            for file_id in self._name_files[name_id]:
+                if self._file_names[file_id] is not None:
+                    path = self._path_key(file_id)
+                    scored.append((tier, length, len(path), path, file_id))
+
+        seen = {item[-1] for item in scored}
+        last_length = None
+        for length, dir_key, dir_id in matched_dirs:
+            if len(scored) >= limit and length != last_length:
+                break
+            last_length = length
+            for file_id in self._dir_files[dir_id]:
+                if file_id not in seen:
+                    path = self._path_key(file_id)
+                    scored.append(
+                        (TIER_PATH_CONTAINS, length, len(path), path, file_id)
+                    )
+        return scored, total
+
+    def _search_parts(
+        self, query: str, parts: List[str]
+    ) -> Tuple[List[Tuple[int, int, int, str, int]], int]:
+        """Search for several parts, checking each candidate file."""
+        candidates: Iterable[int]
+        longest = max(parts, key=len)
+        if len(longest) >= 3:
+            grams = _trigrams(longest)
+            candidate_ids: Set[int] = set()
+            for name_id in _intersect(self._name_postings, grams):
+                candidate_ids.update(self._name_files[name_id])
+            for dir_id in _intersect(self._dir_postings, grams):
+                candidate_ids.update(self._dir_files[dir_id])
+            candidates = candidate_ids
+        else:
+            candidates = range(len(self._file_names))
+
+        scored = []
+        for file_id in candidates:
+            if self._file_names[file_id] is None:
+                continue
+            name_key = self._name_keys[self._file_name_ids[file_id]]
+            dir_key = self._dir_keys[self._file_dirs[file_id]]
+            ranked = _rank(query, parts, name_key, dir_key)
+            if ranked is None:
+                continue
+            tier, path = ranked
+            length = len(name_key) if tier < TIER_PATH_CONTAINS else len(dir_key)
+            scored.append((tier, length, len(path), path, file_id))
+        return scored, len(scored)
+
+    def _search_fuzzy(
+        self, query: str, exclude: Set[int]
+    ) -> List[Tuple[int, int, int, str, int]]:
+        """Find file names containing the query's characters in order."""
+        pattern = re.compile(".*?".join(map(re.escape, query)))
+        query_mask = _char_mask(query)
+        masks = self._name_masks
+        scored = []
+        for name_id, key in enumerate(self._name_keys):
+            if (
+                masks[name_id] & query_mask != query_mask
+                or not self._name_live[name_id]
+            ):
+                continue
+            match = pattern.search(key)
+            if match is None:
+                continue
+            # Tighter matches first
+            span = match.end() - match.start()
+            for file_id in self._name_files[name_id]:
+                if self._file_names[file_id] is not None and file_id not in exclude:
+                    path = self._path_key(file_id)
+                    scored.append((TIER_FUZZY, span, len(path), path, file_id))
+        return scored
@@ -1,132 +1,767 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
+import hashlib
+import json
 import logging
-from typing import List, Union, Optional
+import os
+import threading
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-# Use database module and config function
 # from .config import Config # No longer needed directly
-from . import database
-from .config import get_app_db_path  # Needed if db_path isn't passed in
-from .file_utils import read_file_content
+from .config import Config, get_app_db_path  # Needed if db_path isn't passed in
+from .compaction import Compaction
+from .file_utils import read_file_content, read_source_text
+from .git_diff import DIFF_CHANGED, DIFF_UNCHANGED, DIFF_UNTRACKED, DiffContext
+from .import_graph import ImportExpansion, expand_imports
+from .symbol_index import extract_symbols, split_symbol_selection, symbol_index
+from .template_cache import template_cache
+from .template_engine import (
+    BUILTIN_PLACEHOLDERS,
+    Placeholder,
+    TemplateSyntaxError,
+    compiled_templates,
+    remove_section,  # noqa: F401  Re-exported; it used to be defined here
+)
+from .tokenizer import count_tokens_batch, estimate_tokens, truncate_to_tokens
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def _iter_concurrently(
+    func: Callable[[T], R], items: Iterable[T], max_workers: int
+) -> Iterator[R]:
+    """Apply func to items on a bounded thread pool, yielding results in input order.
+
+    At most max_workers results are computed ahead of the consumer, so only
+    that many are held in memory at once.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(items)), thread_name_prefix="context-read"
+    ) as executor:
+        pending: Deque[Future] = deque()
+        try:
+            for item in items:
+                if len(pending) >= max_workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(func, item))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # The consumer stopped early (e.g. a client disconnected)
+            for future in pending:
+                future.cancel()
 
 
-def gather_context(file_paths: List[Union[Path, str]]) -> str:
-    """Gather file contents for code context.
+def _resolve_selection(entry: Union[Path, str]) -> Tuple[Path, Optional[str]]:
+    path, symbol = split_symbol_selection(str(entry))
+    return Path(path).resolve(), symbol
 
-    Args:
-        file_paths: List of paths to include in the context
+
+def _resolve_context_paths(
+    file_paths: Iterable[Union[Path, str]], max_workers: int
+) -> Tuple[List[Path], Dict[Path, List[str]]]:
+    """Resolve context selections into unique file paths, in the given order.
+
+    A selection is a file path, or "path::Name" for a single class or
+    function of a Python file. Selecting a whole file overrides selecting
+    some of its symbols.
 
     Returns:
-        String with all file contents formatted with start/end markers, or empty string.
+        Tuple of (file paths, selected symbols of the files not included whole)
     """
-    logger = logging.getLogger(__name__)
-    context = []
-    # Ensure paths are Path objects and unique
+    selections = _iter_concurrently(_resolve_selection, file_paths, max_workers)
+    symbols: Dict[Path, Optional[List[str]]] = {}
+    for path, symbol in selections:
+        if symbol is None:
+            symbols[path] = None
+        elif path not in symbols:
+            symbols[path] = [symbol]
+        elif symbols[path] is not None:
+            symbols[path].append(symbol)
+    selected = {path: names for path, names in symbols.items() if names}
+    if selected:
+        # Parse the files up front, together, on the symbol index's workers
+        symbol_index.get_many([str(path) for path in selected])
+    return list(symbols), selected
+
+
+def _display_path(file_path: Path) -> str:
+    # Try to get a relative path for display (from CWD)
     try:
-        path_objects = [Path(p).resolve() for p in file_paths]
-        unique_paths = sorted(list(set(path_objects)))
+        return file_path.relative_to(Path.cwd()).as_posix()
+    except ValueError:
+        # Not relative to CWD, use absolute path
+        return file_path.as_posix()
+
+
+def _format_context_block(
+    file_path: Path, content: Optional[str], note: str = "", label: str = ""
+) -> Optional[str]:
+    """Wrap a file's content in start/end markers, or None if it can't be."""
+    label = f" {label}" if label else ""
+    if content is None:
+        # read_file_content failed (and hopefully logged the error)
+        return (
+            f"--- START FILE: {file_path.as_posix()}{label} ---\n"
+            "[Error reading file content - check logs]\n"
+            f"--- END FILE: {file_path.as_posix()} ---\n"
+        )
+    try:
+        display_path = _display_path(file_path)
+        # Strip leading/trailing whitespace of the content
+        body = content.strip()
+        if note:
+            body = f"{body}\n{note}" if body else note
+        return (
+            f"--- START FILE: {display_path}{label} ---\n"
+            f"{body}\n"
+            f"--- END FILE: {display_path} ---\n"
+        )
     except Exception as e:
-        logger.error(f"Error resolving context file paths: {file_paths} - {e}")
-        return "Error resolving context paths."
+        # Catch unexpected errors during string formatting
+        logging.getLogger(__name__).warning(
+            f"Error processing content for file {file_path}: {e}"
+        )
+        return None
+
+
+def _read_context_content(
+    file_path: Path,
+    symbols: Optional[List[str]] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> Tuple[Optional[str], str, str]:
+    """Read what the context includes of a file: all of it, some symbols, or its changes.
 
+    Selected symbols are cut out of the file in source order, using the
+    symbol index. A file that no longer parses is included whole. With
+    compaction, the content (or each symbol) is compacted. With a loaded
+    diff, files not selected by symbol are included as their changed
+    hunks, which are not compacted.
+
+    Returns:
+        Tuple of (content, header label, note to append)
+    """
+
+    def compact(text: str) -> str:
+        return compaction.compact(text, file_path.name) if compaction else text
+
+    if symbols:
+        file_symbols = symbol_index.get(str(file_path))
+        if file_symbols is not None:
+            content, missing = extract_symbols(
+                read_source_text(file_path), file_symbols, symbols, compact
+            )
+            note = f"[Symbols not found: {', '.join(missing)}]" if missing else ""
+            return content, f"(symbols: {', '.join(symbols)})", note
+    label = ""
+    note = "[Could not parse file for symbols; included whole]" if symbols else ""
+    if diff is not None and not symbols and file_path in diff.files:
+        file_diff = diff.files[file_path]
+        if file_diff.status == DIFF_CHANGED:
+            return file_diff.hunks, diff.label(file_path), ""
+        if file_diff.status == DIFF_UNCHANGED:
+            return "", "", f"[No changes against {diff.base_ref}]"
+        label = diff.label(file_path)
+        if file_diff.status == DIFF_UNTRACKED:
+            note = "[Not in a git repository; included whole]"
+    # Assumes read_file_content handles its errors
+    content = read_file_content(file_path)
+    if content and compaction:
+        content = compact(content)
+    return content, label, note
+
+
+def _read_context_block(
+    file_path: Path,
+    symbols: Optional[List[str]] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> Optional[str]:
+    content, label, note = _read_context_content(file_path, symbols, compaction, diff)
+    return _format_context_block(file_path, content, note, label)
+
+
+def _iter_context_blocks(
+    unique_paths: List[Path],
+    max_workers: int,
+    prepared: Optional[Dict[Path, str]] = None,
+    symbols: Optional[Dict[Path, List[str]]] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> Iterator[str]:
+    """Yield the code context one file at a time, blank lines between files.
+
+    Files are read on a thread pool so that slow (network) filesystems serve
+    them concurrently, but yielded in the given order. Files with a block in
+    prepared (such as truncated ones) are not read again; files in symbols
+    only contribute the selected symbols. The rest is compacted with
+    compaction, if given, or reduced to its changes with a loaded diff.
+    """
+    logger = logging.getLogger(__name__)
     logger.debug(f"Gathering context from {len(unique_paths)} unique files.")
-    for file_path in unique_paths:
-        content = read_file_content(
-            file_path
-        )  # Assumes read_file_content handles its errors
-        if content is not None:
-            try:
-                # Try to get a relative path for display (from CWD)
-                try:
-                    display_path = file_path.relative_to(Path.cwd()).as_posix()
-                except ValueError:
-                    # Not relative to CWD, use absolute path
-                    display_path = file_path.as_posix()
-
-                context.append(f"--- START FILE: {display_path} ---")
-                context.append(content.strip())  # Strip leading/trailing whitespace
-                context.append(f"--- END FILE: {display_path} ---\n")
-            except Exception as e:
-                # Catch unexpected errors during string formatting/appending
-                logger.warning(f"Error processing content for file {file_path}: {e}")
-        else:
-            # read_file_content failed (and hopefully logged the error)
-            context.append(f"--- START FILE: {file_path.as_posix()} ---")
-            context.append("[Error reading file content - check logs]")
-            context.append(f"--- END FILE: {file_path.as_posix()} ---\n")
+    prepared = prepared or {}
+    symbols = symbols or {}
+
+    def read_block(file_path: Path) -> Optional[str]:
+        if file_path in prepared:
+            return prepared[file_path]
+        return _read_context_block(file_path, symbols.get(file_path), compaction, diff)
+
+    first = True
+    for block in _iter_concurrently(read_block, unique_paths, max_workers):
+        if block is None:
+            continue
+        yield block if first else "\n" + block
+        first = False
+
+
+# How context files that don't fit a token budget are handled
+OVERFLOW_TRUNCATE = "truncate"
+OVERFLOW_DROP = "drop"
+OVERFLOW_POLICIES = (OVERFLOW_TRUNCATE, OVERFLOW_DROP)
+# Context files read and token-counted together while packing
+_PACK_BATCH_FILES = 32
+
+
+class TokenBudget:
+    """Token limit for a generated prompt, and the report of how it was met.
+
+    Context files are packed in the order they were given until the prompt
+    would exceed max_tokens. With the "truncate" policy, the first file that
+    doesn't fit is cut to the tokens left and all later ones are dropped;
+    with "drop", files that don't fit are left out and later, smaller ones
+    may still be included. Tokens are counted with the model's tiktoken
+    encoding, or estimated from the length if it is unavailable.
+
+    After generation, report describes which files were included, truncated
+    or dropped.
+    """
 
-    return "\n".join(context)
+    def __init__(
+        self,
+        max_tokens: int,
+        model: Optional[str] = None,
+        overflow: str = OVERFLOW_TRUNCATE,
+    ):
+        if max_tokens <= 0:
+            raise ValueError("Token budget must be a positive number of tokens")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy '{overflow}', expected one of: "
+                f"{', '.join(OVERFLOW_POLICIES)}"
+            )
+        self.max_tokens = max_tokens
+        self.model = model or None
+        self.overflow = overflow
+        self.report: Optional[Dict[str, Any]] = None
+
+
+def _count_tokens_batch(
+    texts: List[str], model: Optional[str]
+) -> Tuple[List[int], bool]:
+    """Return the tokens of texts and whether they are only estimates."""
+    counts = count_tokens_batch(texts, model)
+    if texts and counts[0] is None:
+        # Rounded up, so that estimates of the parts of a prompt add up to
+        # at least the estimate of the whole
+        return [estimate_tokens(text) for text in texts], True
+    return counts, False
+
+
+def _count_tokens(text: str, model: Optional[str]) -> Tuple[int, bool]:
+    """Return the tokens of a text and whether that is only an estimate."""
+    counts, estimated = _count_tokens_batch([text], model)
+    return counts[0], estimated
+
+
+def _truncated_context_block(
+    file_path: Path,
+    content: str,
+    max_tokens: int,
+    model: Optional[str],
+    label: str = "",
+) -> Optional[Tuple[str, int]]:
+    """Cut a file's block down to max_tokens, or None if not even the markers fit."""
+    note = "[... truncated to fit the token budget]"
+    overhead, _ = _count_tokens(
+        _format_context_block(file_path, "", note, label) + "\n", model
+    )
+    keep = max_tokens - overhead
+    if keep <= 0:
+        return None
+    block = _format_context_block(
+        file_path, truncate_to_tokens(content.strip(), keep, model), note, label
+    )
+    if block is None:
+        return None
+    return block, _count_tokens(block + "\n", model)[0]
 
 
-def remove_section(template: str, placeholder_name: str) -> str:
-    """Removes a markdown section containing a placeholder if the placeholder has no content.
+def _pack_context(
+    paths: List[Path],
+    budget: TokenBudget,
+    fixed_tokens: int,
+    max_workers: int,
+    symbols: Optional[Dict[Path, List[str]]] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> Tuple[List[Path], Dict[Path, str]]:
+    """Choose the context files that fit a token budget, in priority order.
 
-    This function precisely targets Markdown sections that contain the specified
-    placeholder within triple-backtick code blocks. It's designed to completely
-    remove optional sections from the generated prompt when they have no content.
+    Sets budget.report.
 
     Args:
-        template: The template content string
-        placeholder_name: The name of the placeholder to remove (without braces)
+        paths: Context files, highest priority first
+        budget: Token budget for the whole prompt
+        fixed_tokens: Tokens the prompt takes besides the context files
+        max_workers: Files read at once
+        symbols: Selected symbols of the files not included whole
+        compaction: Applied to the files before they are counted
+        diff: Loaded diff reducing the files to their changes
 
     Returns:
-        Template with the specified section removed if the placeholder was found
+        Tuple of (included files in sorted order, blocks of truncated files)
     """
-    import re
-
-    # Define specific patterns for each section type with lookahead to match
-    # everything up to the next section header or end of string
-    if placeholder_name == "jira_description":
-        pattern = re.compile(
-            r"## JIRA DESCRIPTION \(Optional\)\n\n```\n\{jira_description\}\n```\n\n(?=## |$)",
-            re.DOTALL,
-        )
-    elif placeholder_name == "additional_instructions":
-        pattern = re.compile(
-            r"## ADDITIONAL INSTRUCTIONS \(Optional\)\n\n```\n\{additional_instructions\}\n```\n\n(?=## |$)",
-            re.DOTALL,
-        )
-    elif placeholder_name == "relevant_code_context":
-        pattern = re.compile(
-            r"## RELEVANT CODE CONTEXT\n\n```\n\{relevant_code_context\}\n```\n\n(?=## |$)",
-            re.DOTALL,
+    remaining = budget.max_tokens - fixed_tokens
+    estimated = False
+    included: List[Path] = []
+    prepared: Dict[Path, str] = {}
+    files: List[Dict[str, Any]] = []
+    full = False
+    symbols = symbols or {}
+    reads = zip(
+        paths,
+        _iter_concurrently(
+            lambda p: _read_context_content(p, symbols.get(p), compaction, diff),
+            paths,
+            max_workers,
+        ),
+    )
+    # Files are counted in batches, encoded on the tokenizer's thread pool
+    while True:
+        batch = list(islice(reads, _PACK_BATCH_FILES))
+        if not batch:
+            break
+        blocks = [
+            (
+                file_path,
+                content,
+                label,
+                _format_context_block(file_path, content, note, label),
+            )
+            for file_path, (content, label, note) in batch
+        ]
+        blocks = [item for item in blocks if item[3] is not None]
+        # With the blank line that separates each from the other files
+        counts, is_estimate = _count_tokens_batch(
+            [block + "\n" for _, _, _, block in blocks], budget.model
         )
-    else:
-        # If placeholder name doesn't match a known section, return unchanged
-        return template
+        estimated = estimated or is_estimate
+        for (file_path, content, label, _), tokens in zip(blocks, counts):
+            entry = {
+                "path": _display_path(file_path),
+                "tokens": tokens,
+                "included_tokens": 0,
+                "status": "dropped",
+            }
+            if file_path in symbols:
+                entry["symbols"] = symbols[file_path]
+            files.append(entry)
+            if full:
+                continue
+            if tokens <= remaining:
+                included.append(file_path)
+                remaining -= tokens
+                entry.update(included_tokens=tokens, status="included")
+            elif budget.overflow == OVERFLOW_TRUNCATE:
+                full = True
+                truncated = None
+                if content is not None:
+                    truncated = _truncated_context_block(
+                        file_path, content, remaining, budget.model, label
+                    )
+                if truncated is not None:
+                    prepared[file_path], kept = truncated
+                    included.append(file_path)
+                    remaining -= kept
+                    entry.update(included_tokens=kept, status="truncated")
+
+    context_tokens = sum(entry["included_tokens"] for entry in files)
+    budget.report = {
+        "model": budget.model,
+        "token_budget": budget.max_tokens,
+        "overflow": budget.overflow,
+        "tokens_estimated": estimated,
+        "prompt_tokens": fixed_tokens + context_tokens,
+        "context_tokens": context_tokens,
+        "included": sum(1 for entry in files if entry["status"] == "included"),
+        "truncated": sum(1 for entry in files if entry["status"] == "truncated"),
+        "dropped": sum(1 for entry in files if entry["status"] == "dropped"),
+        "files": files,
+    }
+    logging.getLogger(__name__).info(
+        f"Packed context into {fixed_tokens + context_tokens} of "
+        f"{budget.max_tokens} tokens: {budget.report['included']} files included, "
+        f"{budget.report['truncated']} truncated, {budget.report['dropped']} dropped."
+    )
+    return sorted(included), prepared
 
-    # Remove the section entirely
-    result = re.sub(pattern, "", template)
 
-    # Cleanup: ensure we don't have excessive newlines (more than 2 consecutive)
-    result = re.sub(r"\n{3,}", "\n\n", result)
+class CachedPrompt(NamedTuple):
+    """A generated prompt and the packing report it was generated with."""
 
-    return result
+    prompt: str
+    context_report: Optional[Dict[str, Any]]
 
 
-def generate_prompt(
-    db_path: Path,  # Database path is now required
-    template_id: int,  # Template ID is now required
+class PromptCache:
+    """Process-wide LRU cache of generated prompts, bounded by total length.
+
+    Prompts are keyed by a fingerprint of everything they are generated
+    from (see prompt_fingerprint), so a changed input simply misses. While a
+    prompt is being generated, identical requests can wait for it instead of
+    generating it again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CachedPrompt]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Fingerprint -> event set once its generation finished or failed
+        self._inflight: Dict[str, threading.Event] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.coalesced: int = 0
+
+    @property
+    def max_entry_bytes(self) -> int:
+        """Longest prompt worth caching; longer ones are not collected."""
+        return self.max_bytes // 4
+
+    def get(self, fingerprint: str, count_miss: bool = True) -> Optional[CachedPrompt]:
+        """Return the cached prompt for a fingerprint, if any.
+
+        Args:
+            fingerprint: Fingerprint of the prompt's inputs
+            count_miss: Whether not finding it counts as a miss; off when
+                begin() decides next whether the request misses
+        """
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry
+
+    def put(self, fingerprint: str, entry: CachedPrompt) -> None:
+        """Cache a prompt, evicting the least recently used ones."""
+        cost = len(entry.prompt)
+        if cost > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(fingerprint, None)
+            if old is not None:
+                self._bytes -= len(old.prompt)
+            self._entries[fingerprint] = entry
+            self._bytes += cost
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.prompt)
+                self.evictions += 1
+
+    def begin(self, fingerprint: str) -> Optional[threading.Event]:
+        """Claim the generation of a prompt.
+
+        A claimed generation counts as a miss. A request that waits for
+        another one is counted as coalesced instead, and as a hit or a miss
+        by its get() once the wait is over, so each request counts once.
+
+        Returns:
+            None if the caller should generate it (and call end when done),
+            or the event to wait on while another request generates it
+        """
+        with self._lock:
+            event = self._inflight.get(fingerprint)
+            if event is not None:
+                self.coalesced += 1
+                return event
+            self.misses += 1
+            self._inflight[fingerprint] = threading.Event()
+            return None
+
+    def end(self, fingerprint: str) -> None:
+        """Release a claimed generation, waking the requests waiting for it."""
+        with self._lock:
+            event = self._inflight.pop(fingerprint, None)
+        if event is not None:
+            event.set()
+
+    def clear(self) -> None:
+        """Drop all cached prompts."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "in_progress": len(self._inflight),
+            }
+
+
+prompt_cache = PromptCache(Config.PROMPT_CACHE_MAX_BYTES)
+
+
+class PromptStream:
+    """Iterator over the chunks of a generated prompt.
+
+    fingerprint identifies the prompt's inputs, and so the prompt (it serves
+    as the ETag of /generate); cached tells whether the prompt came from
+    prompt_cache. Closing the stream before it is exhausted releases a
+    generation claimed in prompt_cache.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterator[str],
+        fingerprint: Optional[str] = None,
+        cached: bool = False,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        self._chunks = chunks
+        self.fingerprint = fingerprint
+        self.cached = cached
+        self._on_close = on_close
+
+    def __iter__(self) -> "PromptStream":
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+
+def prompt_fingerprint(
+    template_id: int,
+    template_digest: str,
+    values: Dict[str, str],
+    unique_paths: List[Path],
+    symbols: Dict[Path, List[str]],
+    budget: Optional[TokenBudget] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> str:
+    """Hash everything a prompt is generated from.
+
+    Context files count by (path, mtime, size), so an edited file changes
+    the fingerprint without being read.
+    """
+    files = []
+    for file_path in sorted(unique_paths):
+        try:
+            stat = os.stat(file_path)
+            file_stat: Optional[List[int]] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            file_stat = None
+        files.append([file_path.as_posix(), symbols.get(file_path), file_stat])
+    key = {
+        "template_id": template_id,
+        # The template's version: edits change the content hash
+        "template": template_digest,
+        # Description, instructions and the template's own placeholders
+        "values": values,
+        "files": files,
+        "budget": (
+            [budget.max_tokens, budget.model, budget.overflow] if budget else None
+        ),
+        "compaction": compaction.key() if compaction else None,
+        # The commits diffed against; the working tree counts by file stat
+        "diff": diff.key() if diff else None,
+        # Context files are shown relative to the working directory, and
+        # cut to an excerpt above the size limit
+        "cwd": os.getcwd(),
+        "context_file_max_bytes": Config.CONTEXT_FILE_MAX_BYTES,
+    }
+    return hashlib.blake2b(
+        json.dumps(key, sort_keys=True).encode("utf-8", errors="surrogatepass"),
+        digest_size=16,
+    ).hexdigest()
+
+
+def gather_context(
+    file_paths: List[Union[Path, str]],
+    max_workers: Optional[int] = None,
+    compaction: Optional[Compaction] = None,
+    diff: Optional[DiffContext] = None,
+) -> str:
+    """Gather file contents for code context.
+
+    Paths are resolved and files read on a thread pool so that slow
+    (network) filesystems serve them concurrently; the output keeps the
+    sorted path order.
+
+    Args:
+        file_paths: List of paths to include in the context; "path::Name"
+            includes just that class or function of a Python file
+        max_workers: Files read at once; defaults to Config.CONTEXT_READ_WORKERS
+        compaction: Strategies compacting the file contents
+        diff: Include only the changes of the files against a git ref; its
+            report is set on return
+
+    Returns:
+        String with all file contents formatted with start/end markers, or empty string.
+
+    Raises:
+        GitDiffError: If the diff against the base ref cannot be taken
+    """
+    logger = logging.getLogger(__name__)
+    workers = max_workers or Config.CONTEXT_READ_WORKERS
+    # Ensure paths are Path objects and unique
+    try:
+        unique_paths, symbols = _resolve_context_paths(file_paths, workers)
+    except Exception as e:
+        logger.error(f"Error resolving context file paths: {file_paths} - {e}")
+        return "Error resolving context paths."
+    if diff is not None:
+        diff.load([path for path in unique_paths if path not in symbols])
+
+    return "".join(
+        _iter_context_blocks(
+            sorted(unique_paths),
+            workers,
+            symbols=symbols,
+            compaction=compaction,
+            diff=diff,
+        )
+    )
+
+
+def _read_text_input(value: str, description: str) -> str:
+    """Return the text of a file if value is a path to one, else value itself."""
+    logger = logging.getLogger(__name__)
+    if not value:
+        return ""
+    try:
+        path = Path(value)
+        if path.is_file():
+            logger.debug(f"Reading {description} from file: {path}")
+            content = read_file_content(path)
+            if content is not None:
+                return content
+            logger.warning(f"Could not read {description} file: {path}")
+            return ""
+        # Not a file path, use the string directly
+        return value
+    except Exception as e:
+        # Handle potential errors from Path() creation if input is weird
+        logger.warning(
+            f"Could not interpret {description} '{value}' as path or string: {e}"
+        )
+        return value  # Fallback to using as string
+
+
+def generate_prompt_chunks(
+    db_path: Path,
+    template_id: int,
     context_files: List[Union[Path, str]] = [],
     jira_description: str = "",
     additional_instructions: str = "",
-) -> Optional[str]:  # Return None on failure
-    """Generate a complete implementation prompt using a template from the database.
+    max_workers: Optional[int] = None,
+    budget: Optional[TokenBudget] = None,
+    imports: Optional[ImportExpansion] = None,
+    compaction: Optional[Compaction] = None,
+    template_values: Optional[Dict[str, str]] = None,
+    diff: Optional[DiffContext] = None,
+) -> Optional[PromptStream]:
+    """Generate a prompt as a stream of chunks, in template order.
+
+    The template, description and instructions are prepared up front; the
+    code context is then read and yielded one file at a time, so the whole
+    prompt is never held in memory. Joining the chunks gives the same text
+    as generate_prompt.
+
+    Prompts are cached in prompt_cache under a fingerprint of their inputs
+    (see prompt_fingerprint), which the returned stream carries. A request
+    for a prompt that an identical request is still generating waits for
+    that one to finish instead of generating it again.
+
+    With an import expansion, the workspace files the selected Python files
+    import are added after them, and imports.report is set. With a token
+    budget, the context files are packed into it (in the order given)
+    before streaming starts, and budget.report is set. With a diff, the
+    files not selected by symbol are diffed against its base ref up front
+    and included as their changed hunks, and diff.report is set.
 
     Args:
         db_path: Path to the SQLite database file.
         template_id: ID of the template in the database.
-        context_files: List of paths to include as code context.
+        context_files: List of paths to include as code context; "path::Name"
+            includes just that class or function of a Python file.
         jira_description: JIRA ticket description text (or path to file containing it).
         additional_instructions: Additional instructions (or path to file containing it).
+        max_workers: Context files read at once; defaults to Config.CONTEXT_READ_WORKERS
+        budget: Token budget to pack the context files into
+        imports: How far to follow the imports of the selected files
+        compaction: Strategies compacting the context files
+        template_values: Values of the template's own placeholders, by
+            name; sections of those without a value are left out
+        diff: Include only the changes of the context files against a git ref
 
     Returns:
-        Complete formatted prompt string, or None if the template cannot be loaded.
+        Stream of the prompt's chunks, or None if the template cannot be loaded.
+
+    Raises:
+        GitDiffError: If the diff against the base ref cannot be taken
     """
     logger = logging.getLogger(__name__)
     logger.info(f"Generating prompt using template ID: {template_id}")
 
     # --- Get Template Content ---
-    template_data = database.get_template_by_id(db_path, template_id)
+    template_data = template_cache.get_template_by_id(db_path, template_id)
     if (
         not template_data
         or "content" not in template_data
@@ -137,121 +772,231 @@ def generate_prompt(
         )
         return None  # Indicate failure to load template
 
-    template_content_final = template_data["content"]
+    template_content = template_data["content"]
     logger.debug(
         f"Loaded template '{template_data.get('name', '?')}' (ID: {template_id})"
     )
 
-    # --- Process Jira Description ---
-    jira_description_final = ""
-    if jira_description:
-        try:
-            jira_path = Path(jira_description)
-            if jira_path.is_file():
-                logger.debug(f"Reading Jira description from file: {jira_path}")
-                jira_content = read_file_content(jira_path)
-                if jira_content is not None:
-                    jira_description_final = jira_content
-                else:
-                    logger.warning(f"Could not read Jira description file: {jira_path}")
-            else:
-                # Not a file path, use the string directly
-                jira_description_final = jira_description
-        except Exception as e:
-            # Handle potential errors from Path() creation if input is weird
-            logger.warning(
-                f"Could not interpret jira_description '{jira_description}' as path or string: {e}"
-            )
-            jira_description_final = jira_description  # Fallback to using as string
-
-    # --- Process Additional Instructions ---
-    additional_instructions_final = ""
-    if additional_instructions:
-        try:
-            instr_path = Path(additional_instructions)
-            if instr_path.is_file():
-                logger.debug(f"Reading instructions from file: {instr_path}")
-                instr_content = read_file_content(instr_path)
-                if instr_content is not None:
-                    additional_instructions_final = instr_content
-                else:
-                    logger.warning(f"Could not read instructions file: {instr_path}")
-            else:
-                # Not a file path, use the string directly
-                additional_instructions_final = additional_instructions
-        except Exception as e:
-            logger.warning(
-                f"Could not interpret additional_instructions '{additional_instructions}' as path or string: {e}"
-            )
-            additional_instructions_final = (
-                additional_instructions  # Fallback to using as string
-            )
-
-    # --- Gather Context ---
-    relevant_code_context = gather_context(context_files)
+    jira_description_final = _read_text_input(jira_description, "Jira description")
+    additional_instructions_final = _read_text_input(
+        additional_instructions, "instructions"
+    )
 
-    # --- Format Final Prompt ---
+    # --- Resolve Context Files (read while streaming) ---
+    workers = max_workers or Config.CONTEXT_READ_WORKERS
+    context_error = None
+    unique_paths: List[Path] = []
+    symbols: Dict[Path, List[str]] = {}
     try:
-        final_prompt = template_content_final
-
-        # Check if sections should be included or removed
-        has_context = bool(relevant_code_context and relevant_code_context.strip())
-        has_jira = bool(jira_description_final and jira_description_final.strip())
-        has_instructions = bool(
-            additional_instructions_final and additional_instructions_final.strip()
-        )
-
-        logger.debug(
-            f"Has context: {has_context}, Has JIRA: {has_jira}, Has instructions: {has_instructions}"
-        )
-
-        # First handle placeholder replacements for non-empty sections
-        if has_context:
-            final_prompt = final_prompt.replace(
-                "{relevant_code_context}", relevant_code_context
-            )
-        if has_jira:
-            final_prompt = final_prompt.replace(
-                "{jira_description}", jira_description_final
+        unique_paths, symbols = _resolve_context_paths(context_files, workers)
+        if imports is not None:
+            unique_paths += expand_imports(
+                unique_paths, imports, db_path, Config.WORKSPACE_ROOT
             )
-        if has_instructions:
-            final_prompt = final_prompt.replace(
-                "{additional_instructions}", additional_instructions_final
-            )
-
-        # Then remove entire sections for empty placeholders
-        # The order matters here - we should always start with optional sections first
-        if not has_instructions:
-            final_prompt = remove_section(final_prompt, "additional_instructions")
-        if not has_jira:
-            final_prompt = remove_section(final_prompt, "jira_description")
-        if not has_context:
-            final_prompt = remove_section(final_prompt, "relevant_code_context")
+    except Exception as e:
+        logger.error(f"Error resolving context file paths: {context_files} - {e}")
+        context_error = "Error resolving context paths."
+    if diff is not None and context_error is None:
+        # A few git calls per repository for all files; the commits the
+        # base ref resolves to are part of the fingerprint
+        diff.load([path for path in unique_paths if path not in symbols])
+
+    # Check if sections should be included or removed
+    has_context = bool(unique_paths) or context_error is not None
+    has_jira = bool(jira_description_final and jira_description_final.strip())
+    has_instructions = bool(
+        additional_instructions_final and additional_instructions_final.strip()
+    )
+    logger.debug(
+        f"Has context: {has_context}, Has JIRA: {has_jira}, Has instructions: {has_instructions}"
+    )
 
-    except KeyError as e:
-        logger.error(
-            f"Template formatting error: Placeholder {e} not found in template ID {template_id}. Available placeholders: relevant_code_context, jira_description, additional_instructions"
-        )
-        return f"[ERROR: Template formatting failed - Placeholder {e} missing]"
+    values: Dict[str, str] = {
+        name: value
+        for name, value in (template_values or {}).items()
+        if name not in BUILTIN_PLACEHOLDERS and value.strip()
+    }
+    if has_context:
+        # Filled in while streaming
+        values["relevant_code_context"] = ""
+    if has_jira:
+        values["jira_description"] = jira_description_final
+    if has_instructions:
+        values["additional_instructions"] = additional_instructions_final
+
+    # The template is parsed once; sections of empty placeholders are left
+    # out of the plan without searching the template again
+    try:
+        compiled = compiled_templates.get(template_id, template_content)
+        empty = frozenset(compiled.names + BUILTIN_PLACEHOLDERS) - values.keys()
+        plan = compiled.plan(empty)
+    except TemplateSyntaxError as e:
+        logger.error(f"Invalid template ID {template_id}: {e}")
+        return PromptStream(iter([f"[ERROR: Invalid template: {e}]"]))
     except Exception as e:
         logger.error(
             f"Unexpected template formatting error for template ID {template_id}: {e}",
             exc_info=True,
         )
-        return "[ERROR: Unexpected error formatting template]"
+        return PromptStream(iter(["[ERROR: Unexpected error formatting template]"]))
+    values.pop("relevant_code_context", None)
+
+    def fill(placeholder: Placeholder) -> str:
+        # Placeholders without content that had no section to remove are
+        # left as they are
+        return values.get(placeholder.name, "{" + placeholder.name + "}")
+
+    # --- Serve a prompt generated from the same inputs ---
+    fingerprint: Optional[str] = None
+    claimed = False
+    if context_error is None and prompt_cache.max_bytes > 0:
+        fingerprint = prompt_fingerprint(
+            template_id,
+            compiled.digest,
+            values,
+            unique_paths,
+            symbols,
+            budget,
+            compaction,
+            diff,
+        )
+        cached = prompt_cache.get(fingerprint, count_miss=False)
+        if cached is None:
+            event = prompt_cache.begin(fingerprint)
+            if event is None:
+                claimed = True
+            else:
+                event.wait(Config.PROMPT_COALESCE_WAIT_SECONDS)
+                # Still a miss if that prompt was too long to cache, or the
+                # wait timed out
+                cached = prompt_cache.get(fingerprint)
+        if cached is not None:
+            logger.info(f"Serving cached prompt for template ID {template_id}.")
+            if budget is not None:
+                budget.report = cached.context_report
+            return PromptStream(iter([cached.prompt]), fingerprint, cached=True)
+
+    def release() -> None:
+        if claimed:
+            prompt_cache.end(fingerprint)
+
+    def count_fixed_tokens(model: Optional[str]) -> int:
+        # Tokens of the prompt without the context files
+        fixed_text = "".join(
+            piece if isinstance(piece, str) else fill(piece)
+            for piece in plan
+            if piece != Placeholder("relevant_code_context")
+        )
+        return _count_tokens(fixed_text, model)[0]
+
+    prepared: Dict[Path, str] = {}
+    try:
+        if budget is not None and context_error is None:
+            # Everything but the context files counts against the budget first
+            fixed_tokens = count_fixed_tokens(budget.model)
+            if fixed_tokens > budget.max_tokens:
+                logger.warning(
+                    f"The prompt without context files takes {fixed_tokens} tokens, "
+                    f"over the budget of {budget.max_tokens}."
+                )
+            unique_paths, prepared = _pack_context(
+                unique_paths, budget, fixed_tokens, workers, symbols, compaction, diff
+            )
+            if not unique_paths:
+                # No file fit: the context section goes, as without files
+                has_context = False
+                plan = compiled.plan(empty | {"relevant_code_context"})
+                # Without the section's heading and fences
+                budget.report["prompt_tokens"] = count_fixed_tokens(budget.model)
+        else:
+            unique_paths = sorted(unique_paths)
+    except BaseException:
+        release()
+        raise
+
+    def generate() -> Iterator[str]:
+        for piece in plan:
+            if isinstance(piece, str):
+                yield piece
+            elif piece.name == "relevant_code_context" and has_context:
+                if context_error is not None:
+                    yield context_error
+                else:
+                    yield from _iter_context_blocks(
+                        unique_paths, workers, prepared, symbols, compaction, diff
+                    )
+            else:
+                yield fill(piece)
+        logger.info(f"Prompt generation complete using template ID {template_id}.")
 
-    logger.info(f"Prompt generation complete using template ID {template_id}.")
-    return final_prompt
+    def chunks() -> Iterator[str]:
+        # Prompts too long to cache are streamed without being collected
+        collected: Optional[List[str]] = [] if fingerprint is not None else None
+        collected_chars = 0
+        try:
+            for chunk in generate():
+                if collected is not None:
+                    collected_chars += len(chunk)
+                    if collected_chars > prompt_cache.max_entry_bytes:
+                        collected = None
+                    else:
+                        collected.append(chunk)
+                yield chunk
+            if collected is not None:
+                prompt_cache.put(
+                    fingerprint,
+                    CachedPrompt("".join(collected), budget.report if budget else None),
+                )
+        finally:
+            release()
+
+    return PromptStream(chunks(), fingerprint, on_close=release)
 
 
-def test_section_removal(template: str, placeholder_name: str) -> str:
-    """Helper function to test section removal logic on a given template.
+def generate_prompt(
+    db_path: Path,  # Database path is now required
+    template_id: int,  # Template ID is now required
+    context_files: List[Union[Path, str]] = [],
+    jira_description: str = "",
+    additional_instructions: str = "",
+    budget: Optional[TokenBudget] = None,
+    imports: Optional[ImportExpansion] = None,
+    compaction: Optional[Compaction] = None,
+    template_values: Optional[Dict[str, str]] = None,
+    diff: Optional[DiffContext] = None,
+) -> Optional[str]:  # Return None on failure
+    """Generate a complete implementation prompt using a template from the database.
 
     Args:
-        template: Template content to test against
-        placeholder_name: Name of the placeholder to remove
+        db_path: Path to the SQLite database file.
+        template_id: ID of the template in the database.
+        context_files: List of paths to include as code context.
+        jira_description: JIRA ticket description text (or path to file containing it).
+        additional_instructions: Additional instructions (or path to file containing it).
+        budget: Token budget to pack the context files into; its report is
+            set on return
+        imports: How far to follow the imports of the selected files; its
+            report is set on return
+        compaction: Strategies compacting the context files
+        template_values: Values of the template's own placeholders
+        diff: Include only the changes of the context files against a git
+            ref; its report is set on return
 
     Returns:
-        The template with the section removed
+        Complete formatted prompt string, or None if the template cannot be loaded.
     """
-    return remove_section(template, placeholder_name)
+    chunks = generate_prompt_chunks(
+        db_path,
+        template_id,
+        context_files=context_files,
+        jira_description=jira_description,
+        additional_instructions=additional_instructions,
+        budget=budget,
+        imports=imports,
+        compaction=compaction,
+        template_values=template_values,
+        diff=diff,
+    )
+    if chunks is None:
+        return None
+    return "".join(chunks)
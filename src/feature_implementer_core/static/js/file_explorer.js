@@ -13,7 +13,6 @@ document.addEventListener('DOMContentLoaded', function() {
     if (refreshButton) {
         refreshButton.addEventListener('click', async () => {
             await refreshFileTree();
-            unwrapRootFolder();
             sortFileTree(document.querySelector('.file-tree'));
         });
     }
@@ -117,6 +116,49 @@ function handleFileSelectionChange(changedCheckbox) {
     });
 
     updateSelectedFilesList();
+    if (isChecked) {
+        loadExactFileCost(filePath);
+    }
+}
+
+// Files checked since the last metadata request; checking many files at
+// once (e.g. from a preset) sends a single request
+const pendingCostPaths = new Set();
+let pendingCostTimer = null;
+
+// Replace the estimated token cost of a file with its exact count
+function loadExactFileCost(filePath) {
+    pendingCostPaths.add(filePath);
+    if (pendingCostTimer === null) {
+        pendingCostTimer = setTimeout(loadPendingFileCosts, 0);
+    }
+}
+
+async function loadPendingFileCosts() {
+    const paths = Array.from(pendingCostPaths);
+    pendingCostPaths.clear();
+    pendingCostTimer = null;
+    try {
+        const response = await fetch('/file_tree/metadata', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ paths: paths })
+        });
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        Object.entries(data.files || {}).forEach(([filePath, metadata]) => {
+            if (!metadata) {
+                return;
+            }
+            document.querySelectorAll(`.entry-cost[data-path="${CSS.escape(filePath)}"]`).forEach(span => {
+                span.textContent = metadata.cost;
+            });
+        });
+    } catch (error) {
+        console.error('Error loading file metadata:', error);
+    }
 }
 
 function updateSelectedFilesList() {
@@ -278,6 +320,10 @@ function toggleFolder(folderLabel) {
             folderArrow.classList.remove('fa-chevron-right');
             folderArrow.classList.add('fa-chevron-down'); // Indicate open state
             console.log('Folder opened');
+            // Fetch the folder's children the first time it is opened
+            if (content.dataset.loaded === 'false') {
+                loadFolderChildren(content);
+            }
         } else {
             // Closing folder
             content.style.display = 'none';
@@ -292,47 +338,22 @@ function toggleFolder(folderLabel) {
 
 // Function to collect paths of all expanded folders
 function getExpandedFolderPaths() {
-    const expandedFolders = document.querySelectorAll('.folder-content[style="display: block;"]');
+    const expandedFolders = document.querySelectorAll('.file-tree .folder-content[style="display: block;"]');
     const expandedPaths = [];
     
     console.log(`Found ${expandedFolders.length} expanded folders to save`);
     
     expandedFolders.forEach(folder => {
-        // Construct path from folder hierarchy
-        let currentElement = folder;
-        let path = [];
-        
-        // Traverse up to find all parent folder names
-        while (currentElement) {
-            const folderLabel = currentElement.previousElementSibling;
-            if (folderLabel && folderLabel.classList.contains('folder-label')) {
-                const folderName = folderLabel.querySelector('.folder-name');
-                if (folderName) {
-                    path.unshift(folderName.textContent.trim());
-                }
-            }
-            
-            // Move up to parent folder's content
-            const parentFolder = currentElement.closest('.folder');
-            if (!parentFolder) break;
-            
-            currentElement = parentFolder.parentElement;
-            // If we're still within the file-tree, continue
-            if (!currentElement || !currentElement.closest('.file-tree')) break;
-        }
-        
-        if (path.length > 0) {
-            const folderPath = path.join('/');
-            expandedPaths.push(folderPath);
-            console.log(`Saved expanded folder path: ${folderPath}`);
+        if (folder.dataset.path) {
+            expandedPaths.push(folder.dataset.path);
         }
     });
     
     return expandedPaths;
 }
 
-// Function to expand folders based on saved paths
-function restoreExpandedFolders(expandedPaths) {
+// Function to expand folders based on saved paths, loading their children as needed
+async function restoreExpandedFolders(expandedPaths) {
     if (!expandedPaths || expandedPaths.length === 0) {
         console.log('No expanded paths to restore');
         return;
@@ -340,74 +361,238 @@ function restoreExpandedFolders(expandedPaths) {
     
     console.log(`Attempting to restore ${expandedPaths.length} expanded folders`);
     
-    const fileTree = document.querySelector('.file-tree');
-    if (!fileTree) {
-        console.warn('File tree not found for restoration');
-        return;
+    // Parents first, so their children exist by the time we reach them
+    const sortedPaths = [...expandedPaths].sort((a, b) => a.split('/').length - b.split('/').length);
+    
+    for (const path of sortedPaths) {
+        const content = findFolderContent(path);
+        if (!content || !content.classList.contains('folder-content')) {
+            console.log(`Could not find folder in path: ${path}`);
+            continue; // Path no longer exists or is not loaded
+        }
+        const folderArrow = content.previousElementSibling?.querySelector('.folder-arrow i');
+        content.style.display = 'block';
+        if (folderArrow) {
+            folderArrow.classList.remove('fa-chevron-right');
+            folderArrow.classList.add('fa-chevron-down');
+        }
+        if (content.dataset.loaded === 'false') {
+            await loadFolderChildren(content);
+        }
     }
+}
+
+/**
+ * Finds the element holding a folder's children by the folder's absolute path.
+ * The unwrapped root folder's children live directly in the .file-tree container.
+ * @param {string} path - Absolute path of the folder.
+ * @returns {HTMLElement|null} The folder content element, if rendered.
+ */
+function findFolderContent(path) {
+    const escapedPath = CSS.escape(path);
+    return document.querySelector(
+        `.file-tree .folder-content[data-path="${escapedPath}"], .file-tree[data-path="${escapedPath}"]`
+    );
+}
+
+/**
+ * Escapes text for use in HTML content and attribute values.
+ * @param {string} text - The text to escape.
+ * @returns {string} The escaped text.
+ */
+function escapeHtml(text) {
+    return String(text)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+/**
+ * Builds the HTML of one directory entry, matching the macros in macros.html.
+ * @param {Object} entry - Entry from /file_tree/children.
+ * @returns {string} HTML of the list item.
+ */
+function renderDirectoryEntry(entry) {
+    const name = escapeHtml(entry.name);
+    const path = escapeHtml(entry.path);
     
-    // First pass: expand all top-level folders that match
-    expandedPaths.forEach(path => {
-        const topFolder = path.split('/')[0];
-        const topFolderElements = fileTree.querySelectorAll('.folder-label');
-        
-        topFolderElements.forEach(label => {
-            const folderName = label.querySelector('.folder-name');
-            if (folderName && folderName.textContent.trim() === topFolder) {
-                const content = label.nextElementSibling;
-                const folderArrow = label.querySelector('.folder-arrow i');
-                
-                if (content && folderArrow) {
-                    content.style.display = 'block';
-                    folderArrow.classList.remove('fa-chevron-right');
-                    folderArrow.classList.add('fa-chevron-down');
-                    console.log(`Expanded top-level folder: ${topFolder}`);
-                }
-            }
-        });
+    if (entry.type === 'folder') {
+        return `
+            <li class="folder">
+                <div class="folder-label" onclick="toggleFolder(this)">
+                    <span class="folder-arrow">
+                        <i class="fas fa-chevron-right"></i>
+                    </span>
+                    <span class="icon folder-icon">
+                        <i class="fas fa-folder"></i>
+                    </span>
+                    <span class="folder-name">${name}</span>
+                    <span class="entry-cost" title="Files, size and token cost of the whole folder">${escapeHtml(entry.cost)}</span>
+                </div>
+                <ul class="folder-content" data-path="${path}" data-child-count="${entry.child_count}" data-loaded="false" style="display: none;"></ul>
+            </li>`;
+    }
+    
+    const nonPreviewableExtensions = ['png', 'jpg', 'jpeg', 'gif', 'svg', 'webp', 'bmp', 'ico', 'xlsx', 'xls', 'docx', 'doc', 'pptx', 'ppt', 'pdf', 'zip', 'gz', 'tar', 'rar'];
+    const filenameLC = entry.name.toLowerCase();
+    const fileExt = filenameLC.includes('.') ? filenameLC.split('.').pop() : '';
+    const isPreviewable = !nonPreviewableExtensions.includes(fileExt);
+    const checkboxId = escapeHtml(`file_${entry.path.replace(/\//g, '_').replace(/\./g, '_')}`);
+    const previewHandler = isPreviewable ? `onclick="toggleFilePreview('${path}', '${name}')"` : '';
+    
+    return `
+        <li class="file">
+            <div class="file-label">
+                <label class="checkbox-container" for="${checkboxId}">
+                    <input type="checkbox" name="context_files" value="${path}" data-filename="${name}" id="${checkboxId}" onchange="handleFileSelectionChange(this)">
+                    <span class="custom-checkbox"></span>
+                </label>
+                <div class="file-info" ${previewHandler}>
+                    <span class="icon file-icon">
+                        <i class="fas fa-file"></i>
+                    </span>
+                    <span class="filename">${name}</span>
+                    <span class="entry-cost" data-path="${path}" title="Size and token cost">${escapeHtml(entry.cost)}</span>
+                </div>
+                <div class="file-actions">
+                    <button type="button" class="action-button ${isPreviewable ? '' : 'not-previewable'}" ${previewHandler}
+                            ${isPreviewable ? '' : 'disabled title="Preview not available for this file type"'}>
+                        <i class="fas fa-eye"></i>
+                    </button>
+                    <button type="button" class="action-button" onclick="addFileToContext('${path}', '${name}')">
+                        <i class="fas fa-plus"></i>
+                    </button>
+                </div>
+            </div>
+        </li>`;
+}
+
+/**
+ * Builds the "show more" item for a directory listing with further pages.
+ * @param {Object} listing - Response from /file_tree/children.
+ * @returns {string} HTML of the list item, or an empty string.
+ */
+function renderLoadMoreItem(listing) {
+    if (!listing.has_more) return '';
+    const nextOffset = listing.offset + listing.limit;
+    return `
+        <li class="load-more" data-path="${escapeHtml(listing.path)}" data-offset="${nextOffset}">
+            <button type="button" class="action-button load-more-button" onclick="loadMoreChildren(this)">
+                Show ${listing.total - nextOffset} more
+            </button>
+        </li>`;
+}
+
+/**
+ * Fetches one page of a folder's children from the server.
+ * @param {string} path - Absolute path of the folder.
+ * @param {number} offset - Index of the first child to fetch.
+ * @returns {Promise<Object>} The directory listing.
+ */
+async function fetchDirectoryChildren(path, offset = 0) {
+    const response = await fetch(`/file_tree/children?path=${encodeURIComponent(path)}&offset=${offset}`);
+    const data = await response.json();
+    if (!response.ok || data.error) {
+        throw new Error(data.error || `HTTP error! status: ${response.status}`);
+    }
+    return data;
+}
+
+/**
+ * Checks newly rendered checkboxes for files that are already selected elsewhere
+ * (for example in search results).
+ * @param {HTMLElement} container - Element containing the new checkboxes.
+ */
+function syncNewCheckboxes(container) {
+    const checkedPaths = new Set(
+        Array.from(document.querySelectorAll('input[name="context_files"]:checked')).map(cb => cb.value)
+    );
+    if (checkedPaths.size === 0) return;
+    container.querySelectorAll('input[name="context_files"]').forEach(cb => {
+        if (checkedPaths.has(cb.value)) {
+            cb.checked = true;
+        }
     });
+    if (typeof updateFileHighlighting === 'function') {
+        updateFileHighlighting();
+    }
+}
+
+/**
+ * Loads the first page of a folder's children into its content element.
+ * @param {HTMLElement} content - The folder's .folder-content element.
+ */
+async function loadFolderChildren(content) {
+    if (content.dataset.loaded !== 'false') return;
+    content.dataset.loaded = 'loading';
+    content.innerHTML = '<li class="folder-loading text-secondary">Loading...</li>';
+    
+    try {
+        const listing = await fetchDirectoryChildren(content.dataset.path);
+        content.innerHTML = `<ul class="file-list">${listing.entries.map(renderDirectoryEntry).join('')}${renderLoadMoreItem(listing)}</ul>`;
+        content.dataset.loaded = 'true';
+        syncNewCheckboxes(content);
+    } catch (error) {
+        console.error('Failed to load folder contents:', error);
+        content.innerHTML = `<li class="error">Failed to load folder. ${escapeHtml(error.message)}</li>`;
+        content.dataset.loaded = 'false';
+    }
+}
+
+/**
+ * Appends the next page of a folder's children in place of its "show more" item.
+ * @param {HTMLElement} button - The clicked "show more" button.
+ */
+async function loadMoreChildren(button) {
+    const item = button.closest('.load-more');
+    if (!item || button.disabled) return;
+    button.disabled = true;
     
-    // Second pass: expand specific paths in full
-    expandedPaths.forEach(path => {
-        const pathParts = path.split('/');
-        let currentLevel = fileTree;
-        let currentPath = '';
+    try {
+        const listing = await fetchDirectoryChildren(item.dataset.path, parseInt(item.dataset.offset, 10));
+        const list = item.parentElement;
+        item.insertAdjacentHTML('beforebegin', listing.entries.map(renderDirectoryEntry).join('') + renderLoadMoreItem(listing));
+        item.remove();
+        syncNewCheckboxes(list);
+    } catch (error) {
+        console.error('Failed to load more folder contents:', error);
+        button.disabled = false;
+    }
+}
+
+/**
+ * Loads the folders containing the given files, so their checkboxes exist in the
+ * tree (for example before applying a preset). Folders are not expanded.
+ * @param {Array<string>} filePaths - Absolute paths of files.
+ */
+async function loadFilesIntoTree(filePaths) {
+    for (const filePath of filePaths) {
+        const selector = `.file-tree input[name="context_files"][value="${CSS.escape(filePath)}"]`;
+        if (document.querySelector(selector)) continue;
         
-        // Navigate through each path segment
-        for (let i = 0; i < pathParts.length; i++) {
-            currentPath += (i > 0 ? '/' : '') + pathParts[i];
-            
-            // Find folder at this level
-            const folderLabels = currentLevel.querySelectorAll('.folder-label');
-            let found = false;
-            
-            for (const label of folderLabels) {
-                const folderName = label.querySelector('.folder-name');
-                if (folderName && folderName.textContent.trim() === pathParts[i]) {
-                    // Found the folder, expand it
-                    const content = label.nextElementSibling;
-                    const folderArrow = label.querySelector('.folder-arrow i');
-                    
-                    if (content && folderArrow) {
-                        content.style.display = 'block';
-                        folderArrow.classList.remove('fa-chevron-right');
-                        folderArrow.classList.add('fa-chevron-down');
-                        console.log(`Expanded folder in path: ${currentPath}`);
-                    }
-                    
-                    // Continue with the next level
-                    currentLevel = content;
-                    found = true;
-                    break;
+        const parts = filePath.split('/');
+        for (let i = 1; i < parts.length; i++) {
+            const content = findFolderContent(parts.slice(0, i).join('/') || '/');
+            if (!content) continue; // Above the scan directories
+            try {
+                if (content.dataset.loaded === 'false') {
+                    await loadFolderChildren(content);
                 }
-            }
-            
-            if (!found) {
-                console.log(`Could not find folder in path: ${currentPath}`);
-                break; // Path no longer exists, stop trying
+                // The next folder (or the file itself) may be on a later page
+                const next = parts.slice(0, i + 1).join('/');
+                let loadMore = content.querySelector(':scope > ul > li.load-more, :scope > li.load-more');
+                while (loadMore && !findFolderContent(next) && !document.querySelector(selector)) {
+                    await loadMoreChildren(loadMore.querySelector('button'));
+                    loadMore = content.querySelector(':scope > ul > li.load-more, :scope > li.load-more');
+                }
+            } catch (error) {
+                console.warn('Could not load folder for file:', filePath, error);
+                break;
             }
         }
-    });
+    }
 }
 
 // Refreshes the file tree by fetching new data from the server
@@ -436,10 +621,11 @@ async function refreshFileTree() {
         
         if (data.html) {
             fileTreeContainer.innerHTML = data.html;
+            unwrapRootFolder();
             // Restore expanded folders
-            restoreExpandedFolders(expandedPaths);
+            await restoreExpandedFolders(expandedPaths);
             // Restore selected files
-            restoreSelectedFiles(selectedFiles);
+            await restoreSelectedFiles(selectedFiles);
             // No need to re-call initFileExplorer due to event delegation
         } else if (data.error) {
             fileTreeContainer.innerHTML = `<p class="error">Error loading file tree: ${data.error}</p>`;
@@ -473,7 +659,7 @@ function getSelectedFiles() {
 }
 
 // Function to restore previously selected files
-function restoreSelectedFiles(selectedFiles) {
+async function restoreSelectedFiles(selectedFiles) {
     if (!selectedFiles || selectedFiles.length === 0) {
         console.log('No selected files to restore');
         return;
@@ -481,8 +667,11 @@ function restoreSelectedFiles(selectedFiles) {
     
     console.log(`Attempting to restore ${selectedFiles.length} selected files`);
     
+    // Selected files may be in folders that haven't been loaded since the refresh
+    await loadFilesIntoTree(selectedFiles.map(file => file.path));
+    
     selectedFiles.forEach(file => {
-        const checkbox = document.querySelector(`input[value="${file.path}"]`);
+        const checkbox = document.querySelector(`input[value="${CSS.escape(file.path)}"]`);
         if (checkbox) {
             checkbox.checked = true;
             console.log(`Restored selection for file: ${file.filename}`);
@@ -505,6 +694,9 @@ function unwrapRootFolder() {
     const rootLabel = tree.querySelector('.folder-label');
     const rootContent = rootLabel?.nextElementSibling;
     if (rootContent && rootContent.classList.contains('folder-content')) {
+        // Keep the root's path so its further pages and children can be found
+        tree.dataset.path = rootContent.dataset.path || '';
+        tree.dataset.loaded = 'true';
         tree.innerHTML = rootContent.innerHTML;
     }
 }
@@ -609,6 +801,7 @@ function initFileSearch() {
             performSearch(query);
         } else {
             // Hide search results if query is less than 2 characters
+            latestSearchId++; // Ignore searches still in flight
             searchResults.style.display = 'none';
             fileTree.style.display = 'block';
         }
@@ -640,11 +833,16 @@ function initFileSearch() {
     });
 }
 
+// Incremented per search so responses to outdated queries are dropped
+let latestSearchId = 0;
+
 /**
  * Performs a file search based on the given query.
+ * Searching happens on the server, since folders are only loaded into the
+ * tree when they are opened.
  * @param {string} query - The search query to match against file names and paths.
  */
-function performSearch(query) {
+async function performSearch(query) {
     const fileTree = document.querySelector('.file-tree');
     const searchResults = document.getElementById('search-results');
     const searchResultsList = document.getElementById('search-results-list');
@@ -654,58 +852,37 @@ function performSearch(query) {
     
     // Case-insensitive search
     const normalizedQuery = query.toLowerCase();
+    const searchId = ++latestSearchId;
     
-    // Collect file info from the DOM tree
-    const files = collectFileInfo(fileTree);
+    let data;
+    try {
+        const response = await fetch('/file_tree/search?q=' + encodeURIComponent(query));
+        data = await response.json();
+        if (!response.ok || data.error) {
+            throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+    } catch (error) {
+        console.error('File search failed:', error);
+        if (searchId !== latestSearchId) return;
+        data = { results: [], total: 0 };
+    }
     
-    // Split the query by "/" to support path-based searches like "menu/index"
-    const queryParts = normalizedQuery.split('/').filter(part => part.trim());
+    // A newer query was typed while this one was in flight
+    if (searchId !== latestSearchId) return;
     
-    // Filter files based on the search query
-    const matchedFiles = files.filter(file => {
-        // First check if the file name contains the entire query
-        if (file.name.toLowerCase().includes(normalizedQuery)) {
-            return true;
-        }
-        
-        // Check if the file path contains the entire query (path-based search)
-        if (file.path.toLowerCase().includes(normalizedQuery)) {
-            return true;
-        }
-        
-        // If the query contains path separators, do a more specific path match
-        if (queryParts.length > 1) {
-            const filePath = file.path.toLowerCase();
-            
-            // Check if all path parts are found in order
-            let lastFoundIndex = -1;
-            const allPartsFound = queryParts.every(part => {
-                const partIndex = filePath.indexOf(part, lastFoundIndex + 1);
-                if (partIndex === -1) return false;
-                lastFoundIndex = partIndex;
-                return true;
-            });
-            
-            if (allPartsFound) return true;
-            
-            // Check if the query matches the last part of the path (directory + filename)
-            const pathDirAndFile = file.path.toLowerCase().split('/').slice(-queryParts.length).join('/');
-            if (pathDirAndFile === queryParts.join('/')) {
-                return true;
-            }
-        }
-        
-        return false;
-    });
+    const matchedFiles = data.results;
     
     // Update UI
     fileTree.style.display = 'none';
     searchResults.style.display = 'flex';
     
     // Update result count
-    const resultText = matchedFiles.length === 1 
+    let resultText = data.total === 1 
         ? '1 result' 
-        : `${matchedFiles.length} results`;
+        : `${data.total} results`;
+    if (data.total > matchedFiles.length) {
+        resultText += ` (showing ${matchedFiles.length})`;
+    }
     searchResultCount.textContent = resultText;
     
     // Render search results
@@ -714,51 +891,13 @@ function performSearch(query) {
     } else {
         searchResultsList.innerHTML = `
             <div class="search-empty-state">
-                <p>No matching files found for "${query}"</p>
+                <p>No matching files found for "${escapeHtml(query)}"</p>
                 <p>Try a different search term</p>
             </div>
         `;
     }
 }
 
-/**
- * Collects file information from the file tree DOM.
- * @param {HTMLElement} fileTree - The file tree container element.
- * @returns {Array<Object>} An array of file objects with name, path, and element information.
- */
-function collectFileInfo(fileTree) {
-    const files = [];
-    
-    // Find all file labels in the tree
-    const fileLabels = fileTree.querySelectorAll('.file-label');
-    
-    fileLabels.forEach(label => {
-        const checkbox = label.querySelector('input[type="checkbox"]');
-        if (!checkbox) return;
-        
-        const fileNameEl = label.querySelector('.filename');
-        if (!fileNameEl) return;
-        
-        const fileName = fileNameEl.textContent.trim();
-        const filePath = checkbox.value;
-        const checkboxId = checkbox.id;
-        
-        // Calculate and store path components for better path-based search
-        const pathParts = filePath.split('/');
-        
-        files.push({
-            name: fileName,
-            path: filePath,
-            fullPath: filePath, // Original full path
-            checkboxId: checkboxId,
-            element: label,
-            pathParts: pathParts
-        });
-    });
-    
-    return files;
-}
-
 /**
  * Renders the search results in the search results list.
  * @param {HTMLElement} container - The container to render results in.
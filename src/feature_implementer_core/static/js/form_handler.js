@@ -10,6 +10,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const errorArea = document.getElementById('prompt-error-area');
     const charCountInfo = document.getElementById('char-count-info');
     const tokenEstimateInfo = document.getElementById('token-estimate-info');
+    // Last generated prompt and its ETag, reused when the server answers 304
+    let lastPrompt = null;
     
     /**
      * Rough client-side GPT token estimator
@@ -23,6 +25,39 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Preset selector is initialized in preset_handler.js
     
+    /**
+     * Shows a field for each placeholder of the selected template besides the
+     * built-in ones; sections of placeholders left empty are dropped
+     */
+    function renderTemplateValues() {
+        const selector = document.getElementById('template-selector');
+        const section = document.getElementById('template-values-section');
+        const container = document.getElementById('template-values');
+        if (!selector || !section || !container) {
+            return;
+        }
+        const option = selector.options[selector.selectedIndex];
+        const names = ((option && option.dataset.placeholders) || '').split(' ').filter(Boolean);
+        container.innerHTML = '';
+        names.forEach(name => {
+            const label = document.createElement('label');
+            label.textContent = name;
+            const field = document.createElement('textarea');
+            field.name = 'template_value.' + name;
+            field.rows = 2;
+            field.placeholder = 'Value for {' + name + '} (optional)...';
+            label.appendChild(field);
+            container.appendChild(label);
+        });
+        section.style.display = names.length ? '' : 'none';
+    }
+    
+    const templateSelector = document.getElementById('template-selector');
+    if (templateSelector) {
+        templateSelector.addEventListener('change', renderTemplateValues);
+        renderTemplateValues();
+    }
+    
     // Bind the form submit event
     if (generateForm) {
         generateForm.addEventListener('submit', function(e) {
@@ -54,14 +89,36 @@ document.addEventListener('DOMContentLoaded', function() {
         charCountInfo.textContent = '';
         tokenEstimateInfo.textContent = '';
         
-        // Use FormData to handle the submission
+        // Use FormData to handle the submission; the prompt is streamed back
+        // as plain text, errors come as JSON
         const formData = new FormData(form);
+        formData.append('stream', '1');
+        
+        const headers = {};
+        if (lastPrompt) {
+            headers['If-None-Match'] = lastPrompt.etag;
+        }
         
         fetch('/generate', {
             method: 'POST',
+            headers: headers,
             body: formData
         })
-        .then(response => response.json())
+        .then(response => {
+            if (response.status === 304 && lastPrompt) {
+                // Same selection and inputs as last time
+                return { prompt: lastPrompt.prompt };
+            }
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.ok || contentType.includes('application/json')) {
+                return response.json();
+            }
+            const etag = response.headers.get('ETag');
+            return readPromptStream(response).then(prompt => {
+                lastPrompt = etag ? { etag: etag, prompt: prompt } : null;
+                return { prompt: prompt };
+            });
+        })
         .then(data => {
             loadingIndicator.style.display = 'none';
             
@@ -96,6 +153,32 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    /**
+     * Reads a streamed prompt response to the end
+     * @param {Response} response - The fetch response with a plain text body
+     * @returns {Promise<string>} The complete prompt
+     */
+    function readPromptStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const chunks = [];
+        let received = 0;
+        
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    chunks.push(decoder.decode());
+                    return chunks.join('');
+                }
+                received += value.length;
+                chunks.push(decoder.decode(value, { stream: true }));
+                charCountInfo.textContent = `Receiving... ${(received / 1024).toFixed(0)} KB`;
+                return pump();
+            });
+        }
+        return pump();
+    }
+    
     /**
      * Copies the generated prompt to clipboard
      * @returns {Promise<void>} Promise resolving when copy is complete
@@ -280,8 +280,9 @@ function refreshPresets() {
  * Handles multiple preset selections from checkboxes
  * @param {string} presetName - The name of the selected/deselected preset
  * @param {boolean} isChecked - Whether the preset was checked or unchecked
+ * @param {boolean} filesLoaded - Whether the preset's folders were already loaded into the tree
  */
-function handleMultiplePresetSelection(presetName, isChecked) {
+function handleMultiplePresetSelection(presetName, isChecked, filesLoaded = false) {
     console.log("Selected preset:", presetName);
     console.log("Preset data:", window.presets[presetName]);
     
@@ -301,6 +302,15 @@ function handleMultiplePresetSelection(presetName, isChecked) {
         return;
     }
     
+    // The explorer loads folders on demand, so make sure the preset's files
+    // have checkboxes before matching them
+    if (isChecked && !filesLoaded && typeof loadFilesIntoTree === 'function') {
+        loadFilesIntoTree(Object.values(preset.files || {}).map(file => String(file))).then(() => {
+            handleMultiplePresetSelection(presetName, isChecked, true);
+        });
+        return;
+    }
+    
     // Get all currently selected presets
     const selectedPresets = document.querySelectorAll('input[name="presets"]:checked');
     
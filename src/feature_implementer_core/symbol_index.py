@@ -0,0 +1,251 @@
+import ast
+import logging
+import multiprocessing
+import os
+import textwrap
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Separates a file path from a symbol in a context selection, as in
+# "src/app.py::create_app" or "src/models.py::User.save"
+SYMBOL_SEPARATOR = "::"
+
+
+class Symbol(NamedTuple):
+    """A class or function defined in a Python file."""
+
+    # Qualified name, e.g. "User.save" for a method
+    name: str
+    # "class", "function" or "method"
+    kind: str
+    # 1-based, including decorators
+    start_line: int
+    # 1-based, inclusive
+    end_line: int
+
+
+def is_python_file(path: str) -> bool:
+    """Check if symbols can be indexed for a file."""
+    return path.endswith((".py", ".pyi"))
+
+
+def split_symbol_selection(entry: str) -> Tuple[str, Optional[str]]:
+    """Split a context selection into its file path and symbol, if any."""
+    path, separator, symbol = entry.partition(SYMBOL_SEPARATOR)
+    if separator and symbol and is_python_file(path):
+        return path, symbol
+    return entry, None
+
+
+def parse_symbols(source: bytes) -> List[Symbol]:
+    """List the classes, functions and methods defined in Python source.
+
+    Nested classes are included with their methods; functions defined inside
+    functions are not.
+
+    Raises:
+        SyntaxError: If the source does not parse
+    """
+    symbols: List[Symbol] = []
+
+    def visit(body: Iterable[ast.stmt], prefix: str, in_class: bool) -> None:
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                kind = "class"
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = "method" if in_class else "function"
+            else:
+                continue
+            start = min(
+                [node.lineno] + [decorator.lineno for decorator in node.decorator_list]
+            )
+            name = prefix + node.name
+            symbols.append(Symbol(name, kind, start, node.end_lineno or node.lineno))
+            if kind == "class":
+                visit(node.body, name + ".", True)
+
+    visit(ast.parse(source).body, "", False)
+    return symbols
+
+
+def _index_file(path: str) -> Tuple[str, int, int, Optional[List[Symbol]]]:
+    """Parse one file; runs in the worker pool.
+
+    Returns:
+        Tuple of (path, mtime_ns, size, symbols or None if it doesn't parse)
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        source = f.read()
+    try:
+        symbols: Optional[List[Symbol]] = parse_symbols(source)
+    except (SyntaxError, ValueError):
+        symbols = None
+    return path, stat.st_mtime_ns, stat.st_size, symbols
+
+
+class SymbolIndex:
+    """Cache of the symbols of Python files, keyed by (path, mtime, size).
+
+    Files that miss are parsed together, on a pool of worker processes when
+    there are enough of them to make up for the hand-off.
+    """
+
+    def __init__(self, max_files: int):
+        self.max_files = max_files
+        # path -> (mtime_ns, size, symbols or None if the file doesn't parse)
+        self._entries: "OrderedDict[str, Tuple[int, int, Optional[List[Symbol]]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # Spawned, not forked: the server process runs other threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=Config.SYMBOL_INDEX_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def get_many(self, paths: Sequence[str]) -> Dict[str, Optional[List[Symbol]]]:
+        """Return the symbols of Python files, parsing those not cached.
+
+        Args:
+            paths: Absolute paths of Python files
+
+        Returns:
+            Symbols by path; None for files that are missing or don't parse
+        """
+        result: Dict[str, Optional[List[Symbol]]] = {}
+        missing: List[str] = []
+        for path in dict.fromkeys(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                result[path] = None
+                continue
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    result[path] = entry[2]
+                    continue
+                self.misses += 1
+            missing.append(path)
+
+        if not missing:
+            return result
+        if (
+            len(missing) >= Config.SYMBOL_INDEX_POOL_MIN_FILES
+            and Config.SYMBOL_INDEX_WORKERS > 1
+        ):
+            try:
+                indexed = list(self._get_pool().map(_index_file, missing, chunksize=8))
+            except Exception as e:
+                logger.warning(f"Symbol index worker pool failed, parsing inline: {e}")
+                indexed = [self._index_inline(path) for path in missing]
+        else:
+            indexed = [self._index_inline(path) for path in missing]
+
+        with self._lock:
+            for path, mtime_ns, size, symbols in indexed:
+                if size < 0:
+                    result[path] = None
+                    continue
+                self._entries[path] = (mtime_ns, size, symbols)
+                self._entries.move_to_end(path)
+                result[path] = symbols
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _index_inline(path: str) -> Tuple[str, int, int, Optional[List[Symbol]]]:
+        try:
+            return _index_file(path)
+        except OSError as e:
+            logger.warning(f"Could not index symbols of {path}: {e}")
+            return path, -1, -1, None
+
+    def get(self, path: str) -> Optional[List[Symbol]]:
+        """Return the symbols of a Python file, or None if it can't be parsed."""
+        return self.get_many([path])[path]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            return {
+                "files": len(self._entries),
+                "max_files": self.max_files,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+symbol_index = SymbolIndex(Config.SYMBOL_INDEX_MAX_FILES)
+
+
+def extract_symbols(
+    source: str,
+    symbols: List[Symbol],
+    names: Iterable[str],
+    transform: Optional[Callable[[str], str]] = None,
+) -> Tuple[str, List[str]]:
+    """Cut the source of the named symbols out of a file.
+
+    Symbols are emitted in source order, dedented, separated by blank lines;
+    a symbol inside another selected one is not repeated.
+
+    Args:
+        source: File content, with universal newlines
+        symbols: The file's symbols
+        names: Qualified names of the symbols to extract
+        transform: Applied to the source of each extracted symbol
+
+    Returns:
+        Tuple of (extracted source, names that were not found)
+    """
+    by_name = {symbol.name: symbol for symbol in symbols}
+    wanted = list(dict.fromkeys(names))
+    selected = sorted(
+        (by_name[name] for name in wanted if name in by_name),
+        key=lambda symbol: (symbol.start_line, -symbol.end_line),
+    )
+    # Not splitlines(): ast counts only newlines, not form feeds and the like
+    lines = source.split("\n")
+    parts = []
+    covered_until = 0
+    for symbol in selected:
+        if symbol.end_line <= covered_until:
+            continue
+        # Methods and nested functions lose the indentation of their parent
+        part = textwrap.dedent(
+            "\n".join(lines[symbol.start_line - 1 : symbol.end_line])
+        )
+        parts.append(transform(part) if transform else part)
+        covered_until = symbol.end_line
+    return "\n\n".join(parts), [name for name in wanted if name not in by_name]
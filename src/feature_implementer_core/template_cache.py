@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import database
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot(NamedTuple):
+    revision: int
+    # database.template_writes when the snapshot was last validated
+    writes: int
+    checked_at: float
+    templates: List[Dict[str, Any]]
+    by_id: Dict[int, Dict[str, Any]]
+    default_id: Optional[int]
+
+
+class TemplateCache:
+    """Process-wide copy of the templates table, validated by its revision.
+
+    Every template write bumps a revision row in the database. The cached
+    templates are trusted for check_interval seconds, after which one query
+    of that row tells whether they are still current; writes made by this
+    process are seen at once. Hot requests therefore don't touch the
+    database at all, and all templates are reloaded together when any of
+    them changed.
+
+    The same functions as in database are offered; they return copies, so
+    callers can modify the results.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._snapshots: Dict[str, _Snapshot] = {}
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.checks: int = 0
+        self.reloads: int = 0
+
+    def _snapshot(self, db_path: Path) -> _Snapshot:
+        key = str(db_path)
+        now = time.monotonic()
+        writes = database.template_writes
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if (
+                snapshot is not None
+                and snapshot.writes == writes
+                and now - snapshot.checked_at < self.check_interval
+            ):
+                self.hits += 1
+                return snapshot
+            if snapshot is not None:
+                self.checks += 1
+                if database.get_template_revision(db_path) == snapshot.revision:
+                    snapshot = snapshot._replace(writes=writes, checked_at=now)
+                    self._snapshots[key] = snapshot
+                    return snapshot
+            # Reloading under the lock keeps concurrent misses to one query
+            self.reloads += 1
+            revision, templates = database.get_templates_with_revision(db_path)
+            default_ids = [t["id"] for t in templates if t["is_default"]]
+            snapshot = _Snapshot(
+                revision if revision is not None else -1,
+                writes,
+                now,
+                templates,
+                {template["id"]: template for template in templates},
+                default_ids[0] if default_ids else None,
+            )
+            if revision is None:
+                # Unreadable revision: don't trust this copy next time
+                self._snapshots.pop(key, None)
+            else:
+                self._snapshots[key] = snapshot
+                logger.debug(
+                    f"Loaded {len(templates)} templates at revision {revision}"
+                )
+            return snapshot
+
+    def get_templates(self, db_path: Path) -> List[Dict[str, Any]]:
+        """Return all templates, ordered by name."""
+        return [dict(template) for template in self._snapshot(db_path).templates]
+
+    def get_template_by_id(
+        self, db_path: Path, template_id: int
+    ) -> Optional[Dict[str, Any]]:
+        """Return a template by its ID, or None if there is none."""
+        template = self._snapshot(db_path).by_id.get(template_id)
+        if template is None:
+            logger.warning(f"Template ID {template_id} not found.")
+            return None
+        return dict(template)
+
+    def get_default_template_id(self, db_path: Path) -> Optional[int]:
+        """Return the ID of the default template, if one is set."""
+        return self._snapshot(db_path).default_id
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            return {
+                "databases": len(self._snapshots),
+                "templates": sum(len(s.templates) for s in self._snapshots.values()),
+                "revisions": {
+                    db_path: snapshot.revision
+                    for db_path, snapshot in self._snapshots.items()
+                },
+                "check_interval": self.check_interval,
+                "hits": self.hits,
+                "checks": self.checks,
+                "reloads": self.reloads,
+            }
+
+
+template_cache = TemplateCache(Config.TEMPLATE_CACHE_CHECK_INTERVAL)
@@ -0,0 +1,351 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .config import Config
+
+# Placeholders generate_prompt fills in for every template
+BUILTIN_PLACEHOLDERS = (
+    "relevant_code_context",
+    "jira_description",
+    "additional_instructions",
+)
+
+# Placeholders ({name}) and section markers ({?name} ... {/name}), found in a
+# single pass. A marker on a line of its own takes the whole line with it.
+TOKEN_PATTERN = re.compile(
+    r"^[ \t]*\{(?P<line_marker>[?/])(?P<line_name>[A-Za-z_][A-Za-z0-9_]*)\}[ \t]*(?:\n|\Z)"
+    r"|\{(?P<marker>[?/]?)(?P<name>[A-Za-z_][A-Za-z0-9_]*)\}",
+    re.M,
+)
+
+# Sections of the built-in placeholders recognised by their headings, for
+# templates written before section markers existed: the heading, a code
+# fence around the placeholder, up to the next heading
+LEGACY_SECTIONS = {
+    "jira_description": re.compile(
+        r"## JIRA DESCRIPTION \(Optional\)\n\n```\n\{jira_description\}\n```\n\n(?=## |$)"
+    ),
+    "additional_instructions": re.compile(
+        r"## ADDITIONAL INSTRUCTIONS \(Optional\)\n\n```\n\{additional_instructions\}\n```\n\n(?=## |$)"
+    ),
+    "relevant_code_context": re.compile(
+        r"## RELEVANT CODE CONTEXT\n\n```\n\{relevant_code_context\}\n```\n\n(?=## |$)"
+    ),
+}
+
+_BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+
+class TemplateSyntaxError(ValueError):
+    """A template's section markers don't match up."""
+
+
+class Placeholder(NamedTuple):
+    """A placeholder to fill in, by name (without braces)."""
+
+    name: str
+
+
+class Section(NamedTuple):
+    """Part of a template that is dropped when a placeholder is empty."""
+
+    name: str
+    segments: Tuple["Segment", ...]
+
+
+Segment = Union[str, Placeholder, Section]
+# Literal text and placeholders, in template order
+Plan = Tuple[Union[str, Placeholder], ...]
+
+
+def _line_number(text: str, position: int) -> int:
+    return text.count("\n", 0, position) + 1
+
+
+def _parse(text: str) -> Tuple[List[Segment], bool]:
+    """Split a template into text, placeholders and (nested) sections.
+
+    Returns:
+        The segments, and whether the template had any section markers
+
+    Raises:
+        TemplateSyntaxError: If section markers are unbalanced
+    """
+    # Each open section: (name, position, segments of its parent)
+    stack: List[Tuple[str, int, List[Segment]]] = []
+    segments: List[Segment] = []
+    has_markers = False
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.start() > position:
+            segments.append(text[position : match.start()])
+        position = match.end()
+        marker = match.group("line_marker") or match.group("marker")
+        name = match.group("line_name") or match.group("name")
+        if not marker:
+            segments.append(Placeholder(name))
+            continue
+        has_markers = True
+        if marker == "?":
+            stack.append((name, match.start(), segments))
+            segments = []
+            continue
+        if not stack:
+            raise TemplateSyntaxError(
+                f"Line {_line_number(text, match.start())}: "
+                f"{{/{name}}} closes no section"
+            )
+        opened, _, parent = stack.pop()
+        if opened != name:
+            raise TemplateSyntaxError(
+                f"Line {_line_number(text, match.start())}: "
+                f"{{/{name}}} closes section {{?{opened}}}"
+            )
+        parent.append(Section(name, tuple(segments)))
+        segments = parent
+    if stack:
+        name, start, _ = stack[-1]
+        raise TemplateSyntaxError(
+            f"Line {_line_number(text, start)}: section {{?{name}}} is never closed"
+        )
+    if position < len(text):
+        segments.append(text[position:])
+    return segments, has_markers
+
+
+def _parse_legacy(text: str) -> Optional[List[Segment]]:
+    """Parse a template without markers, finding sections by their headings.
+
+    Returns:
+        The segments, or None if the template has none of those sections
+    """
+    matches = sorted(
+        (match.start(), match.end(), name)
+        for name, pattern in LEGACY_SECTIONS.items()
+        for match in pattern.finditer(text)
+    )
+    if not matches:
+        return None
+    segments: List[Segment] = []
+    position = 0
+    for start, end, name in matches:
+        if start < position:
+            continue
+        segments += _parse(text[position:start])[0]
+        segments.append(Section(name, tuple(_parse(text[start:end])[0])))
+        position = end
+    segments += _parse(text[position:])[0]
+    return segments
+
+
+def _walk_names(segments: Iterable[Segment]) -> Iterator[str]:
+    for segment in segments:
+        if isinstance(segment, Placeholder):
+            yield segment.name
+        elif isinstance(segment, Section):
+            yield segment.name
+            yield from _walk_names(segment.segments)
+
+
+def _walk_sections(segments: Iterable[Segment]) -> Iterator[str]:
+    for segment in segments:
+        if isinstance(segment, Section):
+            yield segment.name
+            yield from _walk_sections(segment.segments)
+
+
+def _flatten(
+    segments: Iterable[Segment],
+    empty: FrozenSet[str],
+    pieces: List[Union[str, Placeholder]],
+) -> None:
+    for segment in segments:
+        if isinstance(segment, Section):
+            if segment.name not in empty:
+                _flatten(segment.segments, empty, pieces)
+        elif isinstance(segment, str) and pieces and isinstance(pieces[-1], str):
+            pieces[-1] += segment
+        else:
+            pieces.append(segment)
+
+
+class CompiledTemplate:
+    """A template parsed once into literal text, placeholders and sections.
+
+    Any {name} is a placeholder. Text between {?name} and {/name} is an
+    optional section, kept only when name has content; sections can nest.
+    Templates without section markers get the sections of the built-in
+    placeholders recognised by their headings instead.
+
+    Rendering never searches the template again: plan() resolves the
+    sections for a set of empty placeholders into a flat sequence of text
+    and placeholders, once per set, and values are then inserted between
+    the pieces without being scanned.
+
+    Raises:
+        TemplateSyntaxError: If section markers are unbalanced
+    """
+
+    def __init__(self, content: str, digest: str):
+        self.digest = digest
+        segments, has_markers = _parse(content)
+        if not has_markers:
+            segments = _parse_legacy(content) or segments
+        self.segments: Tuple[Segment, ...] = tuple(segments)
+        # Placeholder and section names, in order of first use
+        self.names: Tuple[str, ...] = tuple(dict.fromkeys(_walk_names(segments)))
+        self._known = frozenset(self.names) | frozenset(BUILTIN_PLACEHOLDERS)
+        # Blank lines are collapsed once one of these is empty
+        self._collapsing = frozenset(_walk_sections(segments)) | frozenset(
+            BUILTIN_PLACEHOLDERS
+        )
+        self._plans: Dict[FrozenSet[str], Plan] = {}
+
+    @property
+    def custom_names(self) -> Tuple[str, ...]:
+        """Names the template uses besides the built-in placeholders."""
+        return tuple(name for name in self.names if name not in BUILTIN_PLACEHOLDERS)
+
+    def plan(self, empty: FrozenSet[str]) -> Plan:
+        """Return the pieces of the template for placeholders without content.
+
+        The sections of empty placeholders are left out and, if a section
+        or built-in placeholder is empty, runs of blank lines are collapsed. Adjacent text is merged,
+        so text and placeholders alternate.
+
+        Args:
+            empty: Names of placeholders that have no content
+
+        Returns:
+            Literal strings and Placeholders, in template order
+        """
+        empty = frozenset(empty) & self._known
+        plan = self._plans.get(empty)
+        if plan is not None:
+            return plan
+        pieces: List[Union[str, Placeholder]] = []
+        _flatten(self.segments, empty, pieces)
+        if empty & self._collapsing:
+            pieces = [
+                (
+                    _BLANK_LINES_PATTERN.sub("\n\n", piece)
+                    if isinstance(piece, str)
+                    else piece
+                )
+                for piece in pieces
+            ]
+        plan = tuple(piece for piece in pieces if piece != "")
+        self._plans[empty] = plan
+        return plan
+
+    def render(self, values: Dict[str, str]) -> str:
+        """Fill in the template, dropping the sections of empty placeholders.
+
+        Placeholders without content and without a section to drop are left
+        as they are.
+        """
+        filled = {name: value for name, value in values.items() if value.strip()}
+        plan = self.plan(self._known - filled.keys())
+        return "".join(
+            piece if isinstance(piece, str) else filled.get(piece.name, _raw(piece))
+            for piece in plan
+        )
+
+
+def _raw(placeholder: Placeholder) -> str:
+    return "{" + placeholder.name + "}"
+
+
+def template_digest(content: str) -> str:
+    """Hash a template's content; edits change it."""
+    return hashlib.blake2b(
+        content.encode("utf-8", errors="surrogatepass"), digest_size=16
+    ).hexdigest()
+
+
+class CompiledTemplateCache:
+    """LRU cache of compiled templates by template ID and content hash.
+
+    An edited template simply misses, so entries never need invalidating.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, str], CompiledTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, template_id: int, content: str) -> CompiledTemplate:
+        """Return the compiled template, compiling it on a miss."""
+        digest = template_digest(content)
+        key = (template_id, digest)
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = CompiledTemplate(content, digest)
+        with self._lock:
+            self._entries[key] = compiled
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def compile_template(content: str) -> CompiledTemplate:
+    """Compile a template without caching it, e.g. to validate it.
+
+    Raises:
+        TemplateSyntaxError: If section markers are unbalanced
+    """
+    return CompiledTemplate(content, template_digest(content))
+
+
+compiled_templates = CompiledTemplateCache(Config.COMPILED_TEMPLATE_CACHE_ENTRIES)
+
+
+def remove_section(template: str, placeholder_name: str) -> str:
+    """Removes a markdown section containing a placeholder if the placeholder has no content.
+
+    Args:
+        template: The template content string
+        placeholder_name: The name of the placeholder to remove (without braces)
+
+    Returns:
+        Template with the specified section removed if the placeholder was found
+    """
+    if placeholder_name not in BUILTIN_PLACEHOLDERS:
+        return template
+    plan = compile_template(template).plan(frozenset([placeholder_name]))
+    return "".join(piece if isinstance(piece, str) else _raw(piece) for piece in plan)
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import tiktoken
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Loaded tiktoken encodings by encoding name; None if loading failed
+_encoders: Dict[str, Optional[Any]] = {}
+_encoders_lock = threading.Lock()
+
+
+def encoding_name(model: Optional[str] = None) -> str:
+    """Return the tiktoken encoding name for a model, or the configured one.
+
+    Unknown models use the configured encoding.
+    """
+    if model:
+        try:
+            return tiktoken.encoding_name_for_model(model)
+        except KeyError:
+            logger.debug(
+                f"No token encoding known for model {model}, using {Config.TOKEN_ENCODING}"
+            )
+    return Config.TOKEN_ENCODING
+
+
+def get_encoder(model: Optional[str] = None) -> Optional[Any]:
+    """Return the tiktoken encoding for a model, loading it on first use.
+
+    Each encoding is loaded once per process; a failed load is not retried.
+
+    Args:
+        model: Model whose encoding to use; defaults to Config.TOKEN_ENCODING
+
+    Returns:
+        The encoding, or None if it could not be loaded
+    """
+    name = encoding_name(model)
+    if name not in _encoders:
+        with _encoders_lock:
+            if name not in _encoders:
+                try:
+                    _encoders[name] = tiktoken.get_encoding(name)
+                except Exception as e:
+                    logger.warning(
+                        f"Could not load token encoding {name}, "
+                        f"falling back to size estimates: {e}"
+                    )
+                    _encoders[name] = None
+    return _encoders[name]
+
+
+# Process that started loading the default encoding in the background
+_warmup_pid: Optional[int] = None
+
+
+def warm_tokenizer() -> None:
+    """Load the configured encoding in the background, once per process."""
+    global _warmup_pid
+    if Config.TOKEN_ENCODING in _encoders or _warmup_pid == os.getpid():
+        return
+    _warmup_pid = os.getpid()
+    threading.Thread(target=get_encoder, name="tokenizer-warmup", daemon=True).start()
+
+
+class TokenCountCache:
+    """LRU cache of token counts by encoding and content hash.
+
+    Counts of texts shorter than min_chars are not cached: they are cheaper
+    to encode than to look up.
+    """
+
+    def __init__(self, max_entries: int, min_chars: int = 4096):
+        self.max_entries = max_entries
+        self.min_chars = min_chars
+        self._entries: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def key(self, encoding: str, text: str) -> Optional[Tuple[str, bytes]]:
+        """Return the cache key of a text, or None if it isn't cached."""
+        if len(text) < self.min_chars:
+            return None
+        digest = hashlib.blake2b(
+            text.encode("utf-8", errors="surrogatepass"), digest_size=16
+        ).digest()
+        return encoding, digest
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[int]:
+        with self._lock:
+            tokens = self._entries.get(key)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tokens
+
+    def put(self, key: Tuple[str, bytes], tokens: int) -> None:
+        with self._lock:
+            self._entries[key] = tokens
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache metrics for monitoring."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "encodings_loaded": sorted(
+                    name for name, encoder in _encoders.items() if encoder is not None
+                ),
+            }
+
+
+token_count_cache = TokenCountCache(Config.TOKEN_COUNT_CACHE_ENTRIES)
+
+
+def count_tokens_batch(
+    texts: Sequence[str], model: Optional[str] = None
+) -> List[Optional[int]]:
+    """Count the tokens of several texts, encoding them on a thread pool.
+
+    Counts of large texts are cached by content hash, so the same content
+    is only encoded once, whatever file it came from.
+
+    Args:
+        texts: Texts to count
+        model: Model whose encoding to use; defaults to Config.TOKEN_ENCODING
+
+    Returns:
+        Token count per text, or None for all if the encoding could not be loaded
+    """
+    encoder = get_encoder(model)
+    if encoder is None:
+        return [None] * len(texts)
+    name = encoder.name
+    counts: List[Optional[int]] = [None] * len(texts)
+    keys = [token_count_cache.key(name, text) for text in texts]
+    pending = []
+    # Texts with the same content as a pending one, by that one's index
+    duplicates: Dict[int, List[int]] = {}
+    first_pending: Dict[Tuple[str, bytes], int] = {}
+    for i, key in enumerate(keys):
+        if key is not None:
+            if key in first_pending:
+                duplicates.setdefault(first_pending[key], []).append(i)
+                continue
+            counts[i] = token_count_cache.get(key)
+        if counts[i] is None:
+            pending.append(i)
+            if key is not None:
+                first_pending[key] = i
+    if len(pending) == 1:
+        encoded = [encoder.encode(texts[pending[0]], disallowed_special=())]
+    elif pending:
+        encoded = encoder.encode_batch(
+            [texts[i] for i in pending],
+            num_threads=Config.TOKENIZER_THREADS,
+            disallowed_special=(),
+        )
+    else:
+        encoded = []
+    for i, tokens in zip(pending, encoded):
+        counts[i] = len(tokens)
+        if keys[i] is not None:
+            token_count_cache.put(keys[i], counts[i])
+        for duplicate in duplicates.get(i, ()):
+            counts[duplicate] = counts[i]
+    return counts
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> Optional[int]:
+    """Count the tokens of a text with tiktoken.
+
+    Args:
+        text: Text to count
+        model: Model whose encoding to use; defaults to Config.TOKEN_ENCODING
+
+    Returns:
+        Number of tokens, or None if the encoding could not be loaded
+    """
+    return count_tokens_batch([text], model)[0]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens of a text at 4 characters per token, rounded up."""
+    return -(-len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Cut a text down to its first max_tokens tokens.
+
+    Without a tiktoken encoding, the text is cut at the estimated 4
+    characters per token instead.
+
+    Args:
+        text: Text to cut
+        max_tokens: Tokens to keep
+        model: Model whose encoding to use; defaults to Config.TOKEN_ENCODING
+
+    Returns:
+        The leading part of the text
+    """
+    if max_tokens <= 0:
+        return ""
+    encoder = get_encoder(model)
+    if encoder is None:
+        return text[: max_tokens * 4]
+    tokens = encoder.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max_tokens])
@@ -0,0 +1,91 @@
+from pathlib import Path
+
+import pytest
+
+from feature_implementer_core import database, file_utils, tokenizer
+from feature_implementer_core.config import Config
+
+TEMPLATE = (
+    "# Prompt\n\n"
+    "## RELEVANT CODE CONTEXT\n\n```\n{relevant_code_context}\n```\n\n"
+    "## JIRA DESCRIPTION (Optional)\n\n```\n{jira_description}\n```\n\n"
+    "## ADDITIONAL INSTRUCTIONS (Optional)\n\n```\n{additional_instructions}\n```\n\n"
+    "## TASK\n\nImplement it.\n"
+)
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """A workspace directory, set as the workspace root and working directory."""
+    root = tmp_path / "workspace"
+    root.mkdir()
+    previous = Config.WORKSPACE_ROOT
+    Config.set_workspace_root(str(root))
+    monkeypatch.chdir(root)
+    yield root
+    Config.set_workspace_root(str(previous))
+
+
+@pytest.fixture
+def db_path(tmp_path: Path) -> Path:
+    """An initialized database outside the workspace."""
+    path = tmp_path / "test.db"
+    database.initialize_database(path)
+    return path
+
+
+@pytest.fixture
+def template_id(db_path: Path) -> int:
+    """ID of the default template of db_path."""
+    success, result = database.add_template(
+        db_path, name="Test", content=TEMPLATE, is_default=True
+    )
+    assert success, result
+    return result
+
+
+def reset_file_tree_cache() -> None:
+    """Forget the cached tree, index and derived caches of this process."""
+    file_utils.file_tree_cache.__init__(file_utils.file_tree_cache.ttl_seconds)
+    file_utils.path_search_index.clear()
+    file_utils._file_token_counts.clear()
+
+
+@pytest.fixture
+def file_index(
+    workspace: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Path:
+    """The workspace with an empty file tree cache and its own app database."""
+    monkeypatch.setattr(Config, "APP_DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(Config, "DB_PATH", tmp_path / "data" / "app.db")
+    (tmp_path / "data").mkdir()
+    database.initialize_database(Config.DB_PATH)
+    reset_file_tree_cache()
+    yield workspace
+    reset_file_tree_cache()
+
+
+class WordEncoding:
+    """Stand-in for a tiktoken encoding with one token per whitespace-separated word."""
+
+    name = "words"
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def encode_batch(self, texts, num_threads=1, disallowed_special=()):
+        return [text.split() for text in texts]
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_tokens(monkeypatch: pytest.MonkeyPatch) -> WordEncoding:
+    """Count tokens as words, so counts don't depend on downloading an encoding."""
+    encoding = WordEncoding()
+    monkeypatch.setitem(tokenizer._encoders, Config.TOKEN_ENCODING, encoding)
+    monkeypatch.setattr(
+        tokenizer, "token_count_cache", tokenizer.TokenCountCache(100, min_chars=1)
+    )
+    return encoding
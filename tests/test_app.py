@@ -0,0 +1,157 @@
+from pathlib import Path
+
+import pytest
+
+from feature_implementer_core import app as app_module
+from feature_implementer_core.app import create_app
+from feature_implementer_core.config import Config
+
+
+@pytest.fixture
+def client(file_index: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """A test client of the app serving the workspace, without a file watcher."""
+    monkeypatch.setattr(Config, "PROMPTS_DIR", tmp_path / "prompts")
+    monkeypatch.setattr(Config, "FILE_WATCH_MODE", "off")
+    app = create_app()
+    app.testing = True
+    return app.test_client()
+
+
+def test_caches_are_warmed_once_per_process(client, monkeypatch):
+    warmed = []
+    monkeypatch.setattr(
+        app_module, "warm_path_search_index", lambda: warmed.append("search")
+    )
+    monkeypatch.setattr(app_module, "warm_tokenizer", lambda: warmed.append("tokens"))
+    assert client.get("/file_tree/stats").status_code == 200
+    assert client.get("/file_tree/stats").status_code == 200
+    assert warmed == ["search", "tokens"]
+
+
+@pytest.fixture
+def tree_client(client, workspace: Path):
+    """A client serving a workspace of folders and files of mixed case."""
+    for path in ["B_dir/x.py", "a_dir/y.py", "a_dir/z.py", "Zeta.py", "alpha.py"]:
+        (workspace / path).parent.mkdir(exist_ok=True)
+        (workspace / path).write_text("print(1)\n")
+    (workspace / "beta.txt").write_text("beta\n")
+    (workspace / "empty_dir").mkdir()
+    assert client.get("/refresh_file_tree").status_code == 200
+    return client
+
+
+def children(client, path, **params):
+    response = client.get("/file_tree/children", query_string={"path": path, **params})
+    return response.status_code, response.get_json()
+
+
+def test_children_are_paged_folders_first(tree_client, workspace):
+    root = workspace.as_posix()
+    pages = [
+        children(tree_client, root, offset=offset, limit=2)[1] for offset in (0, 2, 4)
+    ]
+    assert [[entry["name"] for entry in page["entries"]] for page in pages] == [
+        ["a_dir", "B_dir"],
+        ["alpha.py", "beta.txt"],
+        ["Zeta.py"],
+    ]
+    assert [page["has_more"] for page in pages] == [True, True, False]
+    assert {page["total"] for page in pages} == {5}
+
+    folder = pages[0]["entries"][0]
+    assert folder["type"] == "folder"
+    assert folder["child_count"] == 2
+    assert folder["file_count"] == 2
+    file_entry = pages[1]["entries"][1]
+    assert file_entry["type"] == "file"
+    assert file_entry["path"] == f"{root}/beta.txt"
+    assert file_entry["size"] == 5
+    assert pages[0]["totals"]["file_count"] == 6
+
+
+def test_children_of_a_subfolder(tree_client, workspace):
+    status, listing = children(tree_client, f"{workspace.as_posix()}/a_dir/")
+    assert status == 200
+    assert listing["path"] == f"{workspace.as_posix()}/a_dir"
+    assert [entry["name"] for entry in listing["entries"]] == ["y.py", "z.py"]
+
+
+@pytest.mark.parametrize(
+    "path, params, status",
+    [
+        ("", {}, 400),
+        ("{root}", {"offset": "x"}, 400),
+        ("{root}/missing", {}, 404),
+        # Folders without files are hidden from the explorer
+        ("{root}/empty_dir", {}, 404),
+        ("/etc", {}, 404),
+    ],
+)
+def test_children_errors(tree_client, workspace, path, params, status):
+    path = path.format(root=workspace.as_posix())
+    assert children(tree_client, path, **params)[0] == status
+
+
+def test_children_limit_is_capped(tree_client, workspace, monkeypatch):
+    monkeypatch.setattr(Config, "FILE_TREE_PAGE_SIZE", 1)
+    status, listing = children(tree_client, workspace.as_posix(), limit=100)
+    assert status == 200
+    assert listing["limit"] == 5
+    assert len(listing["entries"]) == 5
+
+
+@pytest.fixture
+def db_path(file_index: Path) -> Path:
+    """The app's own database, for the template_id fixture."""
+    return Config.DB_PATH
+
+
+@pytest.fixture
+def prompt_form(client, template_id, workspace: Path):
+    """Form fields generating a prompt of two context files."""
+    for name in ["a.py", "b.py"]:
+        (workspace / name).write_text(f"{name[0]} = 1\n")
+    return {
+        "template_id": str(template_id),
+        "context_files": [str(workspace / "a.py"), str(workspace / "b.py")],
+        "jira_description": "Do it",
+    }
+
+
+def test_generate_streams_the_prompt(client, prompt_form):
+    expected = client.post("/generate", data=prompt_form).get_json()["prompt"]
+    response = client.post("/generate", data={**prompt_form, "stream": "1"})
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert response.is_streamed
+    assert response.headers.get("Content-Length") is None
+    assert response.get_data(as_text=True) == expected
+    assert "--- START FILE: a.py ---\na = 1\n--- END FILE: a.py ---" in expected
+
+
+def test_generate_sets_an_etag_per_representation(client, prompt_form):
+    json_etag = client.post("/generate", data=prompt_form).headers["ETag"]
+    text_etag = client.post("/generate", data={**prompt_form, "stream": "1"}).headers[
+        "ETag"
+    ]
+    assert json_etag and text_etag and json_etag != text_etag
+    assert client.post("/generate", data=prompt_form).headers["ETag"] == json_etag
+
+
+def test_generate_returns_304_for_the_client_copy(client, prompt_form, workspace):
+    etag = client.post("/generate", data=prompt_form).headers["ETag"]
+    response = client.post(
+        "/generate", data=prompt_form, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.get_data() == b""
+
+    # A changed context file makes a new prompt
+    (workspace / "a.py").write_text("a = 22\n")
+    response = client.post(
+        "/generate", data=prompt_form, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "a = 22" in response.get_json()["prompt"]
@@ -0,0 +1,77 @@
+import json
+import re
+
+import pytest
+
+from feature_implementer_core.batch import BatchJob, parse_manifest, run_batch
+
+
+def manifest(*entries):
+    return [
+        json.dumps(entry) if isinstance(entry, dict) else entry for entry in entries
+    ]
+
+
+def test_parse_manifest_reads_jobs_and_skips_blank_lines():
+    jobs = parse_manifest(
+        manifest(
+            {"id": "login", "jira": "Add login", "context_files": ["a.py::User"]},
+            "   ",
+            {"template_id": 2, "output": "out/2.md"},
+        )
+    )
+    assert jobs == [
+        BatchJob("login", jira_description="Add login", context_files=("a.py::User",)),
+        BatchJob("3", template_id=2, output="out/2.md"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "line, message",
+    [
+        ("{not json", "Line 2: invalid JSON"),
+        ("[1, 2]", "Line 2: expected a JSON object"),
+        ({"jira": "x", "colour": 1}, "Line 2: unknown keys colour"),
+        ({"context_files": "a.py"}, "Line 2: context_files must be a list of paths"),
+        ({"context_files": [1]}, "Line 2: context_files must be a list of paths"),
+        ({"template_id": "1"}, "Line 2: template_id must be an integer"),
+        ({"template_id": True}, "Line 2: template_id must be an integer"),
+        ({"template_values": {"a": 1}}, "Line 2: template_values must map"),
+        ({"jira": ["x"]}, "Line 2: jira_description must be a string"),
+        ({"id": "first"}, "Line 2: duplicate job id first"),
+    ],
+)
+def test_parse_manifest_rejects_bad_lines(line, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        parse_manifest(manifest({"id": "first"}, line))
+
+
+@pytest.mark.parametrize("output", ["../escape.md", "/tmp/elsewhere.md"])
+def test_run_batch_rejects_outputs_outside_the_output_root(
+    db_path, template_id, tmp_path, output
+):
+    jobs = [BatchJob("ok", output="fine.md"), BatchJob("bad", output=output)]
+    with pytest.raises(ValueError, match="Job bad: output must be within"):
+        run_batch(jobs, db_path, output_root=tmp_path / "prompts", max_workers=1)
+    # Nothing is written before every output is checked
+    assert not (tmp_path / "prompts" / "fine.md").exists()
+
+
+def test_run_batch_writes_outputs_under_the_output_root(
+    db_path, template_id, workspace, tmp_path
+):
+    (workspace / "a.py").write_text("A = 1\n")
+    jobs = parse_manifest(
+        manifest(
+            {"id": "one", "jira": "First", "context_files": [str(workspace / "a.py")]},
+            {"id": "two", "jira": "Second", "output": "sub/two.md"},
+            {"id": "missing", "template_id": 999},
+        )
+    )
+    result = run_batch(jobs, db_path, output_root=tmp_path / "prompts", max_workers=1)
+    one, two, missing = result["jobs"]
+    assert "--- START FILE: a.py ---" in one["prompt"]
+    assert "First" in one["prompt"]
+    assert "prompt" not in two
+    assert "Second" in (tmp_path / "prompts" / "sub" / "two.md").read_text()
+    assert missing["error"] == "Template ID 999 not found"
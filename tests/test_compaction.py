@@ -0,0 +1,134 @@
+import pytest
+
+from feature_implementer_core.compaction import (
+    COMPACTION_STRATEGIES,
+    Compaction,
+    compact_text,
+    language_for,
+)
+
+PYTHON_SOURCE = '''# Copyright 2024 Example Corp. Licensed under MIT.
+
+"""Module docstring."""
+
+import re  # for patterns
+
+URL = "http://example.com/#anchor"
+
+
+class Parser:
+    """Parses things."""
+
+    def parse(self, text):
+        """Parse text."""
+        # Split on hashes
+        return text.split("#")
+
+
+def stub():
+    """Only a docstring."""
+'''
+
+
+def compact(text: str, file_name: str, *strategies: str) -> str:
+    return Compaction(strategies).compact(text, file_name)
+
+
+def test_license_banner_is_dropped():
+    result = compact(PYTHON_SOURCE, "a.py", "license")
+    assert result.startswith('"""Module docstring."""')
+
+
+def test_non_license_header_is_kept():
+    text = "# Utilities for parsing\nimport re\n"
+    assert compact(text, "a.py", "license") == text
+
+
+def test_python_comments_are_stripped_outside_strings():
+    result = compact(PYTHON_SOURCE, "a.py", "comments")
+    assert "# for patterns" not in result
+    assert "# Split on hashes" not in result
+    assert "import re\n" in result
+    assert 'URL = "http://example.com/#anchor"' in result
+    assert 'return text.split("#")' in result
+    assert '"""Parses things."""' in result
+
+
+def test_python_docstrings_are_stripped_keeping_code_valid():
+    result = compact(PYTHON_SOURCE, "a.py", "docstrings")
+    assert '"""' not in result
+    assert "# Split on hashes" in result
+    assert "def stub():\n    ...\n" in result
+    compile(result, "a.py", "exec")
+
+
+def test_docstrings_of_an_indented_snippet():
+    snippet = '    def save(self):\n        """Save."""\n        return 1\n'
+    assert compact(snippet, "a.py", "docstrings") == (
+        "    def save(self):\n        return 1\n"
+    )
+
+
+def test_c_like_comments_keep_doc_comments_unless_asked():
+    source = (
+        "/** Adds. */\nint add(int a, int b) { // sum\n"
+        '  /* inline */ return a + b; /* "x" */\n}\nchar *s = "// not a comment";\n'
+    )
+    result = compact(source, "a.c", "comments")
+    assert result == (
+        "/** Adds. */\nint add(int a, int b) {\n   return a + b;\n}\n"
+        'char *s = "// not a comment";\n'
+    )
+    assert compact(source, "a.c", "docstrings").startswith("int add")
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        "if (/https?:\\/\\//.test(u)) { go(u); }",
+        "const re = /[/]+/g;",
+        "return /\\/\\*x/.test(s);",
+        "/^\\/\\//.test(u) && run();",
+        "const parts = s.split(/\\/\\//);",
+    ],
+)
+def test_javascript_regex_literals_are_not_comments(line):
+    assert compact(line + " // note\n", "a.ts", "comments") == line + "\n"
+
+
+def test_javascript_division_is_not_a_regex():
+    assert compact("x = a / b / c; // div\n", "a.js", "comments") == (
+        "x = a / b / c;\n"
+    )
+
+
+def test_shell_hash_needs_whitespace_before_it():
+    source = "#!/bin/sh\necho a#b # comment\n# whole line\nrun\n"
+    assert compact(source, "run.sh", "comments") == "#!/bin/sh\necho a#b\nrun\n"
+
+
+def test_whitespace_collapses_blank_runs_and_trailing_spaces():
+    source = "a = 1   \n\n\n\nb = 2\t\n"
+    assert compact(source, "notes.txt", "whitespace") == "a = 1\n\nb = 2\n"
+
+
+def test_unknown_languages_only_get_whitespace_compaction():
+    source = "# heading\n\n\n\ntext\n"
+    assert compact(source, "README", *COMPACTION_STRATEGIES) == "# heading\n\ntext\n"
+
+
+def test_language_for():
+    assert language_for("src/app.py") == "python"
+    assert language_for("web/App.TSX") == "javascript"
+    assert language_for("main.go") == "c"
+    assert language_for("Dockerfile") == "shell"
+    assert language_for("data.bin") is None
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError, match="Unknown compaction strategy 'minify'"):
+        Compaction(["comments", "minify"])
+
+
+def test_compact_text_without_language():
+    assert compact_text("a  \n", None, frozenset({"comments"})) == "a  \n"
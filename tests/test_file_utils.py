@@ -0,0 +1,411 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from feature_implementer_core import file_utils
+from feature_implementer_core.config import Config
+from feature_implementer_core.file_utils import (
+    DirTotals,
+    FileContentCache,
+    compute_dir_totals,
+    file_tree_cache,
+    find_stale_directories,
+    get_file_metadata,
+    get_file_tree,
+    load_persisted_file_tree,
+    read_file_content,
+    refresh_directories,
+    save_prompt_to_file,
+    scan_directory_index,
+    snapshot_directory,
+)
+
+
+@pytest.fixture
+def project(workspace: Path) -> Path:
+    """A workspace with ignored directories, a .gitignore and nested packages."""
+    for path, content in {
+        "README.md": "# Project\n",
+        ".gitignore": "*.log\ngenerated/\n",
+        "app/main.py": "print('hi')\n",
+        "app/debug.log": "log\n",
+        "app/generated/out.py": "x = 1\n",
+        "app/models/user.py": "class User: ...\n",
+        "node_modules/lib/index.js": "module.exports = 1\n",
+        ".git/HEAD": "ref: refs/heads/main\n",
+    }.items():
+        (workspace / path).parent.mkdir(parents=True, exist_ok=True)
+        (workspace / path).write_text(content)
+    (workspace / "empty").mkdir()
+    return workspace
+
+
+def listing(dir_index, root: Path):
+    return {
+        Path(dir_path).relative_to(root).as_posix(): (snapshot.files, snapshot.subdirs)
+        for dir_path, snapshot in dir_index.items()
+    }
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_scan_skips_ignored_entries(project, max_workers):
+    dir_index = scan_directory_index(project, max_workers=max_workers)
+    assert listing(dir_index, project) == {
+        ".": ((".gitignore", "README.md"), ("app", "empty")),
+        "app": (("main.py",), ("models",)),
+        "app/models": (("user.py",), ()),
+        "empty": ((), ()),
+    }
+
+
+def test_scan_never_lists_pruned_directories(project, monkeypatch):
+    listed = []
+    scandir = os.scandir
+
+    def recording_scandir(path):
+        listed.append(Path(path).relative_to(project).as_posix())
+        return scandir(path)
+
+    monkeypatch.setattr(file_utils.os, "scandir", recording_scandir)
+    scan_directory_index(project, max_workers=1)
+    assert sorted(listed) == [".", "app", "app/models", "empty"]
+
+
+def test_scan_records_file_sizes_and_mtimes(project):
+    dir_index = scan_directory_index(project, max_workers=1)
+    snapshot = dir_index[(project / "app").as_posix()]
+    stat = os.stat(project / "app" / "main.py")
+    assert snapshot.file_stat(0) == (stat.st_size, stat.st_mtime_ns)
+    assert list(snapshot.iter_files()) == [("main.py", stat.st_size, stat.st_mtime_ns)]
+
+
+def test_snapshot_applies_the_rules_of_parent_directories(project):
+    snapshot = snapshot_directory((project / "app").as_posix())
+    assert snapshot.files == ("main.py",)
+    assert snapshot.subdirs == ("models",)
+    assert snapshot_directory((project / "missing").as_posix()) is None
+
+
+def bump_mtime(dir_path: Path) -> None:
+    """Move a directory's mtime forward, which coarse timestamps may not have done."""
+    stat = os.stat(dir_path)
+    os.utime(dir_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture
+def scanned(file_index: Path) -> Path:
+    """A workspace scanned once, which persisted its file index."""
+    (file_index / "pkg").mkdir()
+    (file_index / "pkg" / "a.py").write_text("a = 1\n")
+    get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    return file_index
+
+
+def test_persisted_index_is_loaded_without_scanning(scanned):
+    scanned_index = file_tree_cache.dir_index
+    assert load_persisted_file_tree(Config.SCAN_DIRS)
+    assert file_tree_cache.dir_index is not scanned_index
+    assert file_tree_cache.dir_index == scanned_index
+    assert file_tree_cache.dir_totals[scanned.as_posix()].files == 1
+    assert file_tree_cache.stats()["scan_count"] == 1
+
+
+def test_no_persisted_index_to_load(file_index):
+    assert not load_persisted_file_tree(Config.SCAN_DIRS)
+    assert file_tree_cache.cache is None
+
+
+def test_persisted_index_of_other_scan_settings_is_not_loaded(scanned, monkeypatch):
+    monkeypatch.setattr(Config, "IGNORE_PATTERNS", Config.IGNORE_PATTERNS + ["*.md"])
+    assert not load_persisted_file_tree(Config.SCAN_DIRS)
+
+
+def test_loaded_index_is_revalidated_and_saved(scanned):
+    pkg = scanned / "pkg"
+    (pkg / "b.py").write_text("b = 2\n")
+    bump_mtime(pkg)
+    assert load_persisted_file_tree(Config.SCAN_DIRS)
+    assert file_tree_cache.dir_index[pkg.as_posix()].files == ("a.py",)
+
+    stale = find_stale_directories(file_tree_cache.dir_index)
+    assert stale == {pkg.as_posix()}
+    refresh_directories(stale)
+    assert file_tree_cache.dir_index[pkg.as_posix()].files == ("a.py", "b.py")
+    assert find_stale_directories(file_tree_cache.dir_index) == set()
+
+    # The next start loads the revalidated index
+    assert load_persisted_file_tree(Config.SCAN_DIRS)
+    assert file_tree_cache.dir_index[pkg.as_posix()].files == ("a.py", "b.py")
+
+
+def wait_for_scans(count: int) -> None:
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        stats = file_tree_cache.stats()
+        if stats["scan_count"] >= count and not stats["scanning"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"Scans did not finish: {file_tree_cache.stats()}")
+
+
+def test_concurrent_callers_share_one_scan(file_index, monkeypatch):
+    (file_index / "a.py").write_text("")
+    release = threading.Event()
+    scans = []
+
+    def blocking_scan(start_path, max_workers=None):
+        scans.append(start_path)
+        release.wait(5)
+        return scan_directory_index(start_path, max_workers)
+
+    monkeypatch.setattr(file_utils, "scan_directory_index", blocking_scan)
+    trees = []
+    callers = [
+        threading.Thread(target=lambda: trees.append(get_file_tree(Config.SCAN_DIRS)))
+        for _ in range(4)
+    ]
+    for caller in callers:
+        caller.start()
+    deadline = time.monotonic() + 5
+    while file_tree_cache.stats()["scan_waits"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for caller in callers:
+        caller.join(5)
+
+    assert len(scans) == 1
+    assert len(trees) == 4 and all(tree is trees[0] for tree in trees)
+    stats = file_tree_cache.stats()
+    assert (stats["scan_count"], stats["scan_waits"], stats["scanning"]) == (
+        1,
+        3,
+        False,
+    )
+    assert stats["last_scan_seconds"] == stats["max_scan_seconds"] > 0
+
+
+def test_expired_tree_is_served_while_rescanning(scanned):
+    tree = file_tree_cache.cache
+    (scanned / "b.py").write_text("")
+    file_tree_cache.timestamp = 0
+    assert get_file_tree(Config.SCAN_DIRS) is tree
+    assert file_tree_cache.stats()["stale_served"] == 1
+    wait_for_scans(2)
+    assert "b.py" in get_file_tree(Config.SCAN_DIRS).dir_index[scanned.as_posix()].files
+    assert file_tree_cache.stats()["stale_served"] == 1
+
+
+def test_failed_scan_releases_its_claim(file_index, monkeypatch):
+    def failing_scan(start_dirs):
+        raise RuntimeError("disk on fire")
+
+    monkeypatch.setattr(file_utils, "_scan_file_tree", failing_scan)
+    assert len(get_file_tree(Config.SCAN_DIRS)) == 0
+    stats = file_tree_cache.stats()
+    assert (stats["scanning"], stats["scan_count"]) == (False, 0)
+
+
+@pytest.fixture
+def costed(file_index: Path, word_tokens) -> Path:
+    """A scanned workspace with text files of known size and a binary file."""
+    (file_index / "pkg" / "sub").mkdir(parents=True)
+    (file_index / "pkg" / "a.py").write_text(
+        "one two three four five six seven eight\n"
+    )
+    (file_index / "pkg" / "sub" / "b.py").write_text("x = 1\n")
+    (file_index / "logo.png").write_bytes(b"\x89PNG" + bytes(96))
+    get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    return file_index
+
+
+def totals(dir_path: Path) -> DirTotals:
+    return file_tree_cache.dir_totals[dir_path.as_posix()]
+
+
+def test_totals_roll_up_size_based_estimates(costed):
+    assert totals(costed / "pkg" / "sub") == DirTotals(1, 6, 1, 1)
+    assert totals(costed / "pkg") == DirTotals(2, 46, 11, 2)
+    # Binary files count for their size but no tokens
+    assert totals(costed) == DirTotals(3, 146, 11, 2)
+
+
+def test_counted_tokens_replace_estimates_up_the_tree(costed):
+    metadata = get_file_metadata((costed / "pkg" / "a.py").as_posix())
+    assert (metadata["tokens"], metadata["tokens_estimated"]) == (8, False)
+    assert metadata["cost"] == "40 B · 8 tokens"
+    assert totals(costed / "pkg") == DirTotals(2, 46, 9, 1)
+    assert totals(costed) == DirTotals(3, 146, 9, 1)
+    assert totals(costed / "pkg" / "sub") == DirTotals(1, 6, 1, 1)
+
+    logo = get_file_metadata((costed / "logo.png").as_posix())
+    assert (logo["binary"], logo["tokens"], logo["cost"]) == (True, 0, "binary · 100 B")
+
+
+def test_totals_follow_refreshed_directories(costed):
+    get_file_metadata((costed / "pkg" / "a.py").as_posix())
+    (costed / "pkg" / "sub" / "c.py").write_text("y = 2\n")
+    bump_mtime(costed / "pkg" / "sub")
+    refresh_directories({(costed / "pkg" / "sub").as_posix()})
+    assert totals(costed / "pkg") == DirTotals(3, 52, 10, 2)
+
+    for name in ("b.py", "c.py"):
+        (costed / "pkg" / "sub" / name).unlink()
+    (costed / "pkg" / "sub").rmdir()
+    bump_mtime(costed / "pkg")
+    refresh_directories({(costed / "pkg").as_posix()})
+    assert totals(costed / "pkg") == DirTotals(1, 40, 8, 0)
+    assert totals(costed) == DirTotals(2, 140, 8, 0)
+    # Patching kept the totals those of a full recount
+    assert file_tree_cache.dir_totals == compute_dir_totals(file_tree_cache.dir_index)
+
+
+def test_file_tree_is_a_view_of_the_index(scanned):
+    (scanned / "empty" / "deeper").mkdir(parents=True)
+    tree = get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    root = scanned.as_posix()
+    assert tree.dir_index is file_tree_cache.dir_index
+    assert tree.roots == {str(scanned): root}
+    # Directories without files anywhere below are hidden
+    assert tree.folders(root) == ["pkg"]
+    assert tree.child_count(root) == 1
+    assert tree.has_directory(root)
+    assert tree.has_directory(f"{root}/pkg")
+    assert not tree.has_directory(f"{root}/empty")
+    assert tree.to_dict(root) == {"pkg": {"a.py": f"{root}/pkg/a.py"}}
+
+
+def test_missing_scan_directories_are_reported(file_index, monkeypatch):
+    monkeypatch.setattr(Config, "SCAN_DIRS", Config.SCAN_DIRS + ["missing"])
+    tree = get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    assert list(tree.roots) == [str(file_index)]
+    assert tree.errors["missing"].startswith("Directory not found:")
+    assert len(tree) == 2
+
+
+def test_content_cache_hits_only_the_same_stat():
+    cache = FileContentCache(100)
+    assert cache.get("a.py", 1, 5) is None
+    cache.put("a.py", 1, 5, "a = 1")
+    assert cache.get("a.py", 1, 5) == "a = 1"
+    assert cache.get("a.py", 2, 5) is None
+    assert cache.get("a.py", 1, 6) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes"]) == (1, 3, 5)
+
+
+def test_content_cache_evicts_the_least_recently_used():
+    cache = FileContentCache(10)
+    cache.put("a.py", 1, 4, "aaaa")
+    cache.put("b.py", 1, 4, "bbbb")
+    assert cache.get("a.py", 1, 4) == "aaaa"
+    cache.put("c.py", 1, 4, "cccc")
+    assert cache.entries(["a.py", "b.py", "c.py"]) == {
+        "a.py": (1, 4, "aaaa"),
+        "c.py": (1, 4, "cccc"),
+    }
+    # Replacing an entry frees the bytes of the old content
+    cache.put("c.py", 2, 2, "cc")
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 6, 1)
+    # Contents larger than the whole cache are not cached
+    cache.put("d.py", 1, 11, "d" * 11)
+    assert cache.get("d.py", 1, 11) is None
+
+
+def test_content_cache_counts_encoded_bytes():
+    cache = FileContentCache(10)
+    cache.put("a.txt", 1, 8, "äöüß")
+    assert cache.stats()["bytes"] == 8
+    cache.put("b.txt", 1, 4, "€")
+    assert cache.get("a.txt", 1, 8) is None
+    assert cache.stats()["bytes"] == 3
+    cache.put("c.txt", 1, 12, "€€€€")
+    assert cache.get("c.txt", 1, 12) is None
+
+
+def test_file_contents_are_read_once_while_unchanged(workspace, monkeypatch):
+    monkeypatch.setattr(file_utils, "file_content_cache", FileContentCache(1000))
+    path = workspace / "a.py"
+    path.write_text("a = 1\n")
+    assert read_file_content(path) == "a = 1\n"
+    assert read_file_content(str(path)) == "a = 1\n"
+    path.write_text("a = 22\n")
+    assert read_file_content(path) == "a = 22\n"
+    stats = file_utils.file_content_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+
+def failing_chunks():
+    yield "partial prompt"
+    raise ValueError("generation failed")
+
+
+def test_save_prompt_writes_chunks(tmp_path):
+    output = tmp_path / "out" / "prompt.md"
+    assert save_prompt_to_file(iter(["a", "b"]), output)
+    assert output.read_text() == "ab"
+    assert [p.name for p in output.parent.iterdir()] == ["prompt.md"]
+
+
+def test_failed_generation_keeps_the_existing_file(tmp_path):
+    output = tmp_path / "prompt.md"
+    output.write_text("previous prompt")
+    with pytest.raises(ValueError, match="generation failed"):
+        save_prompt_to_file(failing_chunks(), output)
+    assert output.read_text() == "previous prompt"
+    assert [p.name for p in tmp_path.iterdir()] == ["prompt.md"]
+
+
+def test_failed_generation_leaves_no_file(tmp_path):
+    output = tmp_path / "prompt.md"
+    with pytest.raises(ValueError):
+        save_prompt_to_file(failing_chunks(), output)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unwritable_output_returns_false(tmp_path):
+    # A directory where the file should be
+    output = tmp_path / "prompt.md"
+    output.mkdir()
+    assert not save_prompt_to_file("prompt", output)
+
+
+def test_unencodable_prompt_returns_false(tmp_path):
+    output = tmp_path / "prompt.md"
+    output.write_text("previous prompt")
+    # A lone surrogate can't be written as UTF-8
+    assert not save_prompt_to_file(iter(["ok", "\ud800"]), output)
+    assert output.read_text() == "previous prompt"
+    assert [p.name for p in tmp_path.iterdir()] == ["prompt.md"]
+
+
+def test_binary_files_are_replaced_by_a_placeholder(workspace):
+    (workspace / "data.txt").write_bytes(b"text\0more")
+    (workspace / "logo.png").write_text("not really an image\n")
+    assert read_file_content(workspace / "data.txt") == (
+        "[Binary file not included: 9 B]"
+    )
+    assert read_file_content(workspace / "logo.png") == (
+        "[Binary file not included: 20 B]"
+    )
+
+
+def test_large_files_are_cut_to_their_head_and_tail(workspace, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_FILE_MAX_BYTES", 100)
+    lines = [f"line {i:02}\n" for i in range(50)]
+    (workspace / "big.py").write_text("".join(lines))
+    # The head and tail end at line boundaries within 80 and 20 bytes
+    assert read_file_content(workspace / "big.py") == (
+        "".join(lines[:10])
+        + "\n[... truncated: 304 B of 400 B omitted ...]\n"
+        + "".join(lines[48:])
+    )
+
+
+def test_files_within_the_limit_are_read_whole(workspace, monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_FILE_MAX_BYTES", 100)
+    (workspace / "small.py").write_bytes(b"a = 1\r\nb = 2\r\n")
+    assert read_file_content(workspace / "small.py") == "a = 1\nb = 2\n"
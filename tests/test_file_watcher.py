@@ -0,0 +1,188 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+from feature_implementer_core import database, file_watcher
+from feature_implementer_core.config import Config
+from feature_implementer_core.file_utils import (
+    file_tree_cache,
+    get_file_tree,
+    load_persisted_file_tree,
+)
+from feature_implementer_core.file_watcher import (
+    FileTreeWatcher,
+    PollingBackend,
+    ScannerLock,
+    SharedTreeFollower,
+    _create_backend,
+    _scanner_lock_path,
+    ensure_file_watcher,
+    initialize_file_tree,
+    stop_file_watcher,
+)
+
+
+def no_inotify():
+    raise OSError(38, "inotify_init1 failed: Function not implemented")
+
+
+@pytest.fixture
+def watch_env(file_index: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """The workspace with inotify patched out and polling without delay."""
+    monkeypatch.setattr(file_watcher, "InotifyBackend", no_inotify)
+    monkeypatch.setattr(file_watcher, "_scanner_lock", None)
+    monkeypatch.setattr(Config, "FILE_WATCH_MODE", "auto")
+    monkeypatch.setattr(Config, "FILE_WATCH_POLL_INTERVAL", 0.0)
+    yield file_index
+    stop_file_watcher()
+
+
+@pytest.fixture
+def polling(watch_env: Path) -> Path:
+    """A scanned workspace, watched by polling."""
+    (watch_env / "pkg").mkdir()
+    (watch_env / "pkg" / "a.py").write_text("a = 1\n")
+    get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    return watch_env
+
+
+@pytest.fixture
+def other_scanner(watch_env: Path) -> ScannerLock:
+    """The scanner lock, held as by another server process."""
+    lock = ScannerLock(_scanner_lock_path())
+    assert lock.acquire()
+    yield lock
+    lock.release()
+
+
+def bump_mtime(dir_path: Path) -> None:
+    """Move a directory's mtime forward, which coarse timestamps may not have done."""
+    stat = os.stat(dir_path)
+    os.utime(dir_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def indexed_files(dir_path: Path):
+    return file_tree_cache.dir_index[dir_path.as_posix()].files
+
+
+def test_backend_falls_back_to_polling_without_inotify(polling):
+    backend = _create_backend(file_tree_cache.dir_index)
+    assert isinstance(backend, PollingBackend)
+    assert backend.read_changes() == set()
+    bump_mtime(polling / "pkg")
+    assert backend.read_changes() == {(polling / "pkg").as_posix()}
+
+
+def test_polling_watcher_refreshes_changed_directories(polling):
+    watcher = FileTreeWatcher(_create_backend(file_tree_cache.dir_index))
+    pkg = polling / "pkg"
+    (pkg / "b.py").write_text("b = 2\n")
+    (pkg / "sub").mkdir()
+    (pkg / "sub" / "c.py").write_text("c = 3\n")
+    bump_mtime(pkg)
+    watcher.flush()
+    assert indexed_files(pkg) == ("a.py", "b.py")
+    assert indexed_files(pkg / "sub") == ("c.py",)
+
+    # New directories are polled from then on
+    (pkg / "sub" / "d.py").write_text("d = 4\n")
+    bump_mtime(pkg / "sub")
+    watcher.flush()
+    assert indexed_files(pkg / "sub") == ("c.py", "d.py")
+
+    shutil.rmtree(pkg / "sub")
+    bump_mtime(pkg)
+    watcher.flush()
+    assert (pkg / "sub").as_posix() not in file_tree_cache.dir_index
+    assert watcher.backend.read_changes() == set()
+
+
+def test_ensure_file_watcher_polls_when_inotify_is_unavailable(polling):
+    watcher = ensure_file_watcher()
+    assert isinstance(watcher, FileTreeWatcher)
+    assert isinstance(watcher.backend, PollingBackend)
+    assert file_tree_cache.is_live()
+    assert ensure_file_watcher() is watcher
+
+    (polling / "new.py").write_text("")
+    bump_mtime(polling)
+    # A forced rescan applies pending changes instead of walking the workspace
+    tree = get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    assert "new.py" in tree.dir_index[polling.as_posix()].files
+    assert file_tree_cache.stats()["scan_count"] == 1
+
+
+def test_watcher_revalidates_a_loaded_index_when_it_starts(polling):
+    pkg = polling / "pkg"
+    (pkg / "b.py").write_text("b = 2\n")
+    bump_mtime(pkg)
+    assert load_persisted_file_tree(Config.SCAN_DIRS)
+    assert indexed_files(pkg) == ("a.py",)
+    ensure_file_watcher()
+    deadline = time.monotonic() + 5
+    while indexed_files(pkg) != ("a.py", "b.py") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert indexed_files(pkg) == ("a.py", "b.py")
+
+
+def test_watching_can_be_turned_off(polling, monkeypatch):
+    monkeypatch.setattr(Config, "FILE_WATCH_MODE", "off")
+    assert ensure_file_watcher() is None
+    assert not file_tree_cache.is_live()
+
+
+def test_initial_scan_needs_the_scanner_lock(watch_env, other_scanner):
+    (watch_env / "a.py").write_text("")
+    initialize_file_tree()
+    assert file_tree_cache.cache is None
+    assert not load_persisted_file_tree(Config.SCAN_DIRS)
+
+    other_scanner.release()
+    initialize_file_tree()
+    assert indexed_files(watch_env) == ("a.py",)
+    assert file_tree_cache.stats()["scan_count"] == 1
+    # Released again: the scanner is elected among the processes serving requests
+    assert not file_watcher._scanner_lock.is_held()
+
+    # A later start loads the persisted index instead of scanning
+    initialize_file_tree()
+    assert file_tree_cache.stats()["scan_count"] == 1
+
+
+def test_follower_applies_the_scanner_changes_from_the_database(polling, other_scanner):
+    follower = ensure_file_watcher()
+    assert isinstance(follower, SharedTreeFollower)
+    assert file_tree_cache.follows_index
+    assert file_tree_cache.is_live()
+
+    # The scanner records a listing this process never sees on disk
+    database.update_file_index(
+        Config.DB_PATH, polling.as_posix(), {"pkg": (1, [["b.py", 5, 1]], [])}, []
+    )
+    tree = get_file_tree(Config.SCAN_DIRS, force_rescan=True)
+    assert tree.dir_index[(polling / "pkg").as_posix()].files == ("b.py",)
+    assert file_tree_cache.stats()["scan_count"] == 1
+
+
+def test_follower_without_an_index_does_not_scan(watch_env, other_scanner):
+    (watch_env / "a.py").write_text("")
+    assert isinstance(ensure_file_watcher(), SharedTreeFollower)
+    tree = get_file_tree(Config.SCAN_DIRS)
+    assert len(tree) == 0
+    assert file_tree_cache.stats()["scan_count"] == 0
+    assert not load_persisted_file_tree(Config.SCAN_DIRS)
+
+
+def test_follower_takes_over_when_the_scanner_exits(
+    polling, other_scanner, monkeypatch
+):
+    monkeypatch.setattr(Config, "FILE_TREE_SYNC_INTERVAL", 0.0)
+    assert isinstance(ensure_file_watcher(), SharedTreeFollower)
+    other_scanner.release()
+    watcher = ensure_file_watcher()
+    assert isinstance(watcher, FileTreeWatcher)
+    assert not file_tree_cache.follows_index
+    assert not other_scanner.acquire()
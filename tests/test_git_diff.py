@@ -0,0 +1,90 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from feature_implementer_core.git_diff import DiffContext, GitDiffError
+
+
+def git(repo: Path, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A git repository with one commit of two files."""
+    repo = tmp_path.resolve() / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "dev@example.com")
+    git(repo, "config", "user.name", "Dev")
+    lines = "".join(f"line {n}\n" for n in range(1, 21))
+    (repo / "changed.py").write_text(lines)
+    (repo / "same.py").write_text("x = 1\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "Initial")
+    return repo
+
+
+def test_load_reports_the_status_of_each_file(repo):
+    changed = repo / "changed.py"
+    changed.write_text(changed.read_text().replace("line 10\n", "line ten\n"))
+    (repo / "new.py").write_text("y = 2\n")
+    outside = repo.parent / "outside.py"
+    outside.write_text("z = 3\n")
+    paths = [changed, repo / "same.py", repo / "new.py", outside]
+
+    diff = DiffContext("HEAD", context_lines=1)
+    diff.load(paths)
+    assert [diff.files[path].status for path in paths] == [
+        "changed",
+        "unchanged",
+        "new",
+        "outside_repository",
+    ]
+    assert diff.files[changed].hunks == (
+        "@@ -9,3 +9,3 @@ line 8\n line 9\n-line 10\n+line ten\n line 11"
+    )
+    report = diff.report
+    assert (report["changed"], report["unchanged"], report["new"]) == (1, 1, 1)
+    assert report["outside_repository"] == 1
+    assert report["files"][0]["added"] == report["files"][0]["deleted"] == 1
+    assert list(report["commits"]) == [str(repo)]
+    assert diff.label(changed) == "(diff against HEAD)"
+    assert diff.label(repo / "new.py") == "(new since HEAD)"
+    assert diff.label(repo / "same.py") == ""
+
+
+def test_context_lines_widen_the_hunks(repo):
+    changed = repo / "changed.py"
+    changed.write_text(changed.read_text().replace("line 10\n", "line ten\n"))
+    diff = DiffContext("HEAD", context_lines=3)
+    diff.load([changed])
+    hunks = diff.files[changed].hunks
+    assert hunks.startswith("@@ -7,7 +7,7 @@")
+    assert " line 7\n" in hunks and " line 13" in hunks
+
+
+def test_key_changes_with_the_base_commit(repo):
+    diff = DiffContext("HEAD")
+    diff.load([repo / "same.py"])
+    key = diff.key()
+    (repo / "same.py").write_text("x = 2\n")
+    git(repo, "commit", "-q", "-am", "Second")
+    later = DiffContext("HEAD")
+    later.load([repo / "same.py"])
+    assert later.key() != key
+    assert later.files[repo / "same.py"].status == "unchanged"
+
+
+def test_unknown_ref_raises(repo):
+    with pytest.raises(GitDiffError, match="Unknown git ref 'nope'"):
+        DiffContext("nope").load([repo / "same.py"])
+
+
+@pytest.mark.parametrize(
+    "base_ref, context_lines", [("", 3), ("--output=x", 3), ("a b", 3), ("HEAD", -1)]
+)
+def test_invalid_options_are_rejected(base_ref, context_lines):
+    with pytest.raises(ValueError):
+        DiffContext(base_ref, context_lines)
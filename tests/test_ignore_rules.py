@@ -0,0 +1,82 @@
+from feature_implementer_core.ignore_rules import IgnoreMatcher, IgnoreRules, parse_rule
+
+
+def rules(*lines: str, base_dir: str = "") -> IgnoreRules:
+    return IgnoreRules(tuple(parse_rule(line, base_dir) for line in lines))
+
+
+def test_bare_names_match_at_any_depth():
+    ignore = rules("*.log", "build")
+    assert ignore.is_ignored("", "app.log", False)
+    assert ignore.is_ignored("src/deep", "debug.log", False)
+    assert ignore.is_ignored("src", "build", True)
+    assert not ignore.is_ignored("", "app.py", False)
+
+
+def test_directory_only_patterns_skip_files():
+    ignore = rules("cache/")
+    assert ignore.is_ignored("", "cache", True)
+    assert ignore.is_ignored("src", "cache", True)
+    assert not ignore.is_ignored("", "cache", False)
+
+
+def test_negation_reincludes_and_last_match_wins():
+    ignore = rules("*.log", "!keep.log")
+    assert ignore.is_ignored("", "app.log", False)
+    assert not ignore.is_ignored("", "keep.log", False)
+    ignore = rules("!keep.log", "*.log")
+    assert ignore.is_ignored("", "keep.log", False)
+
+
+def test_negated_directory_only_pattern():
+    ignore = rules("out*", "!output/")
+    assert ignore.is_ignored("", "out", True)
+    assert not ignore.is_ignored("", "output", True)
+    # The negation only applies to directories
+    assert ignore.is_ignored("", "output", False)
+
+
+def test_anchored_patterns_apply_below_their_directory():
+    ignore = rules("/dist", "docs/*.tmp", base_dir="pkg")
+    assert ignore.is_ignored("pkg", "dist", True)
+    assert not ignore.is_ignored("", "dist", True)
+    assert not ignore.is_ignored("pkg/sub", "dist", True)
+    assert ignore.is_ignored("pkg/docs", "a.tmp", False)
+
+
+def test_double_star_spans_directories():
+    ignore = rules("a/**/b.txt")
+    assert ignore.is_ignored("a", "b.txt", False)
+    assert ignore.is_ignored("a/x/y", "b.txt", False)
+    assert not ignore.is_ignored("c", "b.txt", False)
+
+
+def test_comments_and_blank_lines_are_not_rules():
+    assert parse_rule("# comment") is None
+    assert parse_rule("   ") is None
+
+
+def test_matcher_combines_patterns_and_gitignore_files(tmp_path):
+    base = tmp_path.as_posix()
+    (tmp_path / ".gitignore").write_text("*.log\n!keep.log\n")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / ".gitignore").write_text("local/\n")
+    matcher = IgnoreMatcher(base, ["node_modules"], use_gitignore=True)
+
+    root_rules = matcher.rules_for(base)
+    assert root_rules.is_ignored("", "node_modules", True)
+    assert root_rules.is_ignored("", "app.log", False)
+    assert not root_rules.is_ignored("", "keep.log", False)
+
+    sub_rules = matcher.rules_for(f"{base}/sub")
+    assert sub_rules.is_ignored("sub", "local", True)
+    assert not sub_rules.is_ignored("sub", "local", False)
+    assert sub_rules.is_ignored("sub", "other.log", False)
+    # The sub directory's rules don't apply to its parent
+    assert not root_rules.is_ignored("", "local", True)
+
+
+def test_matcher_without_gitignore_uses_patterns_only(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    matcher = IgnoreMatcher(tmp_path.as_posix(), [], use_gitignore=False)
+    assert not matcher.rules_for(tmp_path.as_posix()).is_ignored("", "a.log", False)
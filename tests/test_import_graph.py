@@ -0,0 +1,112 @@
+from pathlib import Path
+from typing import List
+
+from feature_implementer_core import import_graph as import_graph_module
+from feature_implementer_core.import_graph import ImportGraph, parse_imports
+
+
+def make_files(root: Path, *paths: str) -> None:
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text("")
+
+
+def imports_of(root: Path, path: str, source: str) -> List[str]:
+    found = parse_imports(source.encode(), (root / path).as_posix(), root.as_posix())
+    return [Path(p).relative_to(root).as_posix() for p in found]
+
+
+def test_absolute_imports_resolve_from_the_file_up_to_the_root(tmp_path):
+    make_files(
+        tmp_path,
+        "src/pkg/__init__.py",
+        "src/pkg/models.py",
+        "src/pkg/app.py",
+        "settings.py",
+    )
+    source = "import os\nimport pkg.models\nimport settings\nimport requests\n"
+    assert imports_of(tmp_path, "src/pkg/app.py", source) == [
+        "src/pkg/models.py",
+        "settings.py",
+    ]
+
+
+def test_relative_imports_resolve_from_the_package(tmp_path):
+    make_files(
+        tmp_path,
+        "pkg/__init__.py",
+        "pkg/util.py",
+        "pkg/sub/__init__.py",
+        "pkg/sub/views.py",
+        "pkg/sub/forms.py",
+    )
+    source = "from . import forms\nfrom .. import util\nfrom ..util import helper\n"
+    assert imports_of(tmp_path, "pkg/sub/views.py", source) == [
+        "pkg/sub/forms.py",
+        "pkg/util.py",
+    ]
+
+
+def test_from_import_prefers_submodule_over_package(tmp_path):
+    make_files(tmp_path, "pkg/__init__.py", "pkg/models.py", "main.py")
+    assert imports_of(tmp_path, "main.py", "from pkg import models\n") == [
+        "pkg/models.py"
+    ]
+    # A name that is not a submodule comes from the package itself
+    assert imports_of(tmp_path, "main.py", "from pkg import VERSION\n") == [
+        "pkg/__init__.py"
+    ]
+
+
+def test_package_import_resolves_to_its_init(tmp_path):
+    make_files(tmp_path, "pkg/__init__.py", "pkg/sub/__init__.py", "main.py")
+    assert imports_of(tmp_path, "main.py", "import pkg.sub\n") == [
+        "pkg/sub/__init__.py"
+    ]
+
+
+def test_files_outside_the_root_have_no_imports(tmp_path):
+    root = tmp_path / "root"
+    make_files(tmp_path, "root/a.py", "other/b.py")
+    found = parse_imports(
+        b"import a\n", (tmp_path / "other/b.py").as_posix(), root.as_posix()
+    )
+    assert found == []
+
+
+def test_a_file_does_not_import_itself(tmp_path):
+    make_files(tmp_path, "pkg/__init__.py")
+    assert imports_of(tmp_path, "pkg/__init__.py", "from . import x\n") == []
+
+
+def test_graph_parses_only_changed_files(tmp_path, db_path, monkeypatch):
+    root = tmp_path / "ws"
+    make_files(root, "models.py", "views.py")
+    (root / "views.py").write_text("import models\n")
+    paths = [(root / name).as_posix() for name in ["views.py", "models.py"]]
+    graph = ImportGraph()
+    result = graph.imports_of(paths, db_path, root.as_posix())
+    assert result == {paths[0]: (14, [paths[1]]), paths[1]: (0, [])}
+    assert graph.imports_of(paths, db_path, root.as_posix()) == result
+    assert graph.stats() == {"files": 2, "parsed": 2}
+
+    # A new graph loads the parsed files from the database
+    parsed = []
+    read_imports = import_graph_module._read_imports
+
+    def recording_read_imports(path, root):
+        # Parsing doesn't block other readers of the graph
+        assert not graph._lock.locked()
+        parsed.append(path)
+        return read_imports(path, root)
+
+    monkeypatch.setattr(import_graph_module, "_read_imports", recording_read_imports)
+    graph = ImportGraph()
+    (root / "models.py").write_text("import views\n")
+    (root / "views.py").unlink()
+    result = graph.imports_of(paths, db_path, root.as_posix())
+    # Imports of files that no longer exist aren't resolved
+    assert result == {paths[1]: (13, [])}
+    assert parsed == [paths[1]]
+    assert graph.stats() == {"files": 1, "parsed": 1}
+    assert ImportGraph().imports_of(paths[1:], db_path, root.as_posix()) == result
@@ -0,0 +1,80 @@
+import pytest
+
+from feature_implementer_core.path_search import PathSearchIndex
+
+DIRECTORIES = [
+    ("/w", ["file_utils.py", "utils.py", "README.md"]),
+    ("/w/src", ["utils.py", "app.py", "my_utils_helpers.py"]),
+    ("/w/src/utils", ["io.py"]),
+    ("/w/docs", ["notes_utils.md"]),
+]
+
+
+@pytest.fixture
+def index() -> PathSearchIndex:
+    index = PathSearchIndex()
+    index.rebuild(DIRECTORIES, "/w")
+    return index
+
+
+def search(index: PathSearchIndex, query: str, limit: int = 10):
+    matches, total = index.search(query, limit)
+    return [match.relative_path for match in matches], total
+
+
+def test_exact_names_rank_first_then_prefixes_and_substrings(index):
+    assert search(index, "utils") == (
+        [
+            "utils.py",
+            "src/utils.py",
+            "file_utils.py",
+            "docs/notes_utils.md",
+            "src/my_utils_helpers.py",
+            "src/utils/io.py",
+        ],
+        6,
+    )
+    assert search(index, "utils.py")[0][:3] == [
+        "utils.py",
+        "src/utils.py",
+        "file_utils.py",
+    ]
+
+
+def test_search_is_case_insensitive_and_keeps_the_name_case(index):
+    matches, total = index.search("readme", 10)
+    assert total == 1
+    assert matches[0]._asdict() == {
+        "name": "README.md",
+        "path": "/w/README.md",
+        "relative_path": "README.md",
+    }
+
+
+def test_path_parts_match_in_order(index):
+    assert search(index, "src/io") == (["src/utils/io.py"], 1)
+    assert search(index, "io/src") == ([], 0)
+
+
+def test_fuzzy_matches_come_last(index):
+    assert search(index, "flutl") == (["file_utils.py"], 1)
+    assert search(index, "app")[0] == ["src/app.py"]
+
+
+def test_limit_keeps_the_total(index):
+    assert search(index, "utils", limit=2) == (["utils.py", "src/utils.py"], 6)
+
+
+def test_updates_add_and_remove_directories(index):
+    index.update({"/w": ["utils.py", "new_utils.py"]}, ["/w/src/utils"])
+    paths, _ = search(index, "utils")
+    assert "new_utils.py" in paths
+    assert "file_utils.py" not in paths
+    assert "src/utils/io.py" not in paths
+
+
+def test_cleared_index_is_rebuilt_from_its_source(index):
+    index.clear()
+    assert not index.is_built()
+    index.ensure_built(lambda: [("/w", ["x.py"])], "/w")
+    assert search(index, "x.py") == (["x.py"], 1)
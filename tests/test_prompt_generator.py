@@ -0,0 +1,166 @@
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+from feature_implementer_core.prompt_generator import (
+    CachedPrompt,
+    PromptCache,
+    TokenBudget,
+    gather_context,
+    generate_prompt,
+)
+
+
+@pytest.fixture
+def sources(workspace: Path) -> Path:
+    """A workspace of a few small source files."""
+    for name in ["c.py", "a.py", "b.py", "d.py", "e.py"]:
+        (workspace / name).write_text(f"{name[0].upper()} = 1\n\n")
+    return workspace
+
+
+@pytest.mark.parametrize("max_workers", [1, 8])
+def test_context_is_in_sorted_path_order_without_duplicates(sources, max_workers):
+    paths = [str(sources / name) for name in ["e.py", "c.py", "a.py", "c.py", "b.py"]]
+    context = gather_context(paths, max_workers=max_workers)
+    assert context == "\n".join(
+        f"--- START FILE: {name}.py ---\n{name.upper()} = 1\n--- END FILE: {name}.py ---\n"
+        for name in "abce"
+    )
+
+
+def test_concurrent_reads_match_serial_reads(sources):
+    paths = [str(path) for path in sorted(sources.glob("*.py"), reverse=True)]
+    assert gather_context(paths, max_workers=8) == gather_context(paths, max_workers=1)
+
+
+def test_missing_files_get_an_empty_block(sources):
+    context = gather_context([str(sources / "missing.py"), str(sources / "a.py")])
+    assert context == (
+        "--- START FILE: a.py ---\nA = 1\n--- END FILE: a.py ---\n\n"
+        "--- START FILE: missing.py ---\n\n--- END FILE: missing.py ---\n"
+    )
+
+
+@pytest.fixture
+def context_files(workspace: Path) -> List[str]:
+    """A small, a large and another small context file, in that order."""
+    files = {
+        "a.py": "A = 1\n" * 20,
+        "b.py": "B = 2\n" * 2000,
+        "c.py": "C = 3\n" * 20,
+    }
+    for name, content in files.items():
+        (workspace / name).write_text(content)
+    return [str(workspace / name) for name in files]
+
+
+def file_tokens(db_path: Path, template_id: int, paths: List[str]) -> Dict:
+    """Tokens of each context file and of the rest of the prompt."""
+    budget = TokenBudget(10**7)
+    generate_prompt(db_path, template_id, paths, jira_description="J", budget=budget)
+    report = budget.report
+    tokens = {Path(entry["path"]).name: entry["tokens"] for entry in report["files"]}
+    tokens["fixed"] = report["prompt_tokens"] - report["context_tokens"]
+    return tokens
+
+
+def statuses(budget: TokenBudget) -> Dict[str, str]:
+    return {
+        Path(entry["path"]).name: entry["status"] for entry in budget.report["files"]
+    }
+
+
+def test_budget_truncate_cuts_the_first_file_that_does_not_fit(
+    db_path, template_id, context_files
+):
+    tokens = file_tokens(db_path, template_id, context_files)
+    max_tokens = tokens["fixed"] + tokens["a.py"] + tokens["c.py"] + 50
+    budget = TokenBudget(max_tokens, overflow="truncate")
+    prompt = generate_prompt(
+        db_path, template_id, context_files, jira_description="J", budget=budget
+    )
+    assert statuses(budget) == {
+        "a.py": "included",
+        "b.py": "truncated",
+        "c.py": "dropped",
+    }
+    assert budget.report["prompt_tokens"] <= max_tokens
+    assert "[... truncated to fit the token budget]" in prompt
+    assert "C = 3" not in prompt
+
+
+def test_budget_drop_skips_files_that_do_not_fit(db_path, template_id, context_files):
+    tokens = file_tokens(db_path, template_id, context_files)
+    max_tokens = tokens["fixed"] + tokens["a.py"] + tokens["c.py"] + 50
+    budget = TokenBudget(max_tokens, overflow="drop")
+    prompt = generate_prompt(
+        db_path, template_id, context_files, jira_description="J", budget=budget
+    )
+    assert statuses(budget) == {
+        "a.py": "included",
+        "b.py": "dropped",
+        "c.py": "included",
+    }
+    assert budget.report["included"] == 2
+    assert "A = 1" in prompt and "C = 3" in prompt
+    assert "B = 2" not in prompt
+
+
+def test_budget_without_room_for_any_file_drops_the_context_section(
+    db_path, template_id, context_files, word_tokens
+):
+    tokens = file_tokens(db_path, template_id, context_files)
+    budget = TokenBudget(tokens["fixed"] + 1, overflow="drop")
+    prompt = generate_prompt(
+        db_path, template_id, context_files, jira_description="J", budget=budget
+    )
+    assert budget.report["dropped"] == 3
+    assert "RELEVANT CODE CONTEXT" not in prompt
+    assert "```\n\n```" not in prompt
+    assert "## JIRA DESCRIPTION (Optional)\n\n```\nJ\n```" in prompt
+    # Counted without the dropped section's heading
+    assert budget.report["prompt_tokens"] == len(prompt.split())
+
+
+@pytest.mark.parametrize("max_tokens, overflow", [(0, "truncate"), (100, "squeeze")])
+def test_invalid_budgets_are_rejected(max_tokens, overflow):
+    with pytest.raises(ValueError):
+        TokenBudget(max_tokens, overflow=overflow)
+
+
+def test_prompt_sections_follow_the_inputs(db_path, template_id, context_files):
+    prompt = generate_prompt(db_path, template_id, context_files[:1])
+    assert "--- START FILE: a.py ---" in prompt
+    assert "JIRA DESCRIPTION" not in prompt
+    assert "ADDITIONAL INSTRUCTIONS" not in prompt
+
+
+def test_symbol_selection_includes_the_dedented_method(workspace):
+    (workspace / "models.py").write_text(
+        "class User:\n    def save(self):\n        return 1\n\n    def delete(self):\n        pass\n"
+    )
+    context = gather_context([f"{workspace}/models.py::User.save"])
+    assert context == (
+        "--- START FILE: models.py (symbols: User.save) ---\n"
+        "def save(self):\n    return 1\n"
+        "--- END FILE: models.py ---\n"
+    )
+
+
+def test_prompt_cache_counts_a_coalesced_request_once():
+    cache = PromptCache(10**6)
+    # The first request claims the generation
+    assert cache.get("f", count_miss=False) is None
+    assert cache.begin("f") is None
+    # An identical request waits for it
+    assert cache.get("f", count_miss=False) is None
+    event = cache.begin("f")
+    assert event is not None
+    cache.put("f", CachedPrompt("prompt", None))
+    cache.end("f")
+    assert event.wait(1)
+    assert cache.get("f").prompt == "prompt"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["coalesced"]) == (1, 1, 1)
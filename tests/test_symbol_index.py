@@ -0,0 +1,96 @@
+import pytest
+
+from feature_implementer_core.symbol_index import (
+    extract_symbols,
+    parse_symbols,
+    split_symbol_selection,
+)
+
+SOURCE = '''import os
+
+
+@decorator
+def helper(x):
+    return x + 1
+
+
+class User:
+    """A user."""
+
+    def save(self):
+        if self.name:
+            return os.getcwd()
+
+    class Meta:
+        def table(self):
+            return "users"
+
+
+async def fetch():
+    def inner():
+        pass
+    return inner
+'''
+
+
+def test_parse_symbols_lists_classes_functions_and_methods():
+    symbols = {symbol.name: symbol for symbol in parse_symbols(SOURCE.encode())}
+    assert list(symbols) == [
+        "helper",
+        "User",
+        "User.save",
+        "User.Meta",
+        "User.Meta.table",
+        "fetch",
+    ]
+    assert symbols["helper"].kind == "function"
+    assert symbols["User"].kind == "class"
+    assert symbols["User.save"].kind == "method"
+    assert symbols["fetch"].kind == "function"
+    # Decorators belong to the symbol
+    assert (symbols["helper"].start_line, symbols["helper"].end_line) == (4, 6)
+
+
+def test_parse_symbols_raises_on_invalid_source():
+    with pytest.raises(SyntaxError):
+        parse_symbols(b"def broken(:\n")
+
+
+def test_extract_symbols_dedents_methods():
+    content, missing = extract_symbols(
+        SOURCE, parse_symbols(SOURCE.encode()), ["User.save"]
+    )
+    assert content == ("def save(self):\n    if self.name:\n        return os.getcwd()")
+    assert missing == []
+
+
+def test_extract_symbols_in_source_order_without_repeats():
+    symbols = parse_symbols(SOURCE.encode())
+    content, missing = extract_symbols(
+        SOURCE, symbols, ["User.Meta.table", "helper", "User.Meta", "Nope"]
+    )
+    assert content.startswith("@decorator\ndef helper(x):")
+    assert content.count("def table") == 1
+    assert "\n\nclass Meta:\n    def table(self):" in content
+    assert missing == ["Nope"]
+
+
+def test_extract_symbols_applies_transform_per_symbol():
+    content, _ = extract_symbols(
+        SOURCE, parse_symbols(SOURCE.encode()), ["helper", "fetch"], str.upper
+    )
+    assert "DEF HELPER(X):" in content
+    assert "ASYNC DEF FETCH():" in content
+
+
+@pytest.mark.parametrize(
+    "entry, expected",
+    [
+        ("src/models.py::User.save", ("src/models.py", "User.save")),
+        ("src/models.py", ("src/models.py", None)),
+        ("notes.txt::User", ("notes.txt::User", None)),
+        ("src/models.py::", ("src/models.py::", None)),
+    ],
+)
+def test_split_symbol_selection(entry, expected):
+    assert split_symbol_selection(entry) == expected
@@ -0,0 +1,59 @@
+from feature_implementer_core import database
+from feature_implementer_core.template_cache import TemplateCache
+
+
+def write_from_another_process(monkeypatch, db_path, template_id, content):
+    """Update a template without this process noticing, as another process would."""
+    writes = database.template_writes
+    success, error = database.update_template(
+        db_path, template_id, name="Test", content=content, is_default=True
+    )
+    assert success, error
+    monkeypatch.setattr(database, "template_writes", writes)
+
+
+def test_templates_are_served_from_memory(db_path, template_id):
+    cache = TemplateCache(check_interval=60)
+    assert cache.get_template_by_id(db_path, template_id)["name"] == "Test"
+    assert cache.get_default_template_id(db_path) == template_id
+    assert [t["id"] for t in cache.get_templates(db_path)] == [template_id]
+    stats = cache.stats()
+    assert (stats["reloads"], stats["hits"], stats["checks"]) == (1, 2, 0)
+
+
+def test_writes_of_this_process_are_seen_at_once(db_path, template_id):
+    cache = TemplateCache(check_interval=60)
+    cache.get_templates(db_path)
+    success, result = database.add_template(db_path, name="Other", content="{x}")
+    assert success, result
+    assert [t["name"] for t in cache.get_templates(db_path)] == ["Other", "Test"]
+    assert cache.stats()["reloads"] == 2
+
+
+def test_writes_of_other_processes_are_seen_after_the_interval(
+    db_path, template_id, monkeypatch
+):
+    cache = TemplateCache(check_interval=60)
+    cache.get_templates(db_path)
+    write_from_another_process(monkeypatch, db_path, template_id, "changed")
+    assert cache.get_template_by_id(db_path, template_id)["content"] != "changed"
+
+    monkeypatch.setattr(cache, "check_interval", 0)
+    assert cache.get_template_by_id(db_path, template_id)["content"] == "changed"
+    stats = cache.stats()
+    assert (stats["reloads"], stats["checks"]) == (2, 1)
+    assert stats["revisions"] == {str(db_path): database.get_template_revision(db_path)}
+
+
+def test_unchanged_revision_is_not_reloaded(db_path, template_id):
+    cache = TemplateCache(check_interval=0)
+    for _ in range(3):
+        cache.get_templates(db_path)
+    stats = cache.stats()
+    assert (stats["reloads"], stats["checks"], stats["hits"]) == (1, 2, 0)
+
+
+def test_results_are_copies(db_path, template_id):
+    cache = TemplateCache(check_interval=60)
+    cache.get_template_by_id(db_path, template_id)["name"] = "Mine"
+    assert cache.get_template_by_id(db_path, template_id)["name"] == "Test"
@@ -0,0 +1,113 @@
+import re
+
+import pytest
+
+from feature_implementer_core.prompt_generator import remove_section
+from feature_implementer_core.template_engine import (
+    CompiledTemplateCache,
+    Placeholder,
+    TemplateSyntaxError,
+    compile_template,
+)
+
+LEGACY_TEMPLATE = (
+    "# Prompt\n\n"
+    "## RELEVANT CODE CONTEXT\n\n```\n{relevant_code_context}\n```\n\n"
+    "## JIRA DESCRIPTION (Optional)\n\n```\n{jira_description}\n```\n\n"
+    "## ADDITIONAL INSTRUCTIONS (Optional)\n\n```\n{additional_instructions}\n```\n\n"
+    "## TASK\n\nImplement it.\n"
+)
+
+
+def test_render_fills_placeholders_without_rescanning_values():
+    compiled = compile_template("Hello {name}, see {link}.")
+    rendered = compiled.render({"name": "{link}", "link": "https://x"})
+    assert rendered == "Hello {link}, see https://x."
+
+
+def test_render_keeps_placeholders_without_value_or_section():
+    compiled = compile_template("A {missing} B")
+    assert compiled.render({}) == "A {missing} B"
+
+
+def test_optional_section_kept_only_with_content():
+    compiled = compile_template("Start\n{?ticket}\nTicket: {ticket}\n{/ticket}\nEnd\n")
+    assert compiled.render({"ticket": "FEAT-1"}) == "Start\nTicket: FEAT-1\nEnd\n"
+    assert compiled.render({"ticket": "  "}) == "Start\nEnd\n"
+
+
+def test_nested_sections():
+    compiled = compile_template(
+        "{?outer}\nOuter {outer}\n{?inner}\nInner {inner}\n{/inner}\n{/outer}\nEnd"
+    )
+    assert compiled.render({"outer": "o", "inner": "i"}) == "Outer o\nInner i\nEnd"
+    assert compiled.render({"outer": "o"}) == "Outer o\nEnd"
+    # Leaving out the outer section leaves out everything in it
+    assert compiled.render({"inner": "i"}) == "End"
+    assert compiled.names == ("outer", "inner")
+    assert compiled.custom_names == ("outer", "inner")
+
+
+def test_inline_section_markers():
+    compiled = compile_template("Fix{?ticket} ({ticket}){/ticket}.")
+    assert compiled.render({"ticket": "FEAT-1"}) == "Fix (FEAT-1)."
+    assert compiled.render({}) == "Fix."
+
+
+@pytest.mark.parametrize(
+    "template, message",
+    [
+        ("{?a}\ntext\n", "Line 1: section {?a} is never closed"),
+        ("text\n{/a}\n", "Line 2: {/a} closes no section"),
+        ("{?a}\n{?b}\n{/a}\n{/b}\n", "Line 3: {/a} closes section {?b}"),
+    ],
+)
+def test_unbalanced_markers_raise(template, message):
+    with pytest.raises(TemplateSyntaxError, match=re.escape(message)):
+        compile_template(template)
+
+
+def test_legacy_heading_sections_dropped_when_empty():
+    compiled = compile_template(LEGACY_TEMPLATE)
+    rendered = compiled.render(
+        {"relevant_code_context": "code", "jira_description": "ticket"}
+    )
+    assert "```\ncode\n```" in rendered
+    assert "```\nticket\n```" in rendered
+    assert "ADDITIONAL INSTRUCTIONS" not in rendered
+    assert "{additional_instructions}" not in rendered
+    assert "\n\n\n" not in rendered
+
+
+def test_legacy_template_without_any_values():
+    rendered = compile_template(LEGACY_TEMPLATE).render({})
+    assert rendered == "# Prompt\n\n## TASK\n\nImplement it.\n"
+
+
+def test_plan_is_memoized_per_set_of_empty_placeholders():
+    compiled = compile_template(LEGACY_TEMPLATE)
+    plan = compiled.plan(frozenset(["jira_description"]))
+    assert compiled.plan(frozenset(["jira_description", "unknown"])) is plan
+    assert Placeholder("jira_description") not in plan
+    assert Placeholder("relevant_code_context") in plan
+
+
+def test_remove_section_removes_legacy_section():
+    result = remove_section(LEGACY_TEMPLATE, "jira_description")
+    assert "JIRA DESCRIPTION" not in result
+    assert "{relevant_code_context}" in result
+    assert "{additional_instructions}" in result
+
+
+def test_remove_section_ignores_other_placeholders():
+    assert remove_section(LEGACY_TEMPLATE, "not_builtin") == LEGACY_TEMPLATE
+
+
+def test_compiled_template_cache_misses_on_edit_and_evicts():
+    cache = CompiledTemplateCache(max_entries=1)
+    first = cache.get(1, "A {x}")
+    assert cache.get(1, "A {x}") is first
+    assert cache.get(1, "B {x}") is not first
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,77 @@
+from typing import List
+
+import pytest
+
+from feature_implementer_core import tokenizer
+from feature_implementer_core.tokenizer import (
+    TokenCountCache,
+    count_tokens,
+    count_tokens_batch,
+)
+
+
+@pytest.fixture
+def encoded(word_tokens, monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """Texts the word encoding is asked to encode."""
+    texts: List[str] = []
+    encode, encode_batch = word_tokens.encode, word_tokens.encode_batch
+
+    def recording_encode(text, **kwargs):
+        texts.append(text)
+        return encode(text, **kwargs)
+
+    def recording_encode_batch(batch, **kwargs):
+        texts.extend(batch)
+        return encode_batch(batch, **kwargs)
+
+    monkeypatch.setattr(word_tokens, "encode", recording_encode)
+    monkeypatch.setattr(word_tokens, "encode_batch", recording_encode_batch)
+    return texts
+
+
+def test_short_texts_are_not_cached():
+    cache = TokenCountCache(10, min_chars=5)
+    assert cache.key("words", "abcd") is None
+    assert cache.key("words", "abcde") == cache.key("words", "abcde")
+    assert cache.key("words", "abcde") != cache.key("other", "abcde")
+    assert cache.key("words", "abcde") != cache.key("words", "abcdf")
+
+
+def test_cache_evicts_the_least_recently_used():
+    cache = TokenCountCache(2, min_chars=1)
+    a, b, c = (cache.key("words", text) for text in "abc")
+    cache.put(a, 1)
+    cache.put(b, 2)
+    assert cache.get(a) == 1
+    cache.put(c, 3)
+    assert (cache.get(a), cache.get(b), cache.get(c)) == (1, None, 3)
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_counts_are_cached_by_content(encoded):
+    assert count_tokens("one two three") == 3
+    assert count_tokens("one two three") == 3
+    assert encoded == ["one two three"]
+    stats = tokenizer.token_count_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_batch_encodes_each_content_once(encoded):
+    count_tokens("a b")
+    texts = ["x y z", "a b", "x y z", "w", "x y z"]
+    assert count_tokens_batch(texts) == [3, 2, 3, 1, 3]
+    assert encoded == ["a b", "x y z", "w"]
+
+
+def test_short_texts_are_counted_every_time(encoded, monkeypatch):
+    monkeypatch.setattr(tokenizer.token_count_cache, "min_chars", 10)
+    assert count_tokens_batch(["a b", "a b"]) == [2, 2]
+    assert encoded == ["a b", "a b"]
+    assert tokenizer.token_count_cache.stats()["entries"] == 0
+
+
+def test_counts_are_none_without_an_encoding(monkeypatch):
+    monkeypatch.setattr(tokenizer, "get_encoder", lambda model=None: None)
+    assert count_tokens_batch(["a", "b"]) == [None, None]
+    assert count_tokens("a") is None